@@ -0,0 +1,151 @@
+# archive.py
+
+import io
+import os
+import shutil
+import zipfile
+from dataclasses import dataclass
+from typing import BinaryIO, List, Optional, Tuple, Union
+
+from backend.metrics import get_metrics
+from backend.ostdownloader import download_srt_archive, download_srt_files, \
+    ProgressCallback
+from backend.store import SubtitleStore, get_store
+
+COPY_BUFFER_SIZE = 64 * 1024
+
+
+@dataclass
+class ExtractedFile:
+    """A subtitle file extracted from an archive"""
+    member: str
+    path: str
+    size: int
+
+    def to_json(self) -> dict:
+        """JSON representation of the object"""
+        return {"member": self.member, "path": self.path, "size": self.size}
+
+
+def srt_name_for_media(media_name: str, ext: str = '.srt') -> str:
+    """Return the subtitle file path matching the media file `media_name`"""
+    media_wo_ext, _ = os.path.splitext(media_name)
+    return media_wo_ext + ext
+
+
+def _write_atomically(src: BinaryIO, target: str) -> int:
+    """Copy `src` into `target` through a temporary file, return the size"""
+    temp = target + '.part'
+    with open(temp, 'wb') as dst:
+        shutil.copyfileobj(src, dst, COPY_BUFFER_SIZE)
+        size = dst.tell()
+    os.replace(temp, target)
+    return size
+
+
+def extract_srt_members(archive: Union[str, BinaryIO], outfolder: str,
+                        ext: str = '.srt',
+                        rename_as: str = "") -> List[ExtractedFile]:
+    """
+    Stream every `ext` member of `archive` (a path or a file-like object)
+    straight to its final name, without intermediate files to rename.
+
+    :param archive: the zip file, on disk or in memory
+    :param outfolder: where to write the members
+    :param ext: the extension of the members to extract (case-insensitive)
+    :param rename_as: if not empty the fullpath of the referring media file,
+                      the first member is written next to it with the same
+                      name, the others keep their own name in `outfolder`
+    :return: the extracted files
+    """
+    metrics = get_metrics()
+    extracted = []
+    with metrics.timed('extract'), zipfile.ZipFile(archive) as zfh:
+        for info in zfh.infolist():
+            if info.is_dir() or not info.filename.lower().endswith(ext):
+                continue
+            if rename_as and not extracted:
+                target = srt_name_for_media(rename_as, ext)
+            else:
+                # Only the file name, members can't escape `outfolder`
+                target = os.path.join(outfolder,
+                                      os.path.basename(info.filename))
+            with zfh.open(info) as src:
+                size = _write_atomically(src, target)
+            extracted.append(ExtractedFile(member=info.filename,
+                                           path=target, size=size))
+    metrics.inc('extracted_files', len(extracted))
+    metrics.inc('bytes_extracted', sum(item.size for item in extracted))
+    return extracted
+
+
+def fetch_and_extract(url: str, outfolder: str, ext: str = '.srt',
+                      rename_as: str = "",
+                      keep_zip_as: Optional[str] = None,
+                      max_bytes: Optional[int] = None,
+                      progress: Optional[ProgressCallback] = None
+                      ) -> List[ExtractedFile]:
+    """
+    Download the subtitle archive at `url` into memory and extract its
+    members directly to their final names (see `extract_srt_members`).
+
+    :param keep_zip_as: if given, the archive is also saved with this name
+    :param max_bytes: size limit of the in-memory archive, if None the
+                      backend default is used
+    :param progress: download progress callback, see `download_srt_archive`
+    :return: the extracted files
+
+    With the subtitle store enabled (see `backend.store`) the archive is
+    downloaded and extracted only once, the files are placed from the store.
+    """
+    kwargs = {'max_bytes': max_bytes} if max_bytes else {}
+    store = get_store()
+    if store:
+        return _place_from_store(store, url, outfolder, ext, rename_as,
+                                 keep_zip_as, progress, **kwargs)
+    buffer: io.BytesIO = download_srt_archive(url, progress=progress,
+                                              **kwargs)
+    if keep_zip_as:
+        _write_atomically(buffer, keep_zip_as)
+        buffer.seek(0)
+    return extract_srt_members(buffer, outfolder, ext, rename_as)
+
+
+def _place_from_store(store: SubtitleStore, url: str, outfolder: str,
+                      ext: str, rename_as: str, keep_zip_as: Optional[str],
+                      progress: Optional[ProgressCallback],
+                      **kwargs) -> List[ExtractedFile]:
+    """`fetch_and_extract` through the subtitle store, same targets"""
+    archive = store.fetch_archive(url, progress=progress, **kwargs)
+    if keep_zip_as:
+        store.place(archive, keep_zip_as)
+    placed = []
+    for item in store.members(archive, ext):
+        if rename_as and not placed:
+            target = srt_name_for_media(rename_as, ext)
+        else:
+            target = os.path.join(outfolder, os.path.basename(item.member))
+        store.place(item.digest, target)
+        placed.append(ExtractedFile(member=item.member, path=target,
+                                    size=item.size))
+    return placed
+
+
+def fetch_archive_as(url: str, local_filename: str,
+                     progress: Optional[ProgressCallback] = None
+                     ) -> Tuple[str, int]:
+    """
+    Download the subtitle archive at `url` as `local_filename` (.zip added
+    if it has no extension), from the subtitle store if enabled
+    :return: the file name and size
+    """
+    store = get_store()
+    if not store:
+        stats = download_srt_files(url=url, local_filename=local_filename,
+                                   progress=progress)
+        return stats.filename, stats.size
+    if not os.path.splitext(local_filename)[1]:
+        local_filename = f"{local_filename}.zip"
+    archive = store.fetch_archive(url, progress=progress)
+    store.place(archive, local_filename)
+    return local_filename, os.path.getsize(local_filename)
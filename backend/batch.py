@@ -0,0 +1,158 @@
+# batch.py
+
+import asyncio
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, \
+    TimeoutError as FutureTimeoutError
+from dataclasses import dataclass
+from typing import Any, AsyncIterator, Callable, Iterable, Optional, Set
+
+from backend.ostdownloader import search_show, get_subtitles_for_show
+
+DEFAULT_CONCURRENCY = 8
+
+
+@dataclass
+class BatchResult:
+    """Outcome of a single item of a batch, either a value or an error"""
+    item: str
+    value: Any = None
+    error: Optional[Exception] = None
+    elapsed: float = 0.0
+
+    @property
+    def ok(self) -> bool:
+        return self.error is None
+
+    def to_json(self) -> dict:
+        """JSON representation of the object"""
+        retval = {"item": self.item, "elapsed": round(self.elapsed, 3)}
+        if self.error is not None:
+            retval['error'] = str(self.error)
+        else:
+            retval['results'] = [obj.to_json() for obj in self.value]
+        return retval
+
+
+class _ReadError:
+    """An exception raised while iterating the items, raised by `run_many`"""
+
+    def __init__(self, error: Exception):
+        self.error = error
+
+
+_END = object()
+
+
+async def run_many(items: Iterable[str], func: Callable[[str], Any],
+                   concurrency: int = DEFAULT_CONCURRENCY
+                   ) -> AsyncIterator[BatchResult]:
+    """
+    Run `func` on every item in a pool of `concurrency` threads and yield the
+    results as they complete. A failing item is reported in its result and
+    does not stop the others.
+
+    `items` is read lazily by a background thread, at most `concurrency`
+    items ahead of the results, so it can be a stream like stdin. Closing
+    the iterator early stops reading `items` and drops the items not
+    started yet.
+    """
+    loop = asyncio.get_running_loop()
+    executor = ThreadPoolExecutor(max_workers=concurrency)
+    queue: asyncio.Queue = asyncio.Queue(maxsize=concurrency)
+    stop = threading.Event()
+
+    def _put(value: Any) -> None:
+        """Queue `value` from the reader thread, waiting for room"""
+        if stop.is_set():
+            return
+        future = asyncio.run_coroutine_threadsafe(queue.put(value), loop)
+        while not stop.is_set():
+            try:
+                return future.result(timeout=0.1)
+            except FutureTimeoutError:
+                continue
+        future.cancel()
+
+    def _read() -> None:
+        try:
+            for item in items:
+                if stop.is_set():
+                    return
+                _put(item)
+            _put(_END)
+        except Exception as ex:
+            _put(_ReadError(ex))
+
+    async def _run(item: str) -> BatchResult:
+        start = time.perf_counter()
+        try:
+            value = await loop.run_in_executor(executor, func, item)
+            return BatchResult(item=item, value=value,
+                               elapsed=time.perf_counter() - start)
+        except Exception as ex:
+            return BatchResult(item=item, error=ex,
+                               elapsed=time.perf_counter() - start)
+
+    # Daemon: a reader blocked on an endless stream must not hold the exit
+    threading.Thread(target=_read, name='batch-reader', daemon=True).start()
+    running: Set[asyncio.Future] = set()
+    next_item: Optional[asyncio.Future] = None
+    ended = False
+    try:
+        while True:
+            if not ended and next_item is None and \
+                    len(running) < concurrency:
+                next_item = asyncio.ensure_future(queue.get())
+            waiting = running | {next_item} if next_item else running
+            if not waiting:
+                break
+            done, _ = await asyncio.wait(
+                waiting, return_when=asyncio.FIRST_COMPLETED)
+            if next_item in done:
+                item, next_item = next_item.result(), None
+                if item is _END:
+                    ended = True
+                elif isinstance(item, _ReadError):
+                    raise item.error
+                else:
+                    running.add(asyncio.ensure_future(_run(item)))
+            for task in done & running:
+                running.discard(task)
+                yield task.result()
+    finally:
+        stop.set()
+        for task in running | {next_item} if next_item else running:
+            task.cancel()
+        executor.shutdown(wait=False)
+
+
+async def search_many(queries: Iterable[str], root_search: str,
+                      concurrency: int = DEFAULT_CONCURRENCY
+                      ) -> AsyncIterator[BatchResult]:
+    """
+    Search every query of `queries` with `search_show`, at most `concurrency`
+    at a time. Results are yielded in completion order, the value of each
+    one is the list of `SubtitledShow` found.
+
+    The pool size of the shared transport should not be lower than
+    `concurrency`, otherwise connections will be discarded and reopened.
+    """
+    async for result in run_many(
+            queries, lambda query: search_show(query, root_search),
+            concurrency):
+        yield result
+
+
+async def get_subtitles_for_shows(urls: Iterable[str],
+                                  concurrency: int = DEFAULT_CONCURRENCY
+                                  ) -> AsyncIterator[BatchResult]:
+    """
+    Retrieve the subtitle files of every show page in `urls` with
+    `get_subtitles_for_show`, at most `concurrency` at a time. Results are
+    yielded in completion order, the value of each one is the list of
+    `SubtitleSrtFile` found.
+    """
+    async for result in run_many(urls, get_subtitles_for_show, concurrency):
+        yield result
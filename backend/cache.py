@@ -0,0 +1,203 @@
+# cache.py
+
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+from dataclasses import dataclass
+from typing import Dict, List, Optional
+from urllib.parse import urlsplit, urlunsplit, parse_qsl, urlencode
+
+PAGE_SEARCH = 'search'
+PAGE_SHOW = 'show'
+DEFAULT_TTLS = {
+    PAGE_SEARCH: 6 * 60 * 60,
+    PAGE_SHOW: 24 * 60 * 60,
+}
+DEFAULT_MAX_BYTES = 50 * 1024 * 1024
+LANGUAGE_SEGMENT = re.compile(r'sublanguageid-([^/]*)')
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS pages (
+    key TEXT PRIMARY KEY,
+    page_type TEXT NOT NULL,
+    body TEXT NOT NULL,
+    parsed TEXT,
+    etag TEXT,
+    last_modified TEXT,
+    fetched_at REAL NOT NULL,
+    accessed_at REAL NOT NULL,
+    size INTEGER NOT NULL
+)
+"""
+
+
+def normalize_url(url: str) -> str:
+    """
+    Build the cache key for `url`: scheme and host lowercased, query
+    arguments sorted, trailing slash removed and the language set of the
+    `sublanguageid-` segment sorted, so that 'eng,ita' and 'ita,eng' hit the
+    same entry.
+    """
+    parts = urlsplit(url.strip())
+    path = parts.path.rstrip('/')
+
+    def _sort_languages(match: re.Match) -> str:
+        langs = sorted({lng.strip().lower()
+                        for lng in match.group(1).split(',') if lng.strip()})
+        return 'sublanguageid-' + ','.join(langs)
+
+    path = LANGUAGE_SEGMENT.sub(_sort_languages, path)
+    query = urlencode(sorted(parse_qsl(parts.query)))
+    return urlunsplit((parts.scheme.lower(), parts.netloc.lower(),
+                       path, query, ''))
+
+
+@dataclass
+class CacheEntry:
+    """A cached page, with its parsed representation if available"""
+    key: str
+    page_type: str
+    body: str
+    parsed: Optional[List[dict]]
+    etag: Optional[str]
+    last_modified: Optional[str]
+    fetched_at: float
+
+
+class ResponseCache:
+    """
+    Persistent SQLite store for the opensubtitles pages. Entries expire
+    after a TTL that depends on the page type, and the least recently used
+    ones are evicted when the store grows beyond `max_bytes`.
+    """
+
+    def __init__(self, path: str, max_bytes: int = DEFAULT_MAX_BYTES,
+                 ttls: Optional[Dict[str, float]] = None):
+        """
+        :param path: the SQLite database file, created if missing
+        :param max_bytes: size cap of the stored pages
+        :param ttls: seconds an entry is fresh, by page type
+        """
+        self.path = path
+        self.max_bytes = max_bytes
+        self.ttls = dict(DEFAULT_TTLS)
+        if ttls:
+            self.ttls.update(ttls)
+        folder = os.path.dirname(os.path.abspath(path))
+        os.makedirs(folder, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        with self._lock, self._conn:
+            self._conn.execute(_SCHEMA)
+
+    def get(self, url: str) -> Optional[CacheEntry]:
+        """Return the entry for `url`, fresh or not, None if missing"""
+        key = normalize_url(url)
+        with self._lock, self._conn:
+            row = self._conn.execute(
+                "SELECT page_type, body, parsed, etag, last_modified, "
+                "fetched_at FROM pages WHERE key = ?", (key,)).fetchone()
+            if not row:
+                return None
+            self._conn.execute("UPDATE pages SET accessed_at = ? "
+                               "WHERE key = ?", (time.time(), key))
+        page_type, body, parsed, etag, last_modified, fetched_at = row
+        return CacheEntry(key=key, page_type=page_type, body=body,
+                          parsed=json.loads(parsed) if parsed else None,
+                          etag=etag, last_modified=last_modified,
+                          fetched_at=fetched_at)
+
+    def is_fresh(self, entry: CacheEntry) -> bool:
+        """True if `entry` can be used without revalidation"""
+        ttl = self.ttls.get(entry.page_type, 0)
+        return time.time() - entry.fetched_at < ttl
+
+    def store(self, url: str, page_type: str, body: str,
+              etag: Optional[str] = None,
+              last_modified: Optional[str] = None) -> None:
+        """Save a freshly downloaded page, dropping any parsed result"""
+        now = time.time()
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO pages (key, page_type, body, parsed, "
+                "etag, last_modified, fetched_at, accessed_at, size) "
+                "VALUES (?, ?, ?, NULL, ?, ?, ?, ?, ?)",
+                (normalize_url(url), page_type, body, etag, last_modified,
+                 now, now, len(body)))
+            self._evict()
+
+    def store_parsed(self, url: str, parsed: List[dict]) -> None:
+        """Attach the JSON representation of the parsed page to `url`"""
+        data = json.dumps(parsed)
+        with self._lock, self._conn:
+            self._conn.execute(
+                "UPDATE pages SET parsed = ?, size = length(body) + ? "
+                "WHERE key = ?", (data, len(data), normalize_url(url)))
+            self._evict()
+
+    def revalidated(self, url: str) -> None:
+        """The server confirmed that the page did not change (304)"""
+        now = time.time()
+        with self._lock, self._conn:
+            self._conn.execute(
+                "UPDATE pages SET fetched_at = ?, accessed_at = ? "
+                "WHERE key = ?", (now, now, normalize_url(url)))
+
+    def discard(self, url: str) -> None:
+        """Remove the entry for `url`, if any"""
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM pages WHERE key = ?",
+                               (normalize_url(url),))
+
+    def clear(self) -> None:
+        """Remove every entry"""
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM pages")
+
+    def total_size(self) -> int:
+        """Bytes currently used by the stored pages"""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT COALESCE(SUM(size), 0) FROM pages").fetchone()
+        return row[0]
+
+    def _evict(self) -> None:
+        """Drop the least recently used entries until under `max_bytes`"""
+        total = self._conn.execute(
+            "SELECT COALESCE(SUM(size), 0) FROM pages").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        rows = self._conn.execute(
+            "SELECT key, size FROM pages ORDER BY accessed_at").fetchall()
+        for key, size in rows:
+            if total <= self.max_bytes:
+                break
+            self._conn.execute("DELETE FROM pages WHERE key = ?", (key,))
+            total -= size
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+
+_cache: Optional[ResponseCache] = None
+
+
+def get_cache() -> Optional[ResponseCache]:
+    """Return the shared response cache, None if caching is disabled"""
+    return _cache
+
+
+def configure_cache(path: Optional[str], **kwargs) -> Optional[ResponseCache]:
+    """
+    Enable the shared response cache stored in `path` (see `ResponseCache`
+    for `kwargs`), or disable it if `path` is None.
+    """
+    global _cache
+    if _cache is not None:
+        _cache.close()
+    _cache = ResponseCache(path, **kwargs) if path else None
+    return _cache
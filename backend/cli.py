@@ -0,0 +1,209 @@
+# cli.py
+
+"""
+Command line interface of the backend, for scripts and pipelines: every
+result is written to stdout as one JSON object per line (NDJSON) as soon as
+it is available, the progress messages go to stderr.
+
+From the project root:
+python -m backend.cli search "the expanse" --pages 2
+python -m backend.cli list /en/search/sublanguageid-eng/idmovie-123
+python -m backend.cli fetch /en/subtitleserve/sub/456 --folder subs
+ls *.mkv | python -m backend.cli batch --workers 4
+"""
+
+import argparse
+import asyncio
+import contextlib
+import functools
+import json
+import os
+import sys
+import threading
+from configparser import ConfigParser
+from typing import Any, Optional, TextIO
+
+import backend.config as backend_config
+from backend.archive import fetch_and_extract, fetch_archive_as
+from backend.batch import run_many
+from backend.library import MediaResult, process_media_file
+from backend.ostdownloader import SubtitleException, \
+    get_subtitles_for_show, iter_search_pages, search_show
+
+DEFAULT_DOMAIN = 'https://www.opensubtitles.org'
+DEFAULT_SEARCH_URL = DEFAULT_DOMAIN + \
+    '/en/search2/sublanguageid-{}/moviename-'
+DEFAULT_LANGUAGES = 'eng'
+DEFAULT_WORKERS = 4
+
+
+class NdjsonWriter:
+    """Writes one JSON object per line and flushes it, thread safe"""
+
+    def __init__(self, out: TextIO):
+        self._out = out
+        self._lock = threading.Lock()
+
+    def write(self, obj: dict) -> None:
+        line = json.dumps(obj, ensure_ascii=False)
+        with self._lock:
+            self._out.write(line + '\n')
+            self._out.flush()
+
+
+class Context:
+    """Settings of a command, from the config file and the options"""
+
+    def __init__(self, args: argparse.Namespace):
+        ini = ConfigParser()
+        if args.config and not ini.read(args.config):
+            raise EnvironmentError(f"Config file '{args.config}' is missing")
+        backend_config.configure_network(ini)
+        backend_config.configure_cache(ini)
+        backend_config.configure_store(ini)
+        self.domain = ini.get('parser', 'OST_DOMAIN', fallback=DEFAULT_DOMAIN)
+        languages = args.lang or ini.get('gui', 'selected_languages',
+                                         fallback=DEFAULT_LANGUAGES)
+        self.root_search = ini.get(
+            'parser', 'OST_SEARCH_URL',
+            fallback=DEFAULT_SEARCH_URL).format(languages.replace(' ', ''))
+
+    def url(self, href: str) -> str:
+        """Absolute url of `href`, sometimes the domain is already there"""
+        return href if href.startswith('http') else self.domain + href
+
+
+def cmd_search(args: argparse.Namespace, ctx: Context,
+               writer: NdjsonWriter) -> int:
+    """A line per show found, page after page"""
+    pages = iter_search_pages(' '.join(args.terms), ctx.root_search,
+                              max(1, args.pages))
+    for shows in pages:
+        for show in shows:
+            writer.write(show.to_json())
+    return 0
+
+
+def cmd_list(args: argparse.Namespace, ctx: Context,
+             writer: NdjsonWriter) -> int:
+    """A line per subtitle file of the show"""
+    for srt_file in get_subtitles_for_show(ctx.url(args.href)):
+        writer.write(srt_file.to_json())
+    return 0
+
+
+def cmd_fetch(args: argparse.Namespace, ctx: Context,
+              writer: NdjsonWriter) -> int:
+    """A line per file extracted, or for the archive with `--no-extract`"""
+    os.makedirs(args.folder, exist_ok=True)
+    if args.extract:
+        for extracted in fetch_and_extract(ctx.url(args.href), args.folder,
+                                           rename_as=args.rename_as or ""):
+            writer.write(extracted.to_json())
+    else:
+        filename, size = fetch_archive_as(
+            ctx.url(args.href), os.path.join(args.folder, args.output))
+        writer.write({"path": filename, "size": size})
+    return 0
+
+
+def _lookup(item: str, ctx: Context, download: bool) -> Any:
+    """A media file path is looked up and subtitled, else searched"""
+    if os.path.isfile(item):
+        return process_media_file(item, ctx.root_search, ctx.domain,
+                                  download=download)
+    return search_show(item, ctx.root_search)
+
+
+async def _batch(args: argparse.Namespace, ctx: Context,
+                 writer: NdjsonWriter) -> int:
+    """`cmd_batch` on the `run_many` event loop"""
+    failed = 0
+    lines = (item for item in (line.strip() for line in sys.stdin) if item)
+    results = run_many(lines, functools.partial(
+        _lookup, ctx=ctx, download=not args.dry_run), args.workers)
+    try:
+        async for result in results:
+            if isinstance(result.value, MediaResult):
+                retval = result.value.to_json()
+            else:
+                retval = result.to_json()
+            if retval.get('error'):
+                failed += 1
+            # A BrokenPipeError stops reading stdin and the lookups
+            writer.write(retval)
+    finally:
+        await results.aclose()
+    return 1 if failed else 0
+
+
+def cmd_batch(args: argparse.Namespace, ctx: Context,
+              writer: NdjsonWriter) -> int:
+    """
+    A line per stdin line, in completion order: the `MediaResult` of a media
+    file path, else the `BatchResult` of the search of the line
+    """
+    return asyncio.run(_batch(args, ctx, writer))
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(
+        description="Search and download subtitles, results as NDJSON")
+    parser.add_argument('--config', help="the GUI configuration file, "
+                                         "for the site, languages, network, "
+                                         "cache and store settings")
+    parser.add_argument('--lang', help="comma separated languages, default "
+                                       "is 'selected_languages' or eng")
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    search = commands.add_parser('search', help="search shows")
+    search.add_argument('terms', nargs='+')
+    search.add_argument('--pages', type=int, default=1,
+                        help="result pages to follow, %(default)s")
+    search.set_defaults(func=cmd_search)
+
+    listing = commands.add_parser('list', help="subtitle files of a show")
+    listing.add_argument('href', help="show href (or url)")
+    listing.set_defaults(func=cmd_list)
+
+    fetch = commands.add_parser('fetch', help="download a subtitle file")
+    fetch.add_argument('href', help="subtitle file href (or url)")
+    fetch.add_argument('--folder', default='.')
+    fetch.add_argument('--no-extract', dest='extract', action='store_false',
+                       help="keep the archive as it is")
+    fetch.add_argument('--output', default='subtitles.zip',
+                       help="archive name with --no-extract")
+    fetch.add_argument('--rename-as', help="media file: the first subtitle "
+                                           "file gets its name")
+    fetch.set_defaults(func=cmd_fetch)
+
+    batch = commands.add_parser(
+        'batch', help="a title or media file path per stdin line")
+    batch.add_argument('--workers', type=int, default=DEFAULT_WORKERS)
+    batch.add_argument('--dry-run', action='store_true',
+                       help="look up the media files without downloading")
+    batch.set_defaults(func=cmd_batch)
+    return parser
+
+
+def main(argv: Optional[list] = None) -> int:
+    args = build_parser().parse_args(argv)
+    # The backend prints its progress: stdout is kept for the results
+    stdout = sys.stdout
+    writer = NdjsonWriter(stdout)
+    with contextlib.redirect_stdout(sys.stderr):
+        try:
+            return args.func(args, Context(args), writer)
+        except BrokenPipeError:  # Piped into head & co, that had enough
+            # The results stream, not the redirected stdout (stderr), is
+            # silenced: the flush at exit would fail again
+            os.dup2(os.open(os.devnull, os.O_WRONLY), stdout.fileno())
+            print("Output closed, stopped", file=sys.stderr)
+            return 1
+        except (SubtitleException, ValueError, EnvironmentError) as ex:
+            print(f"Error: {ex}", file=sys.stderr)
+            return 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
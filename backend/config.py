@@ -0,0 +1,64 @@
+# config.py
+
+import os
+from configparser import ConfigParser
+
+import backend.cache as cache
+import backend.store as store
+import backend.transport as transport
+
+
+def configure_network(ini: ConfigParser) -> None:
+    """Set up the shared HTTP transport from the optional `network` section"""
+    if 'network' not in ini.sections():
+        return
+    transport.configure_transport(
+        pool_size=ini.getint('network', 'pool_size',
+                             fallback=transport.DEFAULT_POOL_SIZE),
+        connect_timeout=ini.getfloat(
+            'network', 'connect_timeout',
+            fallback=transport.DEFAULT_CONNECT_TIMEOUT),
+        read_timeout=ini.getfloat('network', 'read_timeout',
+                                  fallback=transport.DEFAULT_READ_TIMEOUT),
+        retries=ini.getint('network', 'retries',
+                           fallback=transport.DEFAULT_RETRIES),
+        backoff_factor=ini.getfloat('network', 'backoff_factor',
+                                    fallback=transport.DEFAULT_BACKOFF_FACTOR),
+        rate=ini.getfloat('network', 'rate_limit',
+                          fallback=transport.DEFAULT_RATE),
+        burst=ini.getint('network', 'rate_burst',
+                         fallback=transport.DEFAULT_BURST),
+        max_retry_after=ini.getfloat(
+            'network', 'max_retry_after',
+            fallback=transport.DEFAULT_MAX_RETRY_AFTER),
+    )
+
+
+def configure_cache(ini: ConfigParser) -> None:
+    """Enable the persistent response cache from the optional `cache` section"""
+    if not ini.getboolean('cache', 'enabled', fallback=False):
+        return
+    cache.configure_cache(
+        os.path.abspath(ini.get('cache', 'path', fallback='ostcache.sqlite')),
+        max_bytes=ini.getint('cache', 'max_mb', fallback=50) * 1024 * 1024,
+        ttls={
+            cache.PAGE_SEARCH: ini.getint(
+                'cache', 'search_ttl',
+                fallback=cache.DEFAULT_TTLS[cache.PAGE_SEARCH]),
+            cache.PAGE_SHOW: ini.getint(
+                'cache', 'show_ttl',
+                fallback=cache.DEFAULT_TTLS[cache.PAGE_SHOW]),
+        }
+    )
+
+
+def configure_store(ini: ConfigParser) -> None:
+    """Enable the subtitle store from the optional `store` section"""
+    if not ini.getboolean('store', 'enabled', fallback=False):
+        return
+    store.configure_store(
+        os.path.abspath(ini.get('store', 'path', fallback='oststore')),
+        max_bytes=ini.getint('store', 'max_mb',
+                             fallback=store.DEFAULT_MAX_BYTES // 1024 // 1024)
+        * 1024 * 1024,
+        writable=ini.getboolean('store', 'writable', fallback=False))
@@ -0,0 +1,144 @@
+# jobs.py
+
+import os
+import shutil
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional
+
+from backend.archive import fetch_and_extract, fetch_archive_as
+from backend.metrics import get_metrics
+
+DEFAULT_JOB_WORKERS = 4
+DEFAULT_JOB_TTL = 3600  # seconds a finished job and its files are kept
+JOB_QUEUED = 'queued'
+JOB_RUNNING = 'running'
+JOB_DONE = 'done'
+JOB_FAILED = 'failed'
+ARCHIVE_NAME = 'subtitles.zip'
+
+
+@dataclass
+class DownloadJob:
+    """A subtitle download run in background, identified by `job_id`"""
+    job_id: str
+    url: str
+    folder: str
+    extract: bool = True
+    status: str = JOB_QUEUED
+    created: float = field(default_factory=time.time)
+    started: float = 0.0
+    finished: float = 0.0
+    files: List[str] = field(default_factory=list)
+    size: int = 0
+    error: str = ""
+
+    @property
+    def done(self) -> bool:
+        return self.status in (JOB_DONE, JOB_FAILED)
+
+    def to_json(self) -> dict:
+        """JSON representation of the object"""
+        retval = {"job_id": self.job_id, "url": self.url,
+                  "extract": self.extract, "status": self.status,
+                  "created": self.created, "files": self.files,
+                  "size": self.size}
+        if self.started:
+            retval['wait'] = round(self.started - self.created, 3)
+        if self.finished:
+            retval['elapsed'] = round(self.finished - self.started, 3)
+        if self.error:
+            retval['error'] = self.error
+        return retval
+
+
+class DownloadJobs:
+    """
+    Queue of subtitle downloads run on a pool of worker threads, each one in
+    its own folder under `folder`. Finished jobs are forgotten, and their
+    files deleted, `ttl` seconds after their completion.
+    """
+
+    def __init__(self, folder: str, workers: int = DEFAULT_JOB_WORKERS,
+                 ttl: int = DEFAULT_JOB_TTL):
+        self.folder = folder
+        self.ttl = ttl
+        self._executor = ThreadPoolExecutor(max_workers=workers,
+                                            thread_name_prefix='download')
+        self._lock = threading.Lock()
+        self._jobs: Dict[str, DownloadJob] = {}
+        os.makedirs(folder, exist_ok=True)
+
+    def submit(self, url: str, extract: bool = True) -> DownloadJob:
+        """Queue the download of the archive at `url`"""
+        self._prune()
+        job_id = uuid.uuid4().hex
+        job = DownloadJob(job_id=job_id, url=url, extract=extract,
+                          folder=os.path.join(self.folder, job_id))
+        with self._lock:
+            self._jobs[job_id] = job
+        get_metrics().inc('jobs', status=JOB_QUEUED)
+        self._executor.submit(self._run, job)
+        return job
+
+    def get(self, job_id: str) -> Optional[DownloadJob]:
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def _run(self, job: DownloadJob) -> None:
+        metrics = get_metrics()
+        job.started = time.time()
+        job.status = JOB_RUNNING
+        metrics.observe('job_wait_seconds', job.started - job.created)
+        try:
+            os.makedirs(job.folder, exist_ok=True)
+            if job.extract:
+                extracted = fetch_and_extract(job.url, job.folder)
+                job.files = [os.path.basename(srt.path) for srt in extracted]
+                job.size = sum(srt.size for srt in extracted)
+            else:
+                _, job.size = fetch_archive_as(
+                    job.url, os.path.join(job.folder, ARCHIVE_NAME))
+                job.files = [ARCHIVE_NAME]
+            job.status = JOB_DONE
+        except Exception as ex:
+            job.error = str(ex)
+            job.status = JOB_FAILED
+        job.finished = time.time()
+        metrics.inc('jobs', status=job.status)
+        metrics.observe('job_seconds', job.finished - job.started)
+
+    def _prune(self) -> None:
+        """Forget the jobs finished more than `ttl` seconds ago"""
+        expired = time.time() - self.ttl
+        with self._lock:
+            stale = [job for job in self._jobs.values()
+                     if job.done and job.finished < expired]
+            for job in stale:
+                del self._jobs[job.job_id]
+        for job in stale:
+            shutil.rmtree(job.folder, ignore_errors=True)
+
+    def stats(self) -> dict:
+        """Number of jobs by status, and their average wait and run time"""
+        with self._lock:
+            jobs = list(self._jobs.values())
+        finished = [job for job in jobs if job.done]
+        retval = {status: 0 for status in
+                  (JOB_QUEUED, JOB_RUNNING, JOB_DONE, JOB_FAILED)}
+        for job in jobs:
+            retval[job.status] += 1
+        if finished:
+            retval['avg_wait'] = round(sum(
+                job.started - job.created for job in finished) /
+                len(finished), 3)
+            retval['avg_elapsed'] = round(sum(
+                job.finished - job.started for job in finished) /
+                len(finished), 3)
+        return retval
+
+    def shutdown(self) -> None:
+        self._executor.shutdown(wait=False)
@@ -0,0 +1,237 @@
+# libindex.py
+
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+DEFAULT_RETRY_INTERVAL = 24 * 3600  # seconds before a failed lookup is retried
+STATUS_FAILED = 'failed'
+STATUS_NO_RESULT = 'no_result'
+_LANGUAGE_RE = re.compile(r'[a-z]{2,3}(-[a-z]{2})?')  # en, eng, pt-br
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS dirs (
+    path TEXT PRIMARY KEY,
+    parent TEXT,
+    mtime_ns INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS dirs_parent ON dirs (parent);
+CREATE TABLE IF NOT EXISTS media (
+    path TEXT PRIMARY KEY,
+    folder TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    hash TEXT,
+    srt_files TEXT NOT NULL DEFAULT '[]',
+    languages TEXT NOT NULL DEFAULT '[]',
+    status TEXT,
+    attempted_at REAL,
+    attempted_size INTEGER,
+    attempted_mtime_ns INTEGER
+);
+CREATE INDEX IF NOT EXISTS media_folder ON media (folder);
+"""
+
+
+def is_srt_of(srt_name: str, media_path: str) -> bool:
+    """
+    True if `srt_name` is the subtitle file of `media_path`: same name, or
+    same name and a language (Movie.srt, Movie.en.srt for Movie.mkv, not
+    Movie.2.srt)
+    """
+    stem = os.path.splitext(os.path.basename(media_path))[0].lower()
+    srt_stem = os.path.splitext(srt_name)[0].lower()
+    if srt_stem == stem:
+        return True
+    base, _, lang = srt_stem.rpartition('.')
+    return base == stem and bool(_LANGUAGE_RE.fullmatch(lang))
+
+
+class LibraryIndex:
+    """
+    Persistent SQLite index of a media library: for every media file it
+    records size, mtime, movie hash, the .srt files next to it, the
+    languages already fetched and the outcome of the last failed lookup.
+
+    A rescan lists only the folders whose mtime changed since the last scan,
+    the other ones are taken from the index. Adding, removing or renaming
+    a file changes the mtime of its folder, rewriting a file in place does
+    not, use `full=True` to catch those.
+    """
+
+    def __init__(self, path: str):
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        with self._lock, self._conn:
+            self._conn.executescript(_SCHEMA)
+
+    def scan(self, root: str, extensions: Tuple[str, ...],
+             full: bool = False) -> int:
+        """
+        Bring the index up to date with the folder tree under `root`
+        :param extensions: the extensions of the media files
+        :param full: list every folder, changed or not
+        :return: number of folders listed
+        """
+        root = os.path.abspath(root)
+        listed = 0
+        folders = [(root, None)]
+        while folders:
+            folder, parent = folders.pop()
+            try:
+                mtime_ns = os.stat(folder).st_mtime_ns
+            except OSError:
+                self._forget_folder(folder)
+                continue
+            with self._lock:
+                row = self._conn.execute(
+                    "SELECT mtime_ns FROM dirs WHERE path = ?",
+                    (folder,)).fetchone()
+            if not full and row and row[0] == mtime_ns:
+                folders.extend((sub, folder) for sub in self._subdirs(folder))
+                continue
+            listed += 1
+            subdirs = self._index_folder(folder, parent, mtime_ns, extensions)
+            folders.extend((sub, folder) for sub in subdirs)
+        return listed
+
+    def _subdirs(self, folder: str) -> List[str]:
+        with self._lock:
+            return [row[0] for row in self._conn.execute(
+                "SELECT path FROM dirs WHERE parent = ?", (folder,))]
+
+    def _index_folder(self, folder: str, parent: str, mtime_ns: int,
+                      extensions: Tuple[str, ...]) -> List[str]:
+        """List `folder`, update its media and return its subfolders"""
+        subdirs = []
+        media: Dict[str, os.stat_result] = {}
+        srt_names: List[str] = []
+        try:
+            entries = list(os.scandir(folder))
+        except OSError as ex:
+            print(f"Unable to scan {folder}: {ex}")
+            return subdirs
+        for entry in entries:
+            name = entry.name.lower()
+            if entry.is_dir(follow_symlinks=False):
+                subdirs.append(entry.path)
+            elif name.endswith(extensions):
+                media[entry.path] = entry.stat()
+            elif name.endswith('.srt'):
+                srt_names.append(entry.name)
+        with self._lock, self._conn:
+            known = {path: (size, mtime, srt, langs)
+                     for path, size, mtime, srt, langs in self._conn.execute(
+                         "SELECT path, size, mtime_ns, srt_files, languages "
+                         "FROM media WHERE folder = ?", (folder,))}
+            for path in set(known) - set(media):
+                self._conn.execute("DELETE FROM media WHERE path = ?", (path,))
+            for path, st in media.items():
+                srt_files = sorted(srt for srt in srt_names
+                                   if is_srt_of(srt, path))
+                old = known.get(path)
+                if old and old[0] == st.st_size and old[1] == st.st_mtime_ns:
+                    self._conn.execute(
+                        "UPDATE media SET srt_files = ? WHERE path = ?",
+                        (json.dumps(srt_files), path))
+                else:  # New or changed media, the hash must be recomputed
+                    self._conn.execute(
+                        "INSERT OR REPLACE INTO media (path, folder, size, "
+                        "mtime_ns, hash, srt_files, languages) "
+                        "VALUES (?, ?, ?, ?, NULL, ?, '[]')",
+                        (path, folder, st.st_size, st.st_mtime_ns,
+                         json.dumps(srt_files)))
+            known_subdirs = {row[0] for row in self._conn.execute(
+                "SELECT path FROM dirs WHERE parent = ?", (folder,))}
+            self._conn.execute(
+                "INSERT OR REPLACE INTO dirs (path, parent, mtime_ns) "
+                "VALUES (?, ?, ?)", (folder, parent, mtime_ns))
+        for removed in known_subdirs - set(subdirs):
+            self._forget_folder(removed)
+        return subdirs
+
+    def _forget_folder(self, folder: str) -> None:
+        """Remove `folder` and everything under it from the index"""
+        prefix = folder.rstrip(os.sep) + os.sep
+        with self._lock, self._conn:
+            self._conn.execute(
+                "DELETE FROM dirs WHERE path = ? OR substr(path, 1, ?) = ?",
+                (folder, len(prefix), prefix))
+            self._conn.execute(
+                "DELETE FROM media WHERE substr(path, 1, ?) = ?",
+                (len(prefix), prefix))
+
+    def pending(self, languages: Iterable[str],
+                retry_interval: float = DEFAULT_RETRY_INTERVAL,
+                now: Optional[float] = None) -> List[str]:
+        """
+        Media files needing a lookup: no .srt file next to them and no
+        subtitles fetched yet in any of `languages`. A file whose last
+        lookup failed or found nothing is skipped until it changes or
+        `retry_interval` seconds have passed.
+        """
+        wanted: Set[str] = {lng.strip().lower() for lng in languages}
+        retry_before = (time.time() if now is None else now) - retry_interval
+        retval = []
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT path, languages, size, mtime_ns, status, "
+                "attempted_at, attempted_size, attempted_mtime_ns "
+                "FROM media WHERE srt_files = '[]' ORDER BY path").fetchall()
+        for path, fetched, size, mtime_ns, status, attempted_at, \
+                attempted_size, attempted_mtime_ns in rows:
+            if wanted & set(json.loads(fetched)):
+                continue
+            if status and attempted_at > retry_before and \
+                    (attempted_size, attempted_mtime_ns) == (size, mtime_ns):
+                continue
+            retval.append(path)
+        return retval
+
+    def record_failure(self, path: str, status: str = STATUS_FAILED,
+                       now: Optional[float] = None) -> None:
+        """
+        Save a lookup of `path` that failed (`STATUS_FAILED`) or found no
+        subtitles (`STATUS_NO_RESULT`), see `pending`
+        """
+        with self._lock, self._conn:
+            self._conn.execute(
+                "UPDATE media SET status = ?, attempted_at = ?, "
+                "attempted_size = size, attempted_mtime_ns = mtime_ns "
+                "WHERE path = ?",
+                (status, time.time() if now is None else now, path))
+
+    def record_fetch(self, path: str, movie_hash: str,
+                     languages: Iterable[str], srt_files: Iterable[str]):
+        """Save the outcome of a successful lookup for `path`"""
+        with self._lock, self._conn:
+            row = self._conn.execute(
+                "SELECT srt_files, languages FROM media WHERE path = ?",
+                (path,)).fetchone()
+            if not row:
+                return
+            srts = set(json.loads(row[0])) | \
+                {os.path.basename(srt) for srt in srt_files}
+            langs = set(json.loads(row[1])) | \
+                {lng.strip().lower() for lng in languages}
+            self._conn.execute(
+                "UPDATE media SET hash = ?, srt_files = ?, languages = ?, "
+                "status = NULL, attempted_at = NULL WHERE path = ?",
+                (movie_hash or None, json.dumps(sorted(srts)),
+                 json.dumps(sorted(langs)), path))
+
+    def stats(self) -> Dict[str, int]:
+        """Number of folders and media files in the index"""
+        with self._lock:
+            dirs = self._conn.execute("SELECT COUNT(*) FROM dirs").fetchone()
+            media = self._conn.execute(
+                "SELECT COUNT(*) FROM media").fetchone()
+        return {"folders": dirs[0], "media": media[0]}
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
@@ -0,0 +1,397 @@
+# library.py
+
+import argparse
+import mmap
+import os
+import sqlite3
+import struct
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from configparser import ConfigParser
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+import backend.config as backend_config
+from backend.archive import fetch_and_extract
+from backend.libindex import DEFAULT_RETRY_INTERVAL, LibraryIndex, \
+    STATUS_FAILED, STATUS_NO_RESULT
+from backend.matching import AUTO_SELECT_THRESHOLD, best_match, \
+    parse_media_filename, rank_shows, rank_srt_files
+from backend.metrics import get_metrics, ProfileSession
+from backend.ostdownloader import search_show, search_show_by_hash, \
+    get_subtitles_for_show, SubtitledShow, SubtitleException, \
+    SubtitleSrtFile
+from backend.transport import configure_transport
+
+MEDIA_EXTENSIONS = ('.mkv', '.mp4', '.avi', '.mpg', '.wav')
+HASH_CHUNK_SIZE = 64 * 1024
+DEFAULT_WORKERS = 8
+
+
+def compute_movie_hash(path: str) -> Tuple[str, int]:
+    """
+    Return the OpenSubtitles hash of the media file `path` and its size.
+
+    The hash is the file size plus the sum of the first and the last 64 KiB
+    read as little-endian 64 bit integers, modulo 2**64. The file is mapped
+    in memory so only those two blocks are read from the disk.
+    """
+    size = os.path.getsize(path)
+    if size == 0:
+        raise ValueError(f"Empty file: {path}")
+    with open(path, 'rb') as fh, \
+            mmap.mmap(fh.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        chunk = min(HASH_CHUNK_SIZE, size) // 8 * 8
+        words = chunk // 8
+        value = size
+        value += sum(struct.unpack_from(f'<{words}Q', mm, 0))
+        value += sum(struct.unpack_from(f'<{words}Q', mm, size - chunk))
+    return f"{value & 0xFFFFFFFFFFFFFFFF:016x}", size
+
+
+class HashCache:
+    """
+    SQLite store of the movie hashes already computed, an entry is valid
+    as long as inode, size and modification time of the file don't change
+    """
+
+    def __init__(self, path: str):
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        with self._lock, self._conn:
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS hashes ("
+                "dev INTEGER, inode INTEGER, size INTEGER, mtime_ns INTEGER, "
+                "hash TEXT NOT NULL, PRIMARY KEY (dev, inode, size, mtime_ns))")
+
+    def get(self, st: os.stat_result) -> Optional[str]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT hash FROM hashes WHERE dev = ? AND inode = ? "
+                "AND size = ? AND mtime_ns = ?",
+                (st.st_dev, st.st_ino, st.st_size, st.st_mtime_ns)).fetchone()
+        return row[0] if row else None
+
+    def put(self, st: os.stat_result, movie_hash: str) -> None:
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO hashes VALUES (?, ?, ?, ?, ?)",
+                (st.st_dev, st.st_ino, st.st_size, st.st_mtime_ns,
+                 movie_hash))
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+
+class StageTimer:
+    """Thread safe accumulator of the time spent in each processing stage"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.counts: Dict[str, int] = {}
+        self.totals: Dict[str, float] = {}
+
+    @contextmanager
+    def stage(self, name: str):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            with self._lock:
+                self.counts[name] = self.counts.get(name, 0) + 1
+                self.totals[name] = self.totals.get(name, 0.0) + elapsed
+
+    def summary(self, wall_time: float) -> str:
+        """Text table with count, time and throughput of every stage"""
+        lines = [f"{'stage':<10}{'count':>8}{'total s':>10}"
+                 f"{'avg ms':>10}{'items/s':>10}"]
+        for name, count in self.counts.items():
+            total = self.totals[name]
+            lines.append(
+                f"{name:<10}{count:>8}{total:>10.2f}"
+                f"{total / count * 1000:>10.1f}"
+                f"{count / wall_time if wall_time else 0:>10.1f}")
+        return '\n'.join(lines)
+
+
+@dataclass
+class MediaResult:
+    """Outcome of the subtitles lookup for a media file"""
+    path: str
+    movie_hash: str = ""
+    matched_by: str = ""
+    show: Optional[SubtitledShow] = None
+    srt_file: Optional[SubtitleSrtFile] = None
+    extracted: List[str] = field(default_factory=list)
+    error: str = ""
+    not_found: bool = False  # the error is the lack of shows or subtitles
+
+    def to_json(self) -> dict:
+        """JSON representation of the object"""
+        return {"path": self.path, "hash": self.movie_hash,
+                "matched_by": self.matched_by,
+                "show": self.show.to_json() if self.show else None,
+                "srtfile": self.srt_file.to_json() if self.srt_file else None,
+                "extracted": self.extracted, "error": self.error,
+                "not_found": self.not_found}
+
+
+def scan_media(root: str,
+               extensions: Tuple[str, ...] = MEDIA_EXTENSIONS
+               ) -> Iterator[str]:
+    """Yield the path of every media file under `root`"""
+    folders = [root]
+    while folders:
+        folder = folders.pop()
+        try:
+            entries = list(os.scandir(folder))
+        except OSError as ex:
+            print(f"Unable to scan {folder}: {ex}")
+            continue
+        for entry in entries:
+            if entry.is_dir(follow_symlinks=False):
+                folders.append(entry.path)
+            elif entry.name.lower().endswith(extensions):
+                yield entry.path
+
+
+def search_terms_from_filename(path: str) -> str:
+    """Turn a media filename into search terms: title and SxxExx"""
+    terms = parse_media_filename(path).search_terms
+    if terms:
+        return terms
+    name, _ = os.path.splitext(os.path.basename(path))
+    return ' '.join(name.replace('.', ' ').replace('_', ' ').split())
+
+
+def get_movie_hash(path: str, hash_cache: Optional[HashCache]) -> str:
+    """Return the movie hash of `path`, computing it only if not cached"""
+    st = os.stat(path)
+    movie_hash = hash_cache.get(st) if hash_cache else None
+    if not movie_hash:
+        movie_hash, _ = compute_movie_hash(path)
+        if hash_cache:
+            hash_cache.put(st, movie_hash)
+    return movie_hash
+
+
+def srt_file_url(srt_file: SubtitleSrtFile, domain: str) -> str:
+    """Absolute url of `srt_file`, sometimes the domain is already there"""
+    if srt_file.href.startswith('http'):
+        return srt_file.href
+    return srt_file.get_url(domain)
+
+
+class Lookups:
+    """The backend calls of `process_media_file` that can be shared"""
+
+    def search_show(self, search_terms: str,
+                    root_search: str) -> List[SubtitledShow]:
+        return search_show(search_terms, root_search)
+
+    def get_subtitles_for_show(self, url: str) -> List[SubtitleSrtFile]:
+        return get_subtitles_for_show(url)
+
+
+def process_media_file(path: str, root_search: str, domain: str,
+                       hash_cache: Optional[HashCache] = None,
+                       timer: Optional[StageTimer] = None,
+                       download: bool = True,
+                       lookups: Optional[Lookups] = None) -> MediaResult:
+    """
+    Find and download the subtitles for the media file `path`: shows are
+    searched by movie hash first, by filename if there is no exact match.
+    Shows and subtitle files are ranked against the file name, a show found
+    by name is only taken above `AUTO_SELECT_THRESHOLD`.
+    The subtitle file is extracted next to the media, with the same name.
+    :param lookups: the name searches and show listings, to share them
+                    between media files, default `Lookups()`
+    """
+    timer = timer or StageTimer()
+    lookups = lookups or Lookups()
+    result = MediaResult(path=path)
+    media = parse_media_filename(path)
+    try:
+        with timer.stage('hash'):
+            result.movie_hash = get_movie_hash(path, hash_cache)
+        with timer.stage('search'):
+            try:
+                shows = search_show_by_hash(
+                    result.movie_hash, os.path.getsize(path), root_search)
+                result.matched_by = 'hash'
+            except ValueError:  # No results table, no exact match
+                shows = []
+            except SubtitleException as ex:  # The name search may work
+                print(f"Search by hash failed: {ex}")
+                shows = []
+            if not shows:
+                shows = lookups.search_show(search_terms_from_filename(path),
+                                            root_search)
+                result.matched_by = 'name'
+        if not shows:
+            result.error = "No show found"
+            result.not_found = True
+            return result
+        ranked = rank_shows(media, shows)
+        # Shows found by hash are exact matches, whatever their name
+        match = ranked[0] if result.matched_by == 'hash' \
+            else best_match(ranked)
+        if not match:
+            result.error = f"No show matching '{media.search_terms}' " \
+                           f"above {AUTO_SELECT_THRESHOLD}, best is " \
+                           f"'{ranked[0].item}' ({ranked[0].score:.2f})"
+            result.not_found = True
+            return result
+        result.show = match.item
+        with timer.stage('list'):
+            srt_files = lookups.get_subtitles_for_show(
+                result.show.get_url(domain))
+        srt_files = [srt for srt in srt_files if srt.href]
+        if not srt_files:
+            result.error = "No subtitles found"
+            result.not_found = True
+            return result
+        result.srt_file = rank_srt_files(media, srt_files)[0].item
+        if download:
+            with timer.stage('download'):
+                extracted = fetch_and_extract(
+                    srt_file_url(result.srt_file, domain),
+                    os.path.dirname(path), rename_as=path)
+            result.extracted = [srt.path for srt in extracted]
+    except Exception as ex:
+        result.error = str(ex)
+    return result
+
+
+def process_media_files(paths: Iterable[str], root_search: str, domain: str,
+                        workers: int = DEFAULT_WORKERS,
+                        hash_cache: Optional[HashCache] = None,
+                        download: bool = True,
+                        lookups: Optional[Lookups] = None
+                        ) -> Iterator[MediaResult]:
+    """
+    Process every media file of `paths` on a pool of `workers` threads,
+    yield the results as they complete and print the stages summary at the
+    end
+    """
+    timer = StageTimer()
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = [executor.submit(process_media_file, path, root_search,
+                                   domain, hash_cache, timer, download,
+                                   lookups)
+                   for path in paths]
+        for future in as_completed(futures):
+            yield future.result()
+    print(timer.summary(time.perf_counter() - start))
+
+
+def process_library(root: str, root_search: str, domain: str,
+                    workers: int = DEFAULT_WORKERS,
+                    hash_cache: Optional[HashCache] = None,
+                    download: bool = True) -> Iterator[MediaResult]:
+    """Process every media file under `root`, see `process_media_files`"""
+    return process_media_files(scan_media(root), root_search, domain,
+                               workers, hash_cache, download)
+
+
+def load_config(filename: str) -> ConfigParser:
+    """
+    Read the GUI config file and set up network, cache and store from it
+    """
+    ini = ConfigParser()
+    if not ini.read(filename):
+        raise EnvironmentError(f"Config file '{filename}' is missing")
+    backend_config.configure_network(ini)
+    backend_config.configure_cache(ini)
+    backend_config.configure_store(ini)
+    return ini
+
+
+def read_config(ini: ConfigParser) -> Tuple[str, List[str], str, str]:
+    """
+    Return media folder, selected languages, search url and domain from the
+    GUI config file
+    """
+    languages = [lng.strip().lower() for lng in
+                 ini.get('gui', 'selected_languages').split(',')]
+    return (ini.get('paths', 'default_media_folder'), languages,
+            ini.get('parser', 'OST_SEARCH_URL').format(','.join(languages)),
+            ini.get('parser', 'OST_DOMAIN'))
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Download the subtitles of every media file in a folder")
+    parser.add_argument('--config', default='config.ini',
+                        help="the GUI configuration file")
+    parser.add_argument('--root', help="media folder, default is the "
+                                       "'default_media_folder' option")
+    parser.add_argument('--workers', type=int, default=DEFAULT_WORKERS)
+    parser.add_argument('--hash-cache', default='moviehashes.sqlite')
+    parser.add_argument('--index', default='library.sqlite',
+                        help="library index, media already subtitled are "
+                             "skipped")
+    parser.add_argument('--retry-hours', type=float,
+                        default=DEFAULT_RETRY_INTERVAL / 3600,
+                        help="hours before a failed lookup of an unchanged "
+                             "media file is retried, %(default)s")
+    parser.add_argument('--full', action='store_true',
+                        help="list every folder, not only the changed ones")
+    parser.add_argument('--dry-run', action='store_true',
+                        help="search the subtitles without downloading them")
+    parser.add_argument('--metrics',
+                        help="write the fetch/parse/download/extract "
+                             "metrics to this file, Prometheus text format "
+                             "if it ends with .prom else JSON")
+    parser.add_argument('--profile',
+                        help="profile the run with cProfile and tracemalloc "
+                             "and write the reports to this folder")
+    args = parser.parse_args()
+    profile = ProfileSession(args.profile) if args.profile else None
+    if profile:
+        profile.start()
+    ini = load_config(args.config)
+    if 'network' not in ini.sections():  # A connection per worker
+        configure_transport(pool_size=args.workers)
+    media_folder, languages, root_search, domain = read_config(ini)
+    hash_cache = HashCache(args.hash_cache)
+    index = LibraryIndex(args.index)
+    start = time.perf_counter()
+    listed = index.scan(args.root or media_folder, MEDIA_EXTENSIONS,
+                        full=args.full)
+    pending = index.pending(languages, args.retry_hours * 3600)
+    print(f"Index updated in {time.perf_counter() - start:.2f}s, "
+          f"{listed} folders listed, {index.stats()['media']} media files, "
+          f"{len(pending)} to look up")
+    found = failed = 0
+    for result in process_media_files(pending, root_search, domain,
+                                      args.workers, hash_cache,
+                                      download=not args.dry_run):
+        if result.error:
+            failed += 1
+            print(f"FAILED {result.path}: {result.error}")
+            index.record_failure(result.path, STATUS_NO_RESULT
+                                 if result.not_found else STATUS_FAILED)
+            continue
+        found += 1
+        print(f"OK ({result.matched_by}) {result.path}: "
+              f"{result.srt_file.name}")
+        if result.extracted:
+            index.record_fetch(result.path, result.movie_hash, languages,
+                               result.extracted)
+    print(f"{found} media files subtitled, {failed} failed")
+    index.close()
+    hash_cache.close()
+    if profile:
+        profile.stop()
+    if args.metrics:
+        get_metrics().export(args.metrics)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,281 @@
+# matching.py
+
+import os
+import re
+import threading
+from collections import OrderedDict, defaultdict
+from dataclasses import dataclass, field
+from typing import Callable, Dict, Generic, List, Optional, Set, Tuple, \
+    TypeVar
+
+from backend.ostdownloader import SubtitledShow, SubtitleSrtFile
+
+AUTO_SELECT_THRESHOLD = 0.6
+# S01E02, s01.e02, 1x02: season in groups 1 or 3, episode in 2 or 4
+EPISODE_RE = re.compile(r'(?<![a-z\d])s(\d{1,2})[ ._-]?e(\d{1,3})(?!\d)'
+                        r'|(?<![a-z\d])(\d{1,2})x(\d{2,3})(?!\d)',
+                        re.IGNORECASE)
+YEAR_RE = re.compile(r'\b(19\d\d|20\d\d)\b')
+# Release tags: nothing after the first of them is part of the title
+RELEASE_TAGS = frozenset((
+    '480p', '576p', '720p', '1080p', '1080i', '2160p', '4k', 'uhd', 'hdr',
+    'bluray', 'bdrip', 'brrip', 'dvdrip', 'dvdscr', 'hdrip', 'hdtv', 'pdtv',
+    'webrip', 'web', 'webdl', 'amzn', 'nf', 'x264', 'x265', 'h264', 'h265',
+    'hevc', 'xvid', 'divx', 'aac', 'ac3', 'dts', 'proper', 'repack',
+    'extended', 'unrated', 'internal', 'limited', 'remastered', 'multi',
+))
+QUALITY_TAGS = frozenset(('480p', '720p', '1080p', '2160p', 'bluray',
+                          'bdrip', 'brrip', 'dvdrip', 'hdtv', 'webrip',
+                          'web', 'webdl'))
+YEAR_BONUS = 0.1
+YEAR_PENALTY = 0.3
+EPISODE_BONUS = 0.2
+EPISODE_PENALTY = 0.5
+GROUP_BONUS = 0.2
+QUALITY_BONUS = 0.05
+INDEX_CACHE_SIZE = 32  # result lists whose index is kept
+
+T = TypeVar('T')
+
+# Shared indexes of the last result lists, see `get_index`
+_indexes: "OrderedDict[tuple, TokenIndex]" = OrderedDict()
+_indexes_lock = threading.Lock()
+
+
+def normalize(text: str) -> str:
+    """Lowercase words of `text`, separated by a single space"""
+    return ' '.join(re.sub(r'[^0-9a-z]+', ' ',
+                           text.lower().replace("'", '')).split())
+
+
+def trigrams(text: str) -> Set[str]:
+    """Character trigrams of the normalized `text`"""
+    padded = f" {text} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+@dataclass
+class MediaInfo:
+    """What a media (or release) file name tells about its content"""
+    title: str
+    year: int = 0
+    season: int = 0
+    episode: int = 0
+    group: str = ""
+    tags: Set[str] = field(default_factory=set)
+
+    @property
+    def episode_code(self) -> str:
+        if not self.season or not self.episode:
+            return ""
+        return f"S{self.season:02d}E{self.episode:02d}"
+
+    @property
+    def search_terms(self) -> str:
+        """Terms to search the media on opensubtitles.org"""
+        return ' '.join(filter(None, (self.title, self.episode_code)))
+
+
+def parse_media_filename(filename: str) -> MediaInfo:
+    """
+    Parse title, year, SxxExx, release group and tags out of a file name
+    like 'Show.Name.S01E03.720p.HDTV.x264-GROUP.mkv'
+    """
+    name = os.path.basename(filename)
+    stem, ext = os.path.splitext(name)
+    if ext and ext[1:].isalnum() and len(ext) <= 5:
+        name = stem
+    # Bracketed parts are site names or hashes, but "(2010)" is a year
+    name = re.sub(r'\[[^\]]*\]', ' ', name).strip()
+    # On the raw name: normalizing would split 'S01.E05' in two words
+    episode = EPISODE_RE.search(name)
+    info = MediaInfo(title="")
+    # '-GROUP' only after the episode code or a release tag, 'Spider-Man'
+    # and 'X-Men' are titles
+    group = re.search(r'-([0-9A-Za-z]+)$', name)
+    if group and ((episode and group.start() >= episode.end()) or
+                  RELEASE_TAGS.intersection(
+                      normalize(name[:group.start()]).split())):
+        info.group = group.group(1).lower()
+        name = name[:group.start()]
+    if episode:
+        info.season, info.episode = episode_numbers(episode)
+        info.tags.update(word for word in normalize(
+            name[episode.end():]).split() if word in RELEASE_TAGS)
+        name = name[:episode.start()]
+    words = normalize(name).split()
+    title_words = []
+    for i, word in enumerate(words):
+        if word in RELEASE_TAGS:
+            info.tags.update(w for w in words[i:] if w in RELEASE_TAGS)
+            break
+        # A year ends the title, unless the title is just a year ("1917")
+        if YEAR_RE.fullmatch(word) and title_words:
+            info.year = int(word)
+            continue
+        if info.year:  # Words between the year and the tags: not title
+            continue
+        title_words.append(word)
+    if info.group in RELEASE_TAGS:
+        info.tags.add(info.group)
+        info.group = ""
+    info.title = ' '.join(title_words)
+    return info
+
+
+def episode_numbers(match: re.Match) -> Tuple[int, int]:
+    """Season and episode of an `EPISODE_RE` match"""
+    season, episode = match.group(1, 2) if match.group(1) \
+        else match.group(3, 4)
+    return int(season), int(episode)
+
+
+def show_info(show: SubtitledShow) -> MediaInfo:
+    """Title, year and episode of a search result"""
+    # Episodes are listed as '"Series name" Episode title'
+    series = re.match(r'\s*"([^"]+)"', show.name)
+    title = series.group(1) if series else show.name
+    info = MediaInfo(title=normalize(re.sub(r'\(\d{4}\)', ' ', title)))
+    year = re.search(r'\((\d{4})\)', show.name)
+    if year:
+        info.year = int(year.group(1))
+    episode = EPISODE_RE.search(f"{show.name} {show.episode}")
+    if episode:
+        info.season, info.episode = episode_numbers(episode)
+    return info
+
+
+def srt_info(srt_file: SubtitleSrtFile) -> MediaInfo:
+    """What the release name of a subtitle file tells"""
+    info = parse_media_filename(srt_file.name)
+    if srt_file.season and srt_file.episode:
+        info.season, info.episode = srt_file.season, srt_file.episode
+    return info
+
+
+class TokenIndex(Generic[T]):
+    """
+    Word and character trigram index of the titles of a list of candidates,
+    built once and queried for every media file: only the candidates
+    sharing a trigram with the query are scored. See `get_index` for the
+    shared indexes of the search results.
+    """
+
+    def __init__(self, items: List[T], info: Callable[[T], MediaInfo]):
+        self.items = items
+        self.infos = [info(item) for item in items]
+        self._words = [set(item.title.split()) for item in self.infos]
+        self._grams = [trigrams(item.title) for item in self.infos]
+        self._postings: Dict[str, List[int]] = defaultdict(list)
+        for idx, grams in enumerate(self._grams):
+            for gram in grams:
+                self._postings[gram].append(idx)
+
+    def similarities(self, title: str) -> Dict[int, float]:
+        """Title similarity in [0, 1] of the candidates sharing a trigram"""
+        words = set(title.split())
+        grams = trigrams(title)
+        shared: Dict[int, int] = defaultdict(int)
+        for gram in grams:
+            for idx in self._postings.get(gram, ()):
+                shared[idx] += 1
+        retval = {}
+        for idx, count in shared.items():
+            gram_dice = 2 * count / (len(grams) + len(self._grams[idx]))
+            cand_words = self._words[idx]
+            word_dice = 2 * len(words & cand_words) / \
+                (len(words) + len(cand_words)) if words or cand_words else 0
+            retval[idx] = (gram_dice + word_dice) / 2
+        return retval
+
+
+@dataclass
+class Match(Generic[T]):
+    """A candidate and how well it matches the media file, in [0, 1]"""
+    item: T
+    score: float
+
+
+def _score(media: MediaInfo, candidate: MediaInfo, similarity: float,
+           release: bool) -> float:
+    score = similarity
+    if media.year and candidate.year:
+        if media.year == candidate.year:
+            score += YEAR_BONUS
+        elif abs(media.year - candidate.year) > 1:
+            score -= YEAR_PENALTY
+    # A candidate without episode may be the whole series: no penalty
+    if media.episode_code and candidate.episode_code:
+        if media.episode_code == candidate.episode_code:
+            score += EPISODE_BONUS
+        else:
+            score -= EPISODE_PENALTY
+    if release:
+        if media.group and media.group == candidate.group:
+            score += GROUP_BONUS
+        shared = media.tags & candidate.tags & QUALITY_TAGS
+        score += QUALITY_BONUS * min(2, len(shared))
+    return score
+
+
+def get_index(items: List[T], info: Callable[[T], MediaInfo]
+              ) -> TokenIndex:
+    """
+    The index of `items`, shared by every call with the same candidates:
+    the media files of a folder or a season are ranked against the same
+    search results, they are indexed once
+    """
+    key = (info, tuple(repr(item) for item in items))
+    with _indexes_lock:
+        index = _indexes.get(key)
+        if index is not None:
+            _indexes.move_to_end(key)
+            return index
+    index = TokenIndex(items, info)
+    with _indexes_lock:
+        _indexes[key] = index
+        while len(_indexes) > INDEX_CACHE_SIZE:
+            _indexes.popitem(last=False)
+    return index
+
+
+def _rank(media: MediaInfo, items: List[T], index: TokenIndex,
+          release: bool) -> List[Match]:
+    similarities = index.similarities(media.title)
+    # The items of the caller, the index may have been built on equal ones
+    scored = [(_score(media, info, similarities.get(idx, 0.0), release), item)
+              for idx, (item, info) in enumerate(zip(items, index.infos))]
+    # Sorted on the raw scores, so bonuses still count above 1; sorted() is
+    # stable: on a tie the site order wins
+    scored.sort(key=lambda pair: -pair[0])
+    return [Match(item=item, score=max(0.0, min(1.0, score)))
+            for score, item in scored]
+
+
+def rank_shows(media: MediaInfo, shows: List[SubtitledShow],
+               index: Optional[TokenIndex] = None) -> List[Match]:
+    """
+    Search results sorted from the best match of `media`
+    :param index: the index of `shows`, default the shared one
+    """
+    return _rank(media, shows, index or get_index(shows, show_info),
+                 release=False)
+
+
+def rank_srt_files(media: MediaInfo, srt_files: List[SubtitleSrtFile],
+                   index: Optional[TokenIndex] = None) -> List[Match]:
+    """
+    Subtitle files sorted from the best match of `media`, the release
+    group and tags count too
+    :param index: the index of `srt_files`, default the shared one
+    """
+    return _rank(media, srt_files, index or get_index(srt_files, srt_info),
+                 release=True)
+
+
+def best_match(matches: List[Match],
+               threshold: float = AUTO_SELECT_THRESHOLD) -> Optional[Match]:
+    """The first of the ranked `matches` if its score reaches `threshold`"""
+    if matches and matches[0].score >= threshold:
+        return matches[0]
+    return None
@@ -0,0 +1,187 @@
+# metrics.py
+
+import cProfile
+import io
+import json
+import os
+import pstats
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager
+from typing import Dict, List, Optional, Tuple
+
+METRICS_PREFIX = 'ost_'
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0,
+                   10.0, float('inf'))
+PROFILE_TOP = 40
+
+LabelsKey = Tuple[Tuple[str, str], ...]
+
+
+def _labels_key(labels: Dict[str, str]) -> LabelsKey:
+    return tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+
+def _format_labels(key: LabelsKey, extra: str = "") -> str:
+    items = [f'{k}="{v}"' for k, v in key]
+    if extra:
+        items.append(extra)
+    return '{' + ','.join(items) + '}' if items else ''
+
+
+class _Histogram:
+    def __init__(self, buckets: Tuple[float, ...]):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.total = 0.0
+        self.count = 0
+
+    def observe(self, value: float) -> None:
+        self.total += value
+        self.count += 1
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+                break
+
+
+class MetricsRegistry:
+    """
+    Thread safe counters and latency histograms of the backend operations,
+    exported as JSON or in the Prometheus text format
+    """
+
+    def __init__(self, buckets: Tuple[float, ...] = LATENCY_BUCKETS):
+        self.buckets = buckets
+        self._lock = threading.Lock()
+        self._counters: Dict[str, Dict[LabelsKey, float]] = {}
+        self._histograms: Dict[str, Dict[LabelsKey, _Histogram]] = {}
+
+    def inc(self, name: str, value: float = 1, **labels) -> None:
+        """Add `value` to the counter `name`"""
+        key = _labels_key(labels)
+        with self._lock:
+            series = self._counters.setdefault(name, {})
+            series[key] = series.get(key, 0) + value
+
+    def observe(self, name: str, value: float, **labels) -> None:
+        """Record `value` (seconds) in the histogram `name`"""
+        key = _labels_key(labels)
+        with self._lock:
+            series = self._histograms.setdefault(name, {})
+            if key not in series:
+                series[key] = _Histogram(self.buckets)
+            series[key].observe(value)
+
+    @contextmanager
+    def timed(self, stage: str):
+        """Time the enclosed block as `stage` in the `stage_seconds` metric"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe('stage_seconds', time.perf_counter() - start,
+                         stage=stage)
+
+    def reset(self) -> None:
+        with self._lock:
+            self._counters.clear()
+            self._histograms.clear()
+
+    def to_json(self) -> dict:
+        """JSON representation of every metric"""
+        with self._lock:
+            counters = {
+                name: [{"labels": dict(key), "value": value}
+                       for key, value in series.items()]
+                for name, series in self._counters.items()}
+            histograms = {
+                name: [{"labels": dict(key), "count": hist.count,
+                        "sum": round(hist.total, 6),
+                        "avg": round(hist.total / hist.count, 6)
+                        if hist.count else 0,
+                        "buckets": {str(bound): count for bound, count
+                                    in zip(hist.buckets, hist.counts)}}
+                       for key, hist in series.items()]
+                for name, series in self._histograms.items()}
+        return {"counters": counters, "histograms": histograms}
+
+    def to_prometheus(self) -> str:
+        """Every metric in the Prometheus text exposition format"""
+        lines: List[str] = []
+        with self._lock:
+            for name, series in sorted(self._counters.items()):
+                metric = f"{METRICS_PREFIX}{name}_total"
+                lines.append(f"# TYPE {metric} counter")
+                for key, value in series.items():
+                    lines.append(f"{metric}{_format_labels(key)} {value:g}")
+            for name, series in sorted(self._histograms.items()):
+                metric = f"{METRICS_PREFIX}{name}"
+                lines.append(f"# TYPE {metric} histogram")
+                for key, hist in series.items():
+                    cumulative = 0
+                    for bound, count in zip(hist.buckets, hist.counts):
+                        cumulative += count
+                        le = '+Inf' if bound == float('inf') else f"{bound:g}"
+                        labels = _format_labels(key, 'le="%s"' % le)
+                        lines.append(f"{metric}_bucket{labels} {cumulative}")
+                    lines.append(f"{metric}_sum{_format_labels(key)} "
+                                 f"{hist.total:.6f}")
+                    lines.append(f"{metric}_count{_format_labels(key)} "
+                                 f"{hist.count}")
+        return '\n'.join(lines) + '\n'
+
+    def export(self, filename: str) -> None:
+        """Write the metrics to `filename`, Prometheus format if .prom"""
+        with open(filename, 'w') as fh:
+            if filename.endswith('.prom'):
+                fh.write(self.to_prometheus())
+            else:
+                json.dump(self.to_json(), fh, indent=2)
+
+
+_metrics = MetricsRegistry()
+
+
+def get_metrics() -> MetricsRegistry:
+    """Return the registry shared by the backend"""
+    return _metrics
+
+
+class ProfileSession:
+    """
+    Opt-in cProfile + tracemalloc session, `stop` dumps the reports:
+    profile.pstats, profile.txt (top functions by cumulative time) and
+    memory.txt (top allocating lines)
+    """
+
+    def __init__(self, folder: str):
+        self.folder = folder
+        self._profiler: Optional[cProfile.Profile] = None
+
+    def start(self) -> None:
+        os.makedirs(self.folder, exist_ok=True)
+        tracemalloc.start()
+        self._profiler = cProfile.Profile()
+        # Only the calling thread is profiled, worker threads are not
+        self._profiler.enable()
+
+    def stop(self) -> None:
+        if not self._profiler:
+            return
+        self._profiler.disable()
+        snapshot = tracemalloc.take_snapshot()
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        self._profiler.dump_stats(os.path.join(self.folder, 'profile.pstats'))
+        text = io.StringIO()
+        stats = pstats.Stats(self._profiler, stream=text)
+        stats.sort_stats('cumulative').print_stats(PROFILE_TOP)
+        with open(os.path.join(self.folder, 'profile.txt'), 'w') as fh:
+            fh.write(text.getvalue())
+        with open(os.path.join(self.folder, 'memory.txt'), 'w') as fh:
+            fh.write(f"Peak traced memory: {peak / 1024:.1f} KiB\n\n")
+            for stat in snapshot.statistics('lineno')[:PROFILE_TOP]:
+                fh.write(f"{stat}\n")
+        self._profiler = None
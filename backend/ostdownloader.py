@@ -1,15 +1,98 @@
 # ostdownloader.py
 
+import hashlib
+import io
+import json
 import os
-from dataclasses import dataclass, field
-from typing import List, Union, Any
+import queue
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field, replace
+from typing import List, Union, Any, Callable, Iterator, Optional, \
+    Pattern, Tuple
+from urllib.parse import urlsplit
 
 import requests
-from bs4 import BeautifulSoup
+from bs4 import BeautifulSoup, SoupStrainer
 from bs4.element import Tag, ResultSet
 
+from backend.cache import get_cache, normalize_url, CacheEntry, \
+    PAGE_SEARCH, PAGE_SHOW
+from backend.metrics import get_metrics
+from backend.singleflight import SingleFlight, private
+from backend.transport import get_transport
+
 SRTFILE_COL_EP_INDEX = 4
 SRTFILE_COL_SEASON_INDEX = 2
+SEASON_NUMBER_RE = re.compile(r'season\s*(\d+)', re.IGNORECASE)
+# The '3.' numbering of the episode rows, episode codes: matching.EPISODE_RE
+EPISODE_NUMBER_RE = re.compile(r'\s*(\d+)\s*\.')
+DOWNLOAD_CHUNK_SIZE = 64 * 1024
+PARTIAL_SUFFIX = '.part'
+RESUME_SUFFIX = '.resume'  # beside the '.part': its url and remote version
+MAX_ARCHIVE_BYTES = 16 * 1024 * 1024
+SEARCH_PAGE_SIZE = 40  # results in a search page
+SUBLANGUAGE_RE = re.compile(r'sublanguageid-[^/]*')
+DEFAULT_PREFETCH_WORKERS = 2
+MAX_SEARCH_PAGES = 25
+
+ProgressCallback = Callable[[int, Optional[int]], None]
+
+# Concurrent requests of the same url share one fetch, parse or download
+_text_flights = SingleFlight('fetch')
+_parsed_flights = SingleFlight('parse')
+_download_flights = SingleFlight('download')
+
+# The fastest HTML parser available is used, lxml is optional
+try:
+    import lxml  # noqa: F401
+    HTML_PARSER = 'lxml'
+except ImportError:
+    HTML_PARSER = 'html.parser'
+
+
+@dataclass(frozen=True)
+class PageTarget:
+    """
+    The part of a page a parser needs: the element is cut out of the HTML
+    text before parsing, and only its subtree is built
+    """
+    tag: str
+    start: Pattern
+    strainer: SoupStrainer
+
+    def slice(self, text: str) -> Optional[str]:
+        """The HTML text of the element, None if not in `text`"""
+        match = self.start.search(text)
+        if not match:
+            return None
+        depth = 0
+        tags = re.compile(rf'<(/?){self.tag}\b', re.IGNORECASE)
+        for tag in tags.finditer(text, match.start()):
+            depth += -1 if tag.group(1) else 1
+            if depth == 0:
+                end = text.find('>', tag.end())
+                if end >= 0:
+                    return text[match.start():end + 1]
+                break
+        # Unbalanced markup, let the strainer find the end
+        return text[match.start():]
+
+
+RESULTS_TABLE = PageTarget(
+    'table',
+    re.compile(r'<table\b[^>]*\bid\s*=\s*["\']?search_results\b',
+               re.IGNORECASE),
+    SoupStrainer('table', attrs={'id': 'search_results'}))
+MOVIE_BLOCK = PageTarget(
+    'div',
+    re.compile(r'<div\b[^>]*\bitemtype\s*=\s*["\']?'
+               r'http://schema\.org/Movie\b', re.IGNORECASE),
+    SoupStrainer('div', attrs={'itemtype': 'http://schema.org/Movie'}))
+SEARCH_PAGE_TARGETS = (RESULTS_TABLE,)
+SHOW_PAGE_TARGETS = (RESULTS_TABLE, MOVIE_BLOCK)
 
 
 class SubtitleException(Exception):
@@ -36,6 +119,11 @@ class Subtitle:
         """JSON representation of the object"""
         return {"name": self.name, "href": self.href}
 
+    @classmethod
+    def from_json(cls, data: dict) -> "Subtitle":
+        """Build an instance from the output of `to_json`"""
+        return cls(name=data['name'], href=data['href'])
+
     @staticmethod
     def parse(**kwargs) -> Any:
         return NotImplementedError
@@ -44,7 +132,29 @@ class Subtitle:
 @dataclass
 class SubtitleSrtFile(Subtitle):
     """Represents a subtitle file"""
-    pass
+    season: int = 0
+    episode: int = 0
+
+    @property
+    def episode_code(self) -> str:
+        """SxxExx code of the episode, empty if not a TV series episode"""
+        if not self.season or not self.episode:
+            return ""
+        return f"S{self.season:02d}E{self.episode:02d}"
+
+    def to_json(self) -> dict:
+        retval = super().to_json()
+        if self.season:
+            retval['season'] = self.season
+        if self.episode:
+            retval['episode'] = self.episode
+        return retval
+
+    @classmethod
+    def from_json(cls, data: dict) -> "SubtitleSrtFile":
+        return cls(name=data['name'], href=data['href'],
+                   season=data.get('season', 0),
+                   episode=data.get('episode', 0))
 
 
 @dataclass
@@ -52,12 +162,25 @@ class SubtitledShow(Subtitle):
     """Represents a show to search for subtitles"""
     episode: str = ""
     srt_files: List[SubtitleSrtFile] = field(default_factory=list)
+    # Languages the show was found for, by a search for each language
+    languages: List[str] = field(default_factory=list)
 
     def to_json(self) -> dict:
         retval = super().to_json()
+        retval['episode'] = self.episode
         retval['srtfiles'] = [srt.to_json() for srt in self.srt_files]
+        if self.languages:
+            retval['languages'] = self.languages
         return retval
 
+    @classmethod
+    def from_json(cls, data: dict) -> "SubtitledShow":
+        return cls(name=data['name'], href=data['href'],
+                   episode=data.get('episode', ''),
+                   srt_files=[SubtitleSrtFile.from_json(srt)
+                              for srt in data.get('srtfiles', [])],
+                   languages=data.get('languages', []))
+
     def __str__(self):
         """The user need to know show name and episode (if any) in order to
         choose the desidered show"""
@@ -88,25 +211,141 @@ class SubtitledShow(Subtitle):
                              episode=show_episode, srt_files=[])
 
 
-def _get_html(url: str) -> BeautifulSoup:
+def _get_text(url: str,
+              page_type: str) -> Tuple[str, Optional[CacheEntry]]:
     """
-    Get the HTML content of a given URL and parse it using BeautifulSoup.
-
-    Parameters:
-    - url: A string representing the URL of the webpage to retrieve.
+    Get the HTML text of `url`, going through the response cache when it is
+    enabled: fresh entries are served without network access, stale ones are
+    revalidated with ETag/If-Modified-Since. Concurrent calls for the same
+    url share one request.
 
     Returns:
-    - BeautifulSoup: An object representing the parsed HTML content.
+    - the HTML text
+    - the cache entry if the text comes unchanged from the cache, else None
     """
+    retval, _ = _text_flights.do(normalize_url(url),
+                                 lambda: _fetch_text(url, page_type))
+    return retval
+
+
+def _fetch_text(url: str,
+                page_type: str) -> Tuple[str, Optional[CacheEntry]]:
+    """`_get_text` without the coalescing"""
+    metrics = get_metrics()
+    cache = get_cache()
+    entry = cache.get(url) if cache else None
+    if entry and cache.is_fresh(entry):
+        metrics.inc('cache_lookups', result='hit', page=page_type)
+        return entry.body, entry
+    headers = {}
+    if entry and entry.etag:
+        headers['If-None-Match'] = entry.etag
+    if entry and entry.last_modified:
+        headers['If-Modified-Since'] = entry.last_modified
     try:
-        resp = requests.get(url)
-        if not resp.ok:
-            resp.raise_for_status()
-        return BeautifulSoup(resp.text, 'html.parser')
+        with metrics.timed('fetch'):
+            resp = get_transport().get(url, headers=headers or None)
+            if entry and resp.status_code == 304:
+                cache.revalidated(url)
+                metrics.inc('cache_lookups', result='revalidated',
+                            page=page_type)
+                return entry.body, entry
+            if not resp.ok:
+                resp.raise_for_status()
+            metrics.inc('bytes_received', len(resp.content), stage='fetch')
     except requests.RequestException as e:
         raise SubtitleExceptionRequests(e)
+    if cache:
+        metrics.inc('cache_lookups', result='miss', page=page_type)
+        cache.store(url, page_type, resp.text,
+                    etag=resp.headers.get('ETag'),
+                    last_modified=resp.headers.get('Last-Modified'))
+    return resp.text, None
+
+
+def set_html_parser(name: str) -> None:
+    """Choose the BeautifulSoup tree builder, e.g. 'lxml' or 'html.parser'"""
+    global HTML_PARSER
+    HTML_PARSER = name
+
+
+def _parse_text(text: str,
+                parse: Callable[[BeautifulSoup], List[Subtitle]],
+                targets: Tuple[PageTarget, ...] = ()) -> List[Subtitle]:
+    """
+    Build the HTML tree of `text` and extract the objects with `parse`.
+
+    Only the subtree of the first of `targets` found in the page is built,
+    the whole page if none is there. The tree is destroyed as soon as the
+    objects are extracted.
+    """
+    with get_metrics().timed('parse'):
+        for target in targets:
+            fragment = target.slice(text)
+            if fragment is None:
+                continue
+            soup = BeautifulSoup(fragment, HTML_PARSER,
+                                 parse_only=target.strainer)
+            if soup.find():
+                break
+            soup.decompose()
+        else:
+            soup = BeautifulSoup(text, HTML_PARSER)
+        try:
+            return parse(soup)
+        finally:
+            soup.decompose()
+
+
+def _get_parsed(url: str, page_type: str,
+                parse: Callable[[BeautifulSoup], List[Subtitle]],
+                loader: Callable[[dict], Subtitle],
+                targets: Tuple[PageTarget, ...] = ()) -> List[Subtitle]:
+    """
+    Return the objects `parse` extracts from the page at `url`, building
+    only the part of the page of the first of `targets` found. When the
+    page comes unchanged from the cache and its parsed result was saved,
+    the objects are rebuilt with `loader` without parsing the HTML again.
+
+    Concurrent calls for the same url share one fetch and parse, each
+    caller gets its own copy of the objects.
+    """
+    retval, shared = _parsed_flights.do(
+        (normalize_url(url), parse),
+        lambda: _fetch_parsed(url, page_type, parse, loader, targets))
+    if shared:
+        return [loader(item.to_json()) for item in retval]
+    return retval
+
+
+def _fetch_parsed(url: str, page_type: str,
+                  parse: Callable[[BeautifulSoup], List[Subtitle]],
+                  loader: Callable[[dict], Subtitle],
+                  targets: Tuple[PageTarget, ...]) -> List[Subtitle]:
+    """`_get_parsed` without the coalescing"""
+    try:
+        text, entry = _get_text(url, page_type)
+    except SubtitleException:
+        raise
     except Exception as e:
         raise SubtitleException(e)
+    if entry and entry.parsed is not None:
+        get_metrics().inc('parsed_cache_hits', page=page_type)
+        return [loader(item) for item in entry.parsed]
+    cache = get_cache()
+    try:
+        retval = _parse_text(text, parse, targets)
+    except Exception as e:
+        # A captcha or an unexpected page: fetched again next time, not
+        # served from the cache until its TTL expires
+        if cache:
+            cache.discard(url)
+        if isinstance(e, (SubtitleException, ValueError)):
+            raise  # ValueError: no results table, see `search_show_by_hash`
+        raise SubtitleException(f"Unexpected page {url}: {e!r}") from e
+    if cache:
+        cache.store_parsed(url, [item.to_json() for item in retval])
+    return retval
 
 
 def _parse_show_disambiguation(results_table: Tag) -> List[Subtitle]:
@@ -128,23 +367,234 @@ def _parse_show_disambiguation(results_table: Tag) -> List[Subtitle]:
     return shows_found
 
 
-def search_show(search_terms: str, root_search: str):
-    """Get the disambiguation page results"""
-    url = root_search + search_terms.replace(' ', '+')
-    print("Searching " + url)
-    soup: BeautifulSoup = _get_html(url)
+def _parse_search_page(soup: BeautifulSoup) -> List[Subtitle]:
+    """Return the shows listed in a search results page"""
     results_table: Tag = soup.find('table', {'id': 'search_results'})
     if not results_table:
         raise ValueError("Unable to parse search results")
-    shows_found = _parse_show_disambiguation(results_table)
-    return shows_found
+    return _parse_show_disambiguation(results_table)
+
+
+def search_page_url(search_terms: str, root_search: str,
+                    offset: int = 0) -> str:
+    """Url of the search results page starting at result `offset`"""
+    url = root_search + search_terms.replace(' ', '+')
+    return f"{url}/offset-{offset}" if offset else url
+
+
+def search_show(search_terms: str, root_search: str):
+    """Get the disambiguation page results"""
+    url = search_page_url(search_terms, root_search)
+    print("Searching " + url)
+    return _get_parsed(url, PAGE_SEARCH, _parse_search_page,
+                       SubtitledShow.from_json, SEARCH_PAGE_TARGETS)
+
+
+def iter_search_pages(search_terms: str, root_search: str,
+                      max_pages: int = MAX_SEARCH_PAGES
+                      ) -> Iterator[List[SubtitledShow]]:
+    """
+    Lazily follow the result offsets of a search, yielding the shows of
+    each page as soon as it is parsed; the next page is only requested when
+    the caller asks for it, so stopping the iteration stops the search.
+
+    Shows already yielded are skipped. The iteration ends with a page
+    shorter than `SEARCH_PAGE_SIZE`, a page without new shows (the server
+    ignored the offset) or without a results table, or after `max_pages`.
+    Errors on the first page are raised as in `search_show`.
+    """
+    seen = set()
+    for page in range(max_pages):
+        offset = page * SEARCH_PAGE_SIZE
+        url = search_page_url(search_terms, root_search, offset)
+        print("Searching " + url)
+        try:
+            shows = _get_parsed(url, PAGE_SEARCH, _parse_search_page,
+                                SubtitledShow.from_json, SEARCH_PAGE_TARGETS)
+        except ValueError:
+            if not page:
+                raise
+            return
+        new_shows = [show for show in shows if show.href not in seen]
+        if not new_shows:
+            return
+        seen.update(show.href for show in new_shows)
+        yield new_shows
+        if len(shows) < SEARCH_PAGE_SIZE:
+            return
+
+
+def _show_key(href: str) -> str:
+    """`href` without its languages, the same show in any language"""
+    return SUBLANGUAGE_RE.sub('sublanguageid-', href)
+
+
+def merge_shows(shows: List[SubtitledShow],
+                page_shows: List[SubtitledShow]) -> List[SubtitledShow]:
+    """
+    Return a new list of `shows` where the shows of `page_shows` already
+    there (the same show for more languages) replace them in place and the
+    other ones are appended
+    """
+    retval = list(shows)
+    index = {_show_key(show.href): pos for pos, show in enumerate(retval)}
+    for show in page_shows:
+        pos = index.get(_show_key(show.href))
+        if pos is None:
+            index[_show_key(show.href)] = len(retval)
+            retval.append(show)
+        else:
+            retval[pos] = show
+    return retval
+
+
+def iter_search_languages(search_terms: str, search_url: str,
+                          languages: List[str],
+                          max_pages: int = MAX_SEARCH_PAGES
+                          ) -> Iterator[Tuple[str, List[SubtitledShow]]]:
+    """
+    Search `search_terms` for each of `languages` at once, one thread for
+    each language, yielding the language and the shows of every page as
+    soon as it is parsed, so a slow language doesn't hold back the others.
+
+    The results are merged: a show found for several languages is yielded
+    the first time, then again each time a language is added, as a new
+    object whose `languages` grow and whose href lists all of them. A show
+    yielded is never modified afterwards, the caller replaces the previous
+    one, see `merge_shows`. Stopping the iteration stops the searches after
+    the pages being fetched.
+    :param search_url: the search url with a `{}` slot for the languages,
+                       like the `ost_search_url` option
+    :return: language, shows new or with a new language
+    """
+    pages = queue.Queue()
+    stop = threading.Event()
+    done = object()
+
+    def _search(language: str) -> None:
+        try:
+            for shows in iter_search_pages(search_terms,
+                                           search_url.format(language),
+                                           max_pages):
+                pages.put((language, shows))
+                if stop.is_set():
+                    break
+        except Exception as ex:
+            pages.put((language, ex))
+        finally:
+            pages.put((language, done))
+
+    threads = [threading.Thread(target=_search, args=(language,),
+                                daemon=True) for language in languages]
+    for thread in threads:
+        thread.start()
+    merged = {}
+    errors = []
+    running = len(threads)
+    try:
+        while running:
+            language, shows = pages.get()
+            if shows is done:
+                running -= 1
+                continue
+            if isinstance(shows, Exception):
+                errors.append(shows)
+                continue
+            page_shows = []
+            for show in shows:
+                key = _show_key(show.href)
+                found = merged.get(key)
+                if found is None:  # Parsed for this page, not shared yet
+                    show.languages = [language]
+                    merged[key] = show
+                    page_shows.append(show)
+                elif language not in found.languages:
+                    found_languages = found.languages + [language]
+                    merged[key] = replace(
+                        found, languages=found_languages,
+                        srt_files=list(found.srt_files),
+                        href=SUBLANGUAGE_RE.sub(
+                            'sublanguageid-' + ','.join(found_languages),
+                            found.href))
+                    page_shows.append(merged[key])
+            yield language, page_shows
+    finally:
+        stop.set()
+    # Only fail if no language could be searched
+    if errors and len(errors) == len(threads):
+        raise errors[0]
+
+
+def iter_search_show(search_terms: str, root_search: str,
+                     max_pages: int = MAX_SEARCH_PAGES
+                     ) -> Iterator[SubtitledShow]:
+    """Every show found by a search, see `iter_search_pages`"""
+    for shows in iter_search_pages(search_terms, root_search, max_pages):
+        yield from shows
+
+
+def search_show_by_hash(movie_hash: str, movie_size: int, root_search: str):
+    """
+    Get the shows whose files match exactly the OpenSubtitles hash and size
+    of a media file, `root_search` is the same url used by `search_show`
+    """
+    url = root_search.rsplit('moviename-', 1)[0] + \
+        f"moviebytesize-{movie_size}/moviehash-{movie_hash}"
+    print("Searching " + url)
+    return _get_parsed(url, PAGE_SEARCH, _parse_search_page,
+                       SubtitledShow.from_json, SEARCH_PAGE_TARGETS)
 
 
 def get_subtitles_for_show(show_url: str) -> List[SubtitleSrtFile]:
     """Parse subtitle files available for `show_url` page"""
+    return _get_parsed(show_url, PAGE_SHOW, _parse_show_page,
+                       SubtitleSrtFile.from_json, SHOW_PAGE_TARGETS)
+
+
+def prefetch_show_listings(shows: List[SubtitledShow], domain: str,
+                           cancelled: Optional[threading.Event] = None,
+                           workers: int = DEFAULT_PREFETCH_WORKERS) -> int:
+    """
+    Speculatively list the subtitle files of `shows`, e.g. the top results
+    of a search, into their `srt_files`, so that opening one of them needs
+    no request. Shows already listed are skipped.
+
+    Prefetching is best effort and must not compete with the user requests:
+    it stops as soon as `cancelled` is set or the rate limiter is slowing
+    down the host (the server is throttling us), and errors are ignored.
+    :return: the number of shows listed
+    """
+    metrics = get_metrics()
+    limiter = get_transport().limiter
+
+    def _prefetch(show: SubtitledShow) -> bool:
+        url = show.get_url(domain)
+        host = urlsplit(url).netloc
+        if (cancelled and cancelled.is_set()) or \
+                limiter.current_rate(host) < limiter.max_rate:
+            metrics.inc('prefetch', result='skipped')
+            return False
+        try:
+            srt_files = get_subtitles_for_show(url)
+        except Exception:
+            metrics.inc('prefetch', result='failed')
+            return False
+        if not show.srt_files:
+            show.srt_files = srt_files
+        metrics.inc('prefetch', result='ok')
+        return True
+
+    pending = [show for show in shows if not show.srt_files]
+    if not pending:
+        return 0
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        return sum(executor.map(_prefetch, pending))
+
+
+def _parse_show_page(soup: BeautifulSoup) -> List[SubtitleSrtFile]:
+    """Return the subtitle files listed in a show page"""
     srtfile_col_ep_index = SRTFILE_COL_EP_INDEX
     srtfile_col_season_index = SRTFILE_COL_SEASON_INDEX
-    soup: BeautifulSoup = _get_html(show_url)
     results_table: Tag = soup.find('table', {'id': 'search_results'})
     retval = []
     if not results_table:  # Movies or TV Episodes
@@ -179,6 +629,7 @@ def _parse_complete_tvseries(
         results_table: Tag, srtfile_col_season_index) -> List[SubtitleSrtFile]:
     """Parse subtitles links for a TvSeries page (collection of episodes) """
     retval = []
+    season = 0
     rows = results_table.find_all('tr')
     for row in rows:
         cells = row.find_all('td')
@@ -187,6 +638,8 @@ def _parse_complete_tvseries(
         if len(cells) == 1 \
                 and cells[0].text.strip().lower().startswith('season'):
             title = cells[0].text.strip()
+            season_match = SEASON_NUMBER_RE.match(title)
+            season = int(season_match.group(1)) if season_match else 0
             links = cells[0].find_all('a')
             href = None
             for link in links:
@@ -198,13 +651,17 @@ def _parse_complete_tvseries(
                             f"{link.find('meta').attrs['content']} episodes)"
                 else:
                     href = link.attrs['href']
-            retval.append(SubtitleSrtFile(name=title, href=href))
+            retval.append(SubtitleSrtFile(name=title, href=href,
+                                          season=season))
         else:
             title = _parse_title(cells[0])
+            episode_match = EPISODE_NUMBER_RE.match(title)
             retval.append(SubtitleSrtFile(
                 name=title,
                 href=_parse_srt_file_url(
-                    cells[srtfile_col_season_index])))
+                    cells[srtfile_col_season_index]),
+                season=season,
+                episode=int(episode_match.group(1)) if episode_match else 0))
     return retval
 
 
@@ -222,27 +679,234 @@ def _parse_srt_file_url(tag: Tag) -> str:
     return href.attrs['href']
 
 
-def download_srt_files(url: str, local_filename: str) -> int:
+@dataclass
+class DownloadStats:
+    """Outcome of a subtitle file download"""
+    filename: str
+    size: int
+    bytes_written: int
+    elapsed: float
+    resumed_from: int = 0
+
+    @property
+    def throughput(self) -> float:
+        """Bytes per second transferred"""
+        return self.bytes_written / self.elapsed if self.elapsed else 0.0
+
+    def to_json(self) -> dict:
+        """JSON representation of the object"""
+        return {"filename": self.filename, "size": self.size,
+                "bytes_written": self.bytes_written,
+                "elapsed": round(self.elapsed, 3),
+                "resumed_from": self.resumed_from,
+                "throughput": round(self.throughput, 1)}
+
+
+def _verify_download(filename: str, expected_size: Optional[int],
+                     sha256: Optional[str]) -> None:
+    """Raise `SubtitleException` if `filename` is not what we expected"""
+    if expected_size is not None:
+        size = os.path.getsize(filename)
+        if size != expected_size:
+            raise SubtitleException(
+                f"Downloaded {size} bytes, expected {expected_size}")
+    if sha256:
+        digest = hashlib.sha256()
+        with open(filename, 'rb') as fh:
+            for chunk in iter(lambda: fh.read(DOWNLOAD_CHUNK_SIZE), b''):
+                digest.update(chunk)
+        if digest.hexdigest().lower() != sha256.lower():
+            raise SubtitleException(f"Checksum mismatch for {filename}")
+
+
+def download_srt_files(url: str, local_filename: str,
+                       expected_size: Optional[int] = None,
+                       sha256: Optional[str] = None,
+                       chunk_size: int = DOWNLOAD_CHUNK_SIZE,
+                       progress: Optional[ProgressCallback] = None
+                       ) -> DownloadStats:
     """
     Download the subtitle file (.zip)
+
+    The response is streamed in chunks into `local_filename` + '.part',
+    which is fsynced and then renamed to `local_filename`, so an interrupted
+    download never leaves a truncated archive behind. If the '.part' file
+    is already there, downloaded from the same url, the download is resumed
+    with an HTTP Range request; the If-Range header, with the ETag or
+    Last-Modified of the first response, makes the server send the whole
+    file if it changed meanwhile.
     :param url:
     :param local_filename: optional extension, default .zip will be added
                            if missing
-    :return:  file size of downloaded file
+    :param expected_size: if given, the size the downloaded file must have
+    :param sha256: if given, the hex digest the downloaded file must have
+    :param chunk_size: bytes read from the response at a time
+    :param progress: called after every chunk with the bytes received so
+                     far and the total if known, may raise to abort
+    :return: the downloaded file stats
+
+    Concurrent calls for the same url and file share one download, only
+    the progress of the first caller is reported. If that progress raises
+    (a cancel) the other callers go on with a new download.
     """
     _, ext = os.path.splitext(local_filename)
     if not ext:
         local_filename = f"{local_filename}.zip"
+    retval, _ = _download_flights.do(
+        ('file', normalize_url(url), os.path.abspath(local_filename)),
+        lambda: _download_file(url, local_filename, expected_size, sha256,
+                               chunk_size, private(progress)))
+    return retval
+
+
+def _resume_validator(partial: str, url: str) -> Optional[str]:
+    """
+    The If-Range value to resume `partial`, '' if the server gave none,
+    None if `partial` can't be resumed: missing, or of another url
+    """
+    try:
+        with open(partial + RESUME_SUFFIX, encoding='utf-8') as fh:
+            info = json.load(fh)
+    except (OSError, ValueError):
+        return None
+    if not os.path.exists(partial) or \
+            info.get('url') != normalize_url(url):
+        return None
+    return info.get('validator', '')
+
+
+def _save_resume_info(partial: str, url: str,
+                      resp: requests.Response) -> None:
+    """Remember where `partial` comes from, before writing to it"""
+    etag = resp.headers.get('ETag', '')
+    # A weak ETag can't be used with If-Range
+    validator = etag if etag and not etag.startswith('W/') \
+        else resp.headers.get('Last-Modified', '')
+    with open(partial + RESUME_SUFFIX, 'w', encoding='utf-8') as fh:
+        json.dump({"url": normalize_url(url), "validator": validator}, fh)
+
+
+def _remove_partial(partial: str) -> None:
+    for filename in (partial, partial + RESUME_SUFFIX):
+        if os.path.exists(filename):
+            os.remove(filename)
+
+
+def _download_file(url: str, local_filename: str,
+                   expected_size: Optional[int], sha256: Optional[str],
+                   chunk_size: int,
+                   progress: Optional[ProgressCallback]) -> DownloadStats:
+    """`download_srt_files` without the coalescing"""
+    partial = local_filename + PARTIAL_SUFFIX
+    print('Retrieving ' + url)
+    metrics = get_metrics()
+    start = time.perf_counter()
+    written = 0
+    offset = 0
+    try:
+        while True:
+            validator = _resume_validator(partial, url)
+            if validator is None:  # Another download's, or none
+                _remove_partial(partial)
+            offset = os.path.getsize(partial) if validator is not None \
+                else 0
+            headers = {}
+            if offset:
+                headers['Range'] = f'bytes={offset}-'
+                if validator:
+                    headers['If-Range'] = validator
+            with get_transport().get(url, stream=True,
+                                     headers=headers or None) as resp:
+                if offset and resp.status_code == 416:
+                    # The partial file is not consistent with the remote one
+                    _remove_partial(partial)
+                    continue
+                if not resp.ok:
+                    resp.raise_for_status()
+                if resp.status_code != 206:  # Whole file: changed, or
+                    offset = 0               # Range not honored, restart
+                    _save_resume_info(partial, url, resp)
+                total = resp.headers.get('Content-Length')
+                total = offset + int(total) \
+                    if total and total.isdigit() else None
+                with open(partial, 'ab' if offset else 'wb') as fh:
+                    for chunk in resp.iter_content(chunk_size):
+                        fh.write(chunk)
+                        written += len(chunk)
+                        if progress:
+                            progress(offset + written, total)
+                    fh.flush()
+                    os.fsync(fh.fileno())
+            break
+    except requests.RequestException as e:
+        raise SubtitleExceptionRequests(e)
+    try:
+        _verify_download(partial, expected_size, sha256)
+    except SubtitleException:
+        _remove_partial(partial)
+        raise
+    os.replace(partial, local_filename)
+    _remove_partial(partial)
+    stats = DownloadStats(filename=local_filename,
+                          size=os.path.getsize(local_filename),
+                          bytes_written=written,
+                          elapsed=time.perf_counter() - start,
+                          resumed_from=offset)
+    metrics.observe('stage_seconds', stats.elapsed, stage='download')
+    metrics.inc('bytes_received', written, stage='download')
+    metrics.inc('downloads', resumed='yes' if offset else 'no')
+    return stats
+
+
+def download_srt_archive(url: str, max_bytes: int = MAX_ARCHIVE_BYTES,
+                         chunk_size: int = DOWNLOAD_CHUNK_SIZE,
+                         progress: Optional[ProgressCallback] = None
+                         ) -> io.BytesIO:
+    """
+    Download the subtitle file (.zip) into memory
+    :param url:
+    :param max_bytes: the download is aborted if the archive is bigger
+    :param chunk_size: bytes read from the response at a time
+    :param progress: called after every chunk with the bytes received so
+                     far and the total if known, may raise to abort
+    :return: the archive content, positioned at the start
+
+    Concurrent calls for the same url share one download, only the
+    progress of the first caller is reported. If that progress raises
+    (a cancel) the other callers go on with a new download.
+    """
+    content, _ = _download_flights.do(
+        ('archive', normalize_url(url)),
+        lambda: _download_archive(url, max_bytes, chunk_size,
+                                  private(progress)))
+    return io.BytesIO(content)
+
+
+def _download_archive(url: str, max_bytes: int, chunk_size: int,
+                      progress: Optional[ProgressCallback]) -> bytes:
+    """`download_srt_archive` without the coalescing, the archive content"""
     print('Retrieving ' + url)
-    resp = requests.get(url)
-    if not resp.ok:
-        resp.raise_for_status()
-    # print(os.path.abspath(local_filename))
-    with open(local_filename, 'wb') as fh:
-        fh.write(resp.content)
-    if os.path.exists(local_filename):
-        return os.path.getsize(local_filename)
-    return -1
+    metrics = get_metrics()
+    buffer = io.BytesIO()
+    try:
+        with metrics.timed('download'), \
+                get_transport().get(url, stream=True) as resp:
+            if not resp.ok:
+                resp.raise_for_status()
+            total = resp.headers.get('Content-Length')
+            total = int(total) if total and total.isdigit() else None
+            for chunk in resp.iter_content(chunk_size):
+                if buffer.tell() + len(chunk) > max_bytes:
+                    raise SubtitleException(
+                        f"Archive bigger than {max_bytes} bytes: {url}")
+                buffer.write(chunk)
+                if progress:
+                    progress(buffer.tell(), total)
+    except requests.RequestException as e:
+        raise SubtitleExceptionRequests(e)
+    metrics.inc('bytes_received', buffer.tell(), stage='download')
+    metrics.inc('downloads', resumed='no')
+    return buffer.getvalue()
 
 
 def get_available_languages():
@@ -256,4 +920,6 @@ def get_available_languages():
 
 
 if __name__ == '__main__':
-    get_available_languages()
+    # The command line interface lives in backend.cli
+    from backend.cli import main
+    raise SystemExit(main())
@@ -0,0 +1,142 @@
+# ratelimit.py
+
+import random
+import threading
+import time
+from email.utils import parsedate_to_datetime
+from typing import Dict, Optional
+
+DEFAULT_RATE = 2.0  # requests per second, for each host
+DEFAULT_BURST = 5
+DEFAULT_MIN_RATE = 0.1
+DEFAULT_MAX_BACKOFF = 120.0
+DEFAULT_MAX_RETRY_AFTER = 300.0
+BACKOFF_BASE = 1.0
+RATE_DECREASE_FACTOR = 0.5
+RATE_INCREASE_FACTOR = 1.25
+SUCCESS_STREAK = 10
+
+
+def parse_retry_after(value: Optional[str]) -> Optional[float]:
+    """Seconds to wait according to a Retry-After header, None if missing"""
+    if not value:
+        return None
+    value = value.strip()
+    if value.isdigit():
+        return float(value)
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+class _HostState:
+    """Token bucket and backoff state of a single host"""
+
+    def __init__(self, rate: float, burst: int):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = float(burst)
+        self.updated = time.monotonic()
+        self.blocked_until = 0.0
+        self.streak = 0
+
+
+class RateLimiter:
+    """
+    Token bucket rate limiter shared by every outbound request, one bucket
+    for each host.
+
+    When the server throttles us (429) or fails (5xx) the host is paused,
+    for the Retry-After time if given (capped to `max_retry_after`) or else
+    with an exponential backoff with jitter, and its rate is halved. After `SUCCESS_STREAK` successful
+    requests in a row the rate grows back, up to the configured one.
+    """
+
+    def __init__(self, rate: float = DEFAULT_RATE,
+                 burst: int = DEFAULT_BURST,
+                 min_rate: float = DEFAULT_MIN_RATE,
+                 max_backoff: float = DEFAULT_MAX_BACKOFF,
+                 max_retry_after: float = DEFAULT_MAX_RETRY_AFTER):
+        """
+        :param rate: requests per second allowed for each host
+        :param burst: requests allowed at once before the rate applies
+        :param min_rate: the rate never goes below this when backing off
+        :param max_backoff: longest pause without a Retry-After header
+        :param max_retry_after: longest pause asked by a Retry-After header,
+                                a server asking for hours doesn't hang us
+        """
+        self.max_rate = rate
+        self.burst = burst
+        self.min_rate = min(min_rate, rate)
+        self.max_backoff = max_backoff
+        self.max_retry_after = max_retry_after
+        self._lock = threading.Lock()
+        self._hosts: Dict[str, _HostState] = {}
+
+    def _host(self, host: str) -> _HostState:
+        state = self._hosts.get(host)
+        if state is None:
+            state = self._hosts[host] = _HostState(self.max_rate, self.burst)
+        return state
+
+    def acquire(self, host: str) -> float:
+        """
+        Block until a request to `host` is allowed
+        :return: seconds waited
+        """
+        waited = 0.0
+        while True:
+            with self._lock:
+                state = self._host(host)
+                now = time.monotonic()
+                state.tokens = min(
+                    state.burst,
+                    state.tokens + (now - state.updated) * state.rate)
+                state.updated = now
+                if now < state.blocked_until:
+                    delay = state.blocked_until - now
+                elif state.tokens >= 1:
+                    state.tokens -= 1
+                    return waited
+                else:
+                    delay = (1 - state.tokens) / state.rate
+            time.sleep(delay)
+            waited += delay
+
+    def throttled(self, host: str, retry_after: Optional[float] = None,
+                  attempt: int = 0) -> float:
+        """
+        The server throttled or failed a request to `host`: slow down
+        :param retry_after: seconds asked by the server, if any
+        :param attempt: how many times this request has been retried
+        :return: seconds the host is paused
+        """
+        if retry_after is None:
+            backoff = min(self.max_backoff, BACKOFF_BASE * 2 ** attempt)
+            delay = backoff * random.uniform(0.5, 1.5)
+        else:
+            delay = min(self.max_retry_after, retry_after)
+        with self._lock:
+            state = self._host(host)
+            state.rate = max(self.min_rate, state.rate * RATE_DECREASE_FACTOR)
+            state.streak = 0
+            state.tokens = min(state.tokens, 0.0)
+            state.blocked_until = max(state.blocked_until,
+                                      time.monotonic() + delay)
+        return delay
+
+    def succeeded(self, host: str) -> None:
+        """A request to `host` went well, speed up after a streak of them"""
+        with self._lock:
+            state = self._host(host)
+            state.streak += 1
+            if state.streak >= SUCCESS_STREAK and state.rate < self.max_rate:
+                state.rate = min(self.max_rate,
+                                 state.rate * RATE_INCREASE_FACTOR)
+                state.streak = 0
+
+    def current_rate(self, host: str) -> float:
+        """The rate currently allowed for `host`"""
+        with self._lock:
+            return self._host(host).rate
@@ -0,0 +1,114 @@
+# season.py
+
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from dataclasses import dataclass, field
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+from backend.archive import fetch_and_extract, fetch_archive_as
+from backend.matching import EPISODE_RE, episode_numbers
+from backend.ostdownloader import SubtitleSrtFile
+
+DEFAULT_PARALLEL_DOWNLOADS = 4
+
+SeasonProgressCallback = Callable[[int, int, "EpisodeDownload"], None]
+
+
+@dataclass
+class EpisodeDownload:
+    """Outcome of the download of one episode subtitles"""
+    srt_file: SubtitleSrtFile
+    media: str = ""
+    files: List[str] = field(default_factory=list)
+    size: int = 0
+    error: str = ""
+
+    def to_json(self) -> dict:
+        """JSON representation of the object"""
+        return {"srtfile": self.srt_file.to_json(), "media": self.media,
+                "files": self.files, "size": self.size, "error": self.error}
+
+
+def parse_episode_code(filename: str) -> Optional[Tuple[int, int]]:
+    """Return (season, episode) found in `filename` (S01E03 or 1x03)"""
+    match = EPISODE_RE.search(os.path.basename(filename))
+    return episode_numbers(match) if match else None
+
+
+def index_episode_media(folder: str,
+                        extensions: Tuple[str, ...]
+                        ) -> Dict[Tuple[int, int], str]:
+    """Map (season, episode) to the media files found in `folder`"""
+    retval = {}
+    try:
+        entries = list(os.scandir(folder))
+    except OSError:
+        return retval
+    for entry in entries:
+        if not entry.is_file() or not entry.name.lower().endswith(extensions):
+            continue
+        code = parse_episode_code(entry.name)
+        if code and code not in retval:
+            retval[code] = entry.path
+    return retval
+
+
+def download_episodes(srt_files: Iterable[SubtitleSrtFile], domain: str,
+                      outfolder: str,
+                      media_by_episode: Optional[
+                          Dict[Tuple[int, int], str]] = None,
+                      extract: bool = True, zip_prefix: str = "",
+                      workers: int = DEFAULT_PARALLEL_DOWNLOADS,
+                      progress: Optional[SeasonProgressCallback] = None,
+                      cancelled: Optional[threading.Event] = None
+                      ) -> List[EpisodeDownload]:
+    """
+    Download the subtitles of many episodes, at most `workers` at a time.
+
+    Rows without an episode number or a link (season headers) are skipped.
+    When `extract` is True and the episode has a matching media file in
+    `media_by_episode` the .srt is written next to it with the same name,
+    otherwise in `outfolder`. When `extract` is False the archives are saved
+    in `outfolder` named `zip_prefix` + SxxExx.
+
+    :param progress: called after each episode with the number of episodes
+                     done, the total and the episode outcome
+    :param cancelled: when set the episodes not started yet are skipped
+    :return: the outcome of every episode, in completion order
+    """
+    media_by_episode = media_by_episode or {}
+    episodes = [srt for srt in srt_files if srt.episode and srt.href]
+
+    def _download(srt: SubtitleSrtFile) -> EpisodeDownload:
+        result = EpisodeDownload(
+            srt_file=srt,
+            media=media_by_episode.get((srt.season, srt.episode), ""))
+        if cancelled is not None and cancelled.is_set():
+            result.error = "Cancelled"
+            return result
+        url = srt.href if srt.href.startswith('http') \
+            else srt.get_url(domain)
+        try:
+            if extract:
+                extracted = fetch_and_extract(url, outfolder,
+                                              rename_as=result.media)
+                result.files = [item.path for item in extracted]
+                result.size = sum(item.size for item in extracted)
+            else:
+                filename, result.size = fetch_archive_as(url, os.path.join(
+                    outfolder, f"{zip_prefix}{srt.episode_code}.zip"))
+                result.files = [filename]
+        except Exception as ex:
+            result.error = str(ex)
+        return result
+
+    retval = []
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = [executor.submit(_download, srt) for srt in episodes]
+        for future in as_completed(futures):
+            result = future.result()
+            retval.append(result)
+            if progress:
+                progress(len(retval), len(episodes), result)
+    return retval
@@ -0,0 +1,109 @@
+# singleflight.py
+
+import functools
+import threading
+from typing import Any, Callable, Dict, Hashable, Optional, Tuple
+
+from backend.metrics import get_metrics
+
+
+class CallerAbort(Exception):
+    """
+    Raised through the shared function when a callback of the leading caller
+    fails, see `private`: the error is the leader's own (e.g. its task was
+    cancelled), the other callers retry
+    """
+
+    def __init__(self, error: Exception):
+        super().__init__(error)
+        self.error = error
+
+
+def private(callback: Optional[Callable]) -> Optional[Callable]:
+    """
+    Wrap a callback that only belongs to the caller, like a progress that
+    raises to cancel: its exceptions don't fail the callers sharing the call
+    """
+    if callback is None:
+        return None
+
+    @functools.wraps(callback)
+    def _wrapped(*args, **kwargs):
+        try:
+            return callback(*args, **kwargs)
+        except Exception as ex:
+            raise CallerAbort(ex) from ex
+    return _wrapped
+
+
+class _Call:
+    """A call in flight, waited by the duplicate callers"""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.value: Any = None
+        self.error: Optional[Exception] = None
+        self.abandoned = False  # the leader stopped, nothing to share
+
+
+class SingleFlight:
+    """
+    Coalesces concurrent calls for the same key: the first caller runs the
+    function, the others arriving before it returns wait and get its
+    outcome, value or exception. Nothing is kept once the call returns, this
+    is not a cache. Duplicates are counted in the `coalesced` metric,
+    labelled with `name`.
+
+    Only the errors of the function itself are shared: when the leader
+    stops on its own callback (see `private`) or on a BaseException like
+    KeyboardInterrupt, the waiting callers start over and one of them
+    leads the new call.
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self._lock = threading.Lock()
+        self._calls: Dict[Hashable, _Call] = {}
+
+    def do(self, key: Hashable, func: Callable[[], Any]) -> Tuple[Any, bool]:
+        """
+        Run `func`, or wait for the call in flight for `key`
+        :return: the value and True if it was shared with another caller,
+                 in which case it must not be modified
+        """
+        while True:
+            with self._lock:
+                call = self._calls.get(key)
+                leader = call is None
+                if leader:
+                    call = self._calls[key] = _Call()
+            if leader:
+                break
+            get_metrics().inc('coalesced', group=self.name)
+            call.done.wait()
+            if call.abandoned:
+                continue
+            if call.error is not None:
+                raise call.error
+            return call.value, True
+        try:
+            call.value = func()
+        except CallerAbort as ex:
+            call.abandoned = True
+            raise ex.error from None
+        except Exception as ex:
+            call.error = ex
+            raise
+        except BaseException:
+            call.abandoned = True
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+        return call.value, False
+
+    def in_flight(self) -> int:
+        """Number of calls running"""
+        with self._lock:
+            return len(self._calls)
@@ -0,0 +1,311 @@
+# store.py
+
+import errno
+import hashlib
+import os
+import shutil
+import sqlite3
+import stat
+import threading
+import time
+import zipfile
+from dataclasses import dataclass
+from typing import Iterable, List, Optional
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+from backend.cache import normalize_url
+from backend.metrics import get_metrics
+from backend.ostdownloader import download_srt_archive, ProgressCallback, \
+    MAX_ARCHIVE_BYTES
+
+DEFAULT_MAX_BYTES = 200 * 1024 * 1024
+FICLONE = 0x40049409  # Linux ioctl, copy-on-write clone of a whole file
+COPY_BUFFER_SIZE = 64 * 1024
+KIND_ARCHIVE = 'archive'
+KIND_SRT = 'srt'
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS objects (
+    hash TEXT PRIMARY KEY,
+    kind TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    accessed_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS urls (
+    url TEXT PRIMARY KEY,
+    archive TEXT NOT NULL,
+    fetched_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS members (
+    archive TEXT NOT NULL,
+    ext TEXT NOT NULL,
+    position INTEGER NOT NULL,
+    member TEXT NOT NULL,
+    srt TEXT NOT NULL,
+    PRIMARY KEY (archive, ext, position)
+);
+"""
+
+
+@dataclass
+class StoredMember:
+    """A subtitle file of an archive, stored by content hash"""
+    member: str
+    digest: str
+    size: int
+
+
+def _temp_name(target: str) -> str:
+    """Temporary name of `target`, unique across threads and processes"""
+    return f"{target}.{os.getpid()}.{threading.get_ident()}.part"
+
+
+def _clone(src: str, dst: str) -> None:
+    """Copy-on-write clone of `src`, raise OSError where not supported"""
+    if fcntl is None:
+        raise OSError(errno.EOPNOTSUPP, "reflink not supported")
+    with open(src, 'rb') as fsrc, open(dst, 'wb') as fdst:
+        fcntl.ioctl(fdst.fileno(), FICLONE, fsrc.fileno())
+
+
+class SubtitleStore:
+    """
+    Content-addressed store of the downloaded archives and of the subtitle
+    files extracted from them: every object is saved once, named by the
+    sha256 of its content, and the source urls and archive members point
+    to the objects. A url already fetched costs no request, a subtitle
+    already extracted is placed next to a media file as a reflink
+    (copy-on-write clone) or a hardlink, falling back to a copy.
+
+    Objects are read-only, so that editing a hardlinked subtitle in place
+    can't corrupt the store: a hardlinked file is read-only too, use
+    `writable` when the placed files must be editable. When the store grows
+    beyond `max_bytes` the least recently used objects are deleted.
+    """
+
+    def __init__(self, path: str, max_bytes: int = DEFAULT_MAX_BYTES,
+                 writable: bool = False):
+        """
+        :param path: folder of the store, created if missing
+        :param max_bytes: size cap of the stored objects
+        :param writable: place writable files, reflinks or copies but
+                         never hardlinks
+        """
+        self.path = path
+        self.max_bytes = max_bytes
+        self.writable = writable
+        self.objects_folder = os.path.join(path, 'objects')
+        os.makedirs(self.objects_folder, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(os.path.join(path, 'index.sqlite'),
+                                     check_same_thread=False)
+        with self._lock, self._conn:
+            self._conn.executescript(_SCHEMA)
+
+    def object_path(self, digest: str) -> str:
+        return os.path.join(self.objects_folder, digest[:2], digest)
+
+    def _has_object(self, digest: str) -> bool:
+        return os.path.exists(self.object_path(digest))
+
+    def _touch(self, digest: str) -> None:
+        with self._lock, self._conn:
+            self._conn.execute("UPDATE objects SET accessed_at = ? "
+                               "WHERE hash = ?", (time.time(), digest))
+
+    def put(self, data: bytes, kind: str) -> str:
+        """Store `data` if not there yet, return its hash"""
+        digest = hashlib.sha256(data).hexdigest()
+        target = self.object_path(digest)
+        if not os.path.exists(target):
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            temp = _temp_name(target)
+            with open(temp, 'wb') as fh:
+                fh.write(data)
+            os.chmod(temp, stat.S_IRUSR | stat.S_IRGRP | stat.S_IROTH)
+            os.replace(temp, target)
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO objects (hash, kind, size, "
+                "accessed_at) VALUES (?, ?, ?, ?)",
+                (digest, kind, len(data), time.time()))
+        return digest
+
+    def archive_for(self, url: str) -> Optional[str]:
+        """Hash of the archive downloaded from `url`, None if not stored"""
+        with self._lock:
+            row = self._conn.execute("SELECT archive FROM urls WHERE url = ?",
+                                     (normalize_url(url),)).fetchone()
+        if not row or not self._has_object(row[0]):
+            return None
+        self._touch(row[0])
+        return row[0]
+
+    def fetch_archive(self, url: str, max_bytes: int = MAX_ARCHIVE_BYTES,
+                      progress: Optional[ProgressCallback] = None) -> str:
+        """
+        Return the hash of the archive at `url`, downloading it only if the
+        url was never fetched (or its archive evicted)
+        """
+        metrics = get_metrics()
+        digest = self.archive_for(url)
+        if digest:
+            metrics.inc('store_lookups', result='hit')
+            return digest
+        metrics.inc('store_lookups', result='miss')
+        buffer = download_srt_archive(url, max_bytes=max_bytes,
+                                      progress=progress)
+        digest = self.put(buffer.getvalue(), KIND_ARCHIVE)
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO urls (url, archive, fetched_at) "
+                "VALUES (?, ?, ?)", (normalize_url(url), digest, time.time()))
+        self.gc(keep=(digest,))
+        return digest
+
+    def members(self, archive: str, ext: str = '.srt') -> List[StoredMember]:
+        """
+        The `ext` members of the stored `archive`, extracted into the store
+        the first time
+        """
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT m.member, m.srt, o.size FROM members m "
+                "JOIN objects o ON o.hash = m.srt "
+                "WHERE m.archive = ? AND m.ext = ? ORDER BY m.position",
+                (archive, ext)).fetchall()
+        stored = [StoredMember(member=member, digest=digest, size=size)
+                  for member, digest, size in rows]
+        if stored and all(self._has_object(item.digest) for item in stored):
+            for item in stored:
+                self._touch(item.digest)
+            return stored
+        stored = []
+        with zipfile.ZipFile(self.object_path(archive)) as zfh:
+            for info in zfh.infolist():
+                if info.is_dir() or not info.filename.lower().endswith(ext):
+                    continue
+                data = zfh.read(info)
+                stored.append(StoredMember(member=info.filename,
+                                           digest=self.put(data, KIND_SRT),
+                                           size=len(data)))
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM members WHERE archive = ? "
+                               "AND ext = ?", (archive, ext))
+            self._conn.executemany(
+                "INSERT INTO members (archive, ext, position, member, srt) "
+                "VALUES (?, ?, ?, ?, ?)",
+                [(archive, ext, pos, item.member, item.digest)
+                 for pos, item in enumerate(stored)])
+        self.gc(keep=[archive] + [item.digest for item in stored])
+        return stored
+
+    def place(self, digest: str, target: str,
+              writable: Optional[bool] = None) -> str:
+        """
+        Make the object `digest` available as `target`, replacing it:
+        reflink, else hardlink (read-only, as the stored object), else copy
+        :param writable: no hardlink, default `self.writable`
+        :return: 'reflink', 'hardlink' or 'copy'
+        """
+        writable = self.writable if writable is None else writable
+        src = self.object_path(digest)
+        temp = _temp_name(target)
+        method = ''
+        try:
+            _clone(src, temp)
+            method = 'reflink'
+        except OSError:
+            if os.path.exists(temp):
+                os.remove(temp)
+        if not method and not writable:
+            try:
+                os.link(src, temp)
+                method = 'hardlink'
+            except OSError:  # Another filesystem, or not supported
+                pass
+        if not method:
+            with open(src, 'rb') as fsrc, open(temp, 'wb') as fdst:
+                shutil.copyfileobj(fsrc, fdst, COPY_BUFFER_SIZE)
+            method = 'copy'
+        os.replace(temp, target)
+        if os.path.lexists(temp):
+            # `target` already was a hardlink of the object: rename() does
+            # nothing when both names are links of the same file
+            os.remove(temp)
+        get_metrics().inc('store_placed', method=method)
+        return method
+
+    def total_size(self) -> int:
+        """Bytes used by the stored objects"""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT COALESCE(SUM(size), 0) FROM objects").fetchone()
+        return row[0]
+
+    def gc(self, keep: Iterable[str] = ()) -> int:
+        """
+        Delete the least recently used objects until under `max_bytes`, and
+        the urls and members pointing to them
+        :param keep: hashes of the objects in use, never deleted
+        :return: bytes freed
+        """
+        keep = set(keep)
+        freed = 0
+        with self._lock, self._conn:
+            total = self._conn.execute(
+                "SELECT COALESCE(SUM(size), 0) FROM objects").fetchone()[0]
+            if total <= self.max_bytes:
+                return 0
+            rows = self._conn.execute(
+                "SELECT hash, size FROM objects "
+                "ORDER BY accessed_at").fetchall()
+            for digest, size in rows:
+                if total - freed <= self.max_bytes:
+                    break
+                if digest in keep:
+                    continue
+                try:
+                    os.remove(self.object_path(digest))
+                except FileNotFoundError:
+                    pass
+                self._conn.execute("DELETE FROM objects WHERE hash = ?",
+                                   (digest,))
+                self._conn.execute("DELETE FROM urls WHERE archive = ?",
+                                   (digest,))
+                # An archive missing a member is extracted again
+                self._conn.execute(
+                    "DELETE FROM members WHERE archive = ? OR archive IN "
+                    "(SELECT archive FROM members WHERE srt = ?)",
+                    (digest, digest))
+                freed += size
+        get_metrics().inc('store_freed_bytes', freed)
+        return freed
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+
+_store: Optional[SubtitleStore] = None
+
+
+def get_store() -> Optional[SubtitleStore]:
+    """Return the shared subtitle store, None if disabled"""
+    return _store
+
+
+def configure_store(path: Optional[str], **kwargs) -> Optional[SubtitleStore]:
+    """
+    Enable the shared subtitle store in the folder `path` (see
+    `SubtitleStore` for `kwargs`), or disable it if `path` is None.
+    """
+    global _store
+    if _store is not None:
+        _store.close()
+    _store = SubtitleStore(path, **kwargs) if path else None
+    return _store
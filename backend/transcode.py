@@ -0,0 +1,257 @@
+# transcode.py
+
+"""
+Bulk extraction of subtitle archives on a process pool, every .srt member
+streamed to UTF-8 whatever its encoding. This module imports only the
+standard library (and charset_normalizer if installed) so that the worker
+processes start fast.
+"""
+
+import codecs
+import io
+import os
+import time
+import zipfile
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, field
+from typing import BinaryIO, Callable, Iterator, List, Optional, Tuple
+
+try:
+    from charset_normalizer import from_bytes
+except ImportError:  # Optional, cp1252 is assumed for the non UTF-8 files
+    from_bytes = None
+
+from backend.metrics import get_metrics
+
+DETECT_SAMPLE_SIZE = 64 * 1024
+READ_CHUNK_SIZE = 64 * 1024
+FALLBACK_ENCODINGS = ('cp1252', 'latin-1')  # latin-1 decodes anything
+
+
+@dataclass
+class TranscodedFile:
+    """A subtitle member written as UTF-8"""
+    member: str
+    path: str
+    encoding: str       # the source encoding
+    had_bom: bool
+    bytes_in: int
+    bytes_out: int
+    seconds: float
+    attempts: int = 1   # encodings tried, a wrong guess costs a rewind
+
+    def to_json(self) -> dict:
+        """JSON representation of the object"""
+        return {"member": self.member, "path": self.path,
+                "encoding": self.encoding, "had_bom": self.had_bom,
+                "bytes_in": self.bytes_in, "bytes_out": self.bytes_out,
+                "seconds": round(self.seconds, 4), "attempts": self.attempts}
+
+
+@dataclass
+class ArchiveReport:
+    """Outcome of the extraction of one archive"""
+    archive: str
+    files: List[TranscodedFile] = field(default_factory=list)
+    seconds: float = 0.0
+    error: str = ""
+
+    @property
+    def ok(self) -> bool:
+        return not self.error
+
+    @property
+    def bytes_in(self) -> int:
+        return sum(item.bytes_in for item in self.files)
+
+    @property
+    def bytes_out(self) -> int:
+        return sum(item.bytes_out for item in self.files)
+
+    def to_json(self) -> dict:
+        """JSON representation of the object"""
+        retval = {"archive": self.archive, "seconds": round(self.seconds, 4),
+                  "bytes_in": self.bytes_in, "bytes_out": self.bytes_out,
+                  "files": [item.to_json() for item in self.files]}
+        if self.error:
+            retval['error'] = self.error
+        return retval
+
+
+def _bom_encoding(head: bytes) -> Optional[str]:
+    """The codec consuming the byte order mark `head` starts with, if any"""
+    if head.startswith(codecs.BOM_UTF8):
+        return 'utf-8-sig'
+    if head.startswith((codecs.BOM_UTF16_LE, codecs.BOM_UTF16_BE)):
+        return 'utf-16'
+    return None
+
+
+def _guess_encoding(head: bytes) -> Optional[str]:
+    """
+    The charset_normalizer guess if it recognizes a language in `head`, and
+    unless a fallback encoding fits as well: on short samples the close
+    code pages (cp1250, cp1257...) tie with cp1252
+    """
+    if from_bytes is None:
+        return None
+    matches = list(from_bytes(head))
+    if not matches or not matches[0].coherence:
+        return None
+    best = matches[0]
+    fallbacks = {codecs.lookup(name).name for name in FALLBACK_ENCODINGS}
+    for match in matches:
+        if (match.chaos, match.coherence) != (best.chaos, best.coherence):
+            break
+        if codecs.lookup(match.encoding).name in fallbacks:
+            return None
+    guess = codecs.lookup(best.encoding).name
+    return None if guess == 'ascii' else guess
+
+
+def candidate_encodings(head: bytes) -> Iterator[str]:
+    """
+    Encodings to try on a file starting with `head`, most likely first:
+    the byte order mark, else UTF-8 unless `head` already isn't, then the
+    charset_normalizer guess and the fallbacks.
+    """
+    bom = _bom_encoding(head)
+    if bom:
+        yield bom
+        return
+    tried = set()
+    try:
+        codecs.getincrementaldecoder('utf-8')().decode(head, final=False)
+        tried.add('utf-8')
+        yield 'utf-8'
+    except UnicodeDecodeError:
+        pass
+    guess = _guess_encoding(head)
+    if guess and guess not in tried:
+        tried.add(guess)
+        yield guess
+    for encoding in FALLBACK_ENCODINGS:
+        if codecs.lookup(encoding).name not in tried:
+            yield encoding
+
+
+def transcode_stream(open_src: Callable[[], BinaryIO], target: str,
+                     newline: Optional[str] = '\n',
+                     strip_bom: bool = True) -> TranscodedFile:
+    """
+    Stream the text returned by `open_src` into `target` as UTF-8, chunk by
+    chunk, through a temporary file. If the chosen encoding turns out to be
+    wrong past the detection sample the source is opened again and the next
+    candidate tried (see `candidate_encodings`).
+
+    :param open_src: opens the source, binary, from the start
+    :param newline: line ending of `target`, '\\n' or '\\r\\n'; None keeps
+                    the line endings as they are
+    :param strip_bom: if False a byte order mark is written back, in UTF-8
+    :return: the file written, `member` left empty
+    """
+    start = time.perf_counter()
+    with open_src() as src:
+        head = src.read(DETECT_SAMPLE_SIZE)
+    had_bom = _bom_encoding(head) is not None
+    temp = target + '.part'
+    attempts = 0
+    for encoding in candidate_encodings(head):
+        attempts += 1
+        try:
+            bytes_in, bytes_out = _transcode(
+                open_src, temp, encoding, newline,
+                write_bom=had_bom and not strip_bom)
+            break
+        except UnicodeDecodeError:
+            continue
+    else:  # Only a file with a byte order mark can get here
+        os.remove(temp)
+        raise ValueError(f"Not a valid {encoding} file")
+    os.replace(temp, target)
+    return TranscodedFile(member="", path=target, encoding=encoding,
+                          had_bom=had_bom, bytes_in=bytes_in,
+                          bytes_out=bytes_out,
+                          seconds=time.perf_counter() - start,
+                          attempts=attempts)
+
+
+def _transcode(open_src: Callable[[], BinaryIO], temp: str, encoding: str,
+               newline: Optional[str],
+               write_bom: bool) -> Tuple[int, int]:
+    """One pass of `transcode_stream`, return bytes read and written"""
+    # newline=None translates every line ending to '\n' while reading,
+    # newline='' leaves them alone
+    read_newline = None if newline else ''
+    with open_src() as raw, open(temp, 'wb') as dst:
+        src = io.TextIOWrapper(raw, encoding=encoding, errors='strict',
+                               newline=read_newline)
+        out = io.TextIOWrapper(dst, encoding='utf-8', newline=newline or '')
+        if write_bom:
+            out.write('\ufeff')
+        while True:
+            chunk = src.read(READ_CHUNK_SIZE)
+            if not chunk:
+                break
+            out.write(chunk)
+        out.flush()
+        bytes_in, bytes_out = raw.tell(), dst.tell()
+        out.detach()
+        src.detach()
+    return bytes_in, bytes_out
+
+
+def extract_archive(archive: str, outfolder: Optional[str] = None,
+                    ext: str = '.srt', newline: Optional[str] = '\n',
+                    strip_bom: bool = True) -> ArchiveReport:
+    """
+    Extract every `ext` member of `archive` to `outfolder` (default: the
+    folder of the archive), created if missing, as UTF-8, see
+    `transcode_stream`. Errors are reported, not raised.
+    """
+    start = time.perf_counter()
+    report = ArchiveReport(archive=archive)
+    outfolder = outfolder or os.path.dirname(os.path.abspath(archive))
+    try:
+        os.makedirs(outfolder, exist_ok=True)
+        with zipfile.ZipFile(archive) as zfh:
+            for info in zfh.infolist():
+                if info.is_dir() or not info.filename.lower().endswith(ext):
+                    continue
+                # Only the file name, members can't escape `outfolder`
+                target = os.path.join(outfolder,
+                                      os.path.basename(info.filename))
+                result = transcode_stream(lambda: zfh.open(info), target,
+                                          newline, strip_bom)
+                result.member = info.filename
+                report.files.append(result)
+    except Exception as ex:  # Reported, the other archives go on
+        report.error = str(ex)
+    report.seconds = time.perf_counter() - start
+    return report
+
+
+def extract_archives(archives: List[str], outfolder: Optional[str] = None,
+                     ext: str = '.srt', newline: Optional[str] = '\n',
+                     strip_bom: bool = True,
+                     workers: Optional[int] = None) -> Iterator[ArchiveReport]:
+    """
+    Extract many archives on a pool of `workers` processes (default: one per
+    CPU), see `extract_archive`, and yield the reports in the order of
+    `archives`
+    """
+    metrics = get_metrics()
+    if outfolder:  # Once, not by each worker
+        os.makedirs(outfolder, exist_ok=True)
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = [pool.submit(extract_archive, archive, outfolder, ext,
+                               newline, strip_bom) for archive in archives]
+        for future in futures:
+            report = future.result()
+            # The workers have their own metrics, counted here
+            metrics.observe('stage_seconds', report.seconds, stage='extract')
+            metrics.inc('extracted_files', len(report.files))
+            metrics.inc('bytes_extracted', report.bytes_out)
+            for item in report.files:
+                metrics.inc('transcoded_files', encoding=item.encoding)
+            yield report
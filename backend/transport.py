@@ -0,0 +1,140 @@
+# transport.py
+
+from typing import Dict, Optional, Tuple, Union
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from backend.metrics import get_metrics
+from backend.ratelimit import RateLimiter, parse_retry_after, \
+    DEFAULT_RATE, DEFAULT_BURST, DEFAULT_MAX_RETRY_AFTER
+
+DEFAULT_POOL_SIZE = 10
+DEFAULT_CONNECT_TIMEOUT = 5.0
+DEFAULT_READ_TIMEOUT = 30.0
+DEFAULT_RETRIES = 3
+DEFAULT_BACKOFF_FACTOR = 0.5
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+DEFAULT_HEADERS = {
+    'Accept-Encoding': 'gzip, deflate',
+    'Connection': 'keep-alive',
+}
+
+
+class HttpTransport:
+    """
+    Owns a pooled, keep-alive `requests.Session` shared by every request
+    made against opensubtitles.org, so that the TCP+TLS handshake is paid
+    once per connection instead of once per request.
+
+    Every request goes through a `RateLimiter`; throttled (429) and failed
+    (5xx) responses are retried after the pause it decides. Connection and
+    read errors are retried by urllib3.
+    """
+
+    def __init__(self, pool_size: int = DEFAULT_POOL_SIZE,
+                 connect_timeout: float = DEFAULT_CONNECT_TIMEOUT,
+                 read_timeout: float = DEFAULT_READ_TIMEOUT,
+                 retries: int = DEFAULT_RETRIES,
+                 backoff_factor: float = DEFAULT_BACKOFF_FACTOR,
+                 headers: Optional[Dict[str, str]] = None,
+                 rate: float = DEFAULT_RATE, burst: int = DEFAULT_BURST,
+                 max_retry_after: float = DEFAULT_MAX_RETRY_AFTER,
+                 limiter: Optional[RateLimiter] = None):
+        """
+        :param pool_size: max number of connections kept alive for each host
+        :param connect_timeout: seconds to wait for the connection
+        :param read_timeout: seconds to wait between bytes sent by the server
+        :param retries: how many times a failed request is retried
+        :param backoff_factor: sleep between retries, see `urllib3.Retry`
+        :param headers: extra headers sent with every request
+        :param rate: requests per second allowed for each host
+        :param burst: requests allowed at once before the rate applies
+        :param max_retry_after: longest pause honored from a Retry-After
+        :param limiter: use this limiter instead of building one from
+                        `rate`, `burst` and `max_retry_after`, to share it
+                        between transports
+        """
+        self.pool_size = pool_size
+        self.timeout: Tuple[float, float] = (connect_timeout, read_timeout)
+        self.retries = retries
+        self.limiter = limiter or RateLimiter(
+            rate=rate, burst=burst, max_retry_after=max_retry_after)
+        # Throttling statuses are handled by the limiter, not by urllib3
+        self.retry = Retry(
+            total=retries,
+            connect=retries,
+            read=retries,
+            status=0,
+            backoff_factor=backoff_factor,
+            allowed_methods=frozenset(['GET', 'HEAD']),
+            raise_on_status=False,
+        )
+        self.session = requests.Session()
+        self.session.headers.update(DEFAULT_HEADERS)
+        if headers:
+            self.session.headers.update(headers)
+        adapter = HTTPAdapter(pool_connections=pool_size,
+                              pool_maxsize=pool_size,
+                              max_retries=self.retry)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+
+    def get(self, url: str, stream: bool = False,
+            headers: Optional[Dict[str, str]] = None,
+            timeout: Union[float, Tuple[float, float], None] = None
+            ) -> requests.Response:
+        """
+        Issue a GET request through the pooled session, waiting for the
+        rate limiter and retrying throttled or failed responses
+        """
+        host = urlsplit(url).netloc
+        metrics = get_metrics()
+        attempt = 0
+        while True:
+            waited = self.limiter.acquire(host)
+            if waited:
+                metrics.observe('stage_seconds', waited, stage='ratelimit')
+            resp = self.session.get(url, stream=stream, headers=headers,
+                                    timeout=timeout or self.timeout)
+            metrics.inc('http_requests', status=resp.status_code)
+            if resp.status_code not in RETRY_STATUSES:
+                self.limiter.succeeded(host)
+                return resp
+            if attempt >= self.retries:
+                return resp
+            # The next acquire() waits for the pause decided by the limiter
+            self.limiter.throttled(
+                host, parse_retry_after(resp.headers.get('Retry-After')),
+                attempt)
+            resp.close()
+            attempt += 1
+
+    def close(self) -> None:
+        """Release every pooled connection"""
+        self.session.close()
+
+
+_transport: Optional[HttpTransport] = None
+
+
+def get_transport() -> HttpTransport:
+    """Return the shared transport, creating it with defaults if needed"""
+    global _transport
+    if _transport is None:
+        _transport = HttpTransport()
+    return _transport
+
+
+def configure_transport(**kwargs) -> HttpTransport:
+    """
+    Replace the shared transport with a new one built with `kwargs`
+    (see `HttpTransport`), closing the previous one.
+    """
+    global _transport
+    if _transport is not None:
+        _transport.close()
+    _transport = HttpTransport(**kwargs)
+    return _transport
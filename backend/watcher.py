@@ -0,0 +1,501 @@
+# watcher.py
+
+"""
+Watch-folder daemon: fetch the subtitles of the media files dropped in the
+media folders, as they arrive.
+
+From the project root:
+python -m backend.watcher --config frontend-gui/config.ini
+"""
+
+import argparse
+import ctypes
+import ctypes.util
+import os
+import select
+import signal
+import sqlite3
+import struct
+import sys
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Dict, Hashable, List, Optional, Tuple
+
+from backend.archive import srt_name_for_media
+from backend.library import HashCache, Lookups, MEDIA_EXTENSIONS, \
+    MediaResult, load_config, process_media_files, read_config, scan_media
+from backend.ostdownloader import SubtitledShow, SubtitleSrtFile, \
+    get_subtitles_for_show, search_show
+from backend.singleflight import SingleFlight
+
+DEFAULT_SETTLE = 10.0  # seconds a file must stay unchanged to be complete
+DEFAULT_BATCH_SIZE = 20
+DEFAULT_BATCH_WINDOW = 30.0  # seconds a complete file waits for others
+DEFAULT_WORKERS = 4
+DEFAULT_POLL_INTERVAL = 30.0
+DEFAULT_MAX_ATTEMPTS = 3
+DEFAULT_RETRY_DELAY = 3600.0  # a show not found may be subtitled later
+TICK = 1.0
+
+STATUS_PENDING = 'pending'
+STATUS_RUNNING = 'running'
+STATUS_DONE = 'done'
+STATUS_FAILED = 'failed'
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS queue (
+    path TEXT PRIMARY KEY,
+    status TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    changed_at REAL NOT NULL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    updated_at REAL NOT NULL,
+    error TEXT NOT NULL DEFAULT ''
+);
+CREATE INDEX IF NOT EXISTS queue_status ON queue (status);
+"""
+
+
+def has_subtitles(path: str) -> bool:
+    """True if there is a .srt file named as the media file `path`"""
+    return os.path.exists(srt_name_for_media(path))
+
+
+class WatchQueue:
+    """
+    Persistent SQLite queue of the media files seen by the watcher, so that
+    nothing is lost on a restart: files still being written, files waiting
+    for a lookup and failed lookups to retry.
+
+    A file is ready when its size and mtime didn't change for `settle`
+    seconds: copies and downloads in progress are not looked up.
+    """
+
+    def __init__(self, path: str, settle: float = DEFAULT_SETTLE,
+                 max_attempts: int = DEFAULT_MAX_ATTEMPTS,
+                 retry_delay: float = DEFAULT_RETRY_DELAY):
+        self.settle = settle
+        self.max_attempts = max_attempts
+        self.retry_delay = retry_delay
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        with self._lock, self._conn:
+            self._conn.executescript(_SCHEMA)
+            # Interrupted by the last shutdown
+            self._conn.execute("UPDATE queue SET status = ? WHERE status = ?",
+                               (STATUS_PENDING, STATUS_RUNNING))
+
+    def seen(self, path: str) -> bool:
+        """
+        Record that `path` was created or changed
+        :return: True if it was queued again or for the first time
+        """
+        if has_subtitles(path):
+            return False
+        try:
+            st = os.stat(path)
+        except OSError:  # Gone already
+            return False
+        now = time.time()
+        with self._lock, self._conn:
+            row = self._conn.execute(
+                "SELECT status, size, mtime_ns FROM queue WHERE path = ?",
+                (path,)).fetchone()
+            if row and row[1:] == (st.st_size, st.st_mtime_ns) and \
+                    row[0] != STATUS_DONE:
+                return False
+            if row and row[0] == STATUS_RUNNING:
+                return False
+            self._conn.execute(
+                "INSERT OR REPLACE INTO queue (path, status, size, mtime_ns, "
+                "changed_at, attempts, updated_at) "
+                "VALUES (?, ?, ?, ?, ?, 0, ?)",
+                (path, STATUS_PENDING, st.st_size, st.st_mtime_ns, now, now))
+        return True
+
+    def settled(self) -> Tuple[List[str], float]:
+        """
+        Check the files not complete yet
+        :return: the files ready for a lookup, and since when the oldest of
+                 them is ready (0 if none)
+        """
+        now = time.time()
+        ready, oldest = [], 0.0
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT path, size, mtime_ns, changed_at, status, updated_at "
+                "FROM queue WHERE status = ? OR (status = ? AND attempts < ?)",
+                (STATUS_PENDING, STATUS_FAILED,
+                 self.max_attempts)).fetchall()
+        for path, size, mtime_ns, changed_at, status, updated_at in rows:
+            if status == STATUS_FAILED and \
+                    updated_at + self.retry_delay > now:
+                continue
+            try:
+                st = os.stat(path)
+            except OSError:
+                self._forget(path)
+                continue
+            if has_subtitles(path):  # Fetched some other way meanwhile
+                self.finish(path)
+                continue
+            if (st.st_size, st.st_mtime_ns) != (size, mtime_ns):
+                with self._lock, self._conn:
+                    self._conn.execute(
+                        "UPDATE queue SET size = ?, mtime_ns = ?, "
+                        "changed_at = ? WHERE path = ?",
+                        (st.st_size, st.st_mtime_ns, now, path))
+                continue
+            if st.st_size and changed_at + self.settle <= now:
+                ready_at = updated_at + self.retry_delay \
+                    if status == STATUS_FAILED else changed_at + self.settle
+                oldest = min(oldest, ready_at) if oldest else ready_at
+                ready.append(path)
+        return ready, oldest
+
+    def claim(self, paths: List[str]) -> None:
+        """Mark `paths` as being looked up"""
+        with self._lock, self._conn:
+            self._conn.executemany(
+                "UPDATE queue SET status = ?, attempts = attempts + 1, "
+                "updated_at = ? WHERE path = ?",
+                [(STATUS_RUNNING, time.time(), path) for path in paths])
+
+    def finish(self, path: str, error: str = "") -> None:
+        """Save the outcome of the lookup of `path`"""
+        with self._lock, self._conn:
+            self._conn.execute(
+                "UPDATE queue SET status = ?, error = ?, updated_at = ? "
+                "WHERE path = ?",
+                (STATUS_FAILED if error else STATUS_DONE, error, time.time(),
+                 path))
+
+    def _forget(self, path: str) -> None:
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM queue WHERE path = ?", (path,))
+
+    def stats(self) -> Dict[str, int]:
+        """Number of files for each status"""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT status, COUNT(*) FROM queue GROUP BY status"
+            ).fetchall()
+        return dict(rows)
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+
+class BatchLookups(Lookups):
+    """
+    Lookups shared by the media files of a batch: the files with the same
+    search terms (versions of a movie or of an episode) are searched once,
+    and a show is listed once whatever the number of its media files
+    """
+
+    def __init__(self):
+        self._flights = SingleFlight('batch')
+        self._lock = threading.Lock()
+        self._done: Dict[Hashable, object] = {}
+
+    def _once(self, key: Hashable, func):
+        with self._lock:
+            if key in self._done:
+                return self._done[key]
+        value, _ = self._flights.do(key, func)
+        with self._lock:
+            self._done[key] = value
+        return value
+
+    def search_show(self, search_terms: str,
+                    root_search: str) -> List[SubtitledShow]:
+        return self._once(('search', search_terms, root_search),
+                          lambda: search_show(search_terms, root_search))
+
+    def get_subtitles_for_show(self, url: str) -> List[SubtitleSrtFile]:
+        return self._once(('show', url), lambda: get_subtitles_for_show(url))
+
+
+class PollingSource:
+    """Finds the new and changed media files by listing the roots"""
+
+    def __init__(self, roots: List[str],
+                 interval: float = DEFAULT_POLL_INTERVAL):
+        self.roots = roots
+        self.interval = interval
+        self._known = self._snapshot()
+        self._next = time.monotonic() + interval
+
+    def _snapshot(self) -> Dict[str, Tuple[int, int]]:
+        retval = {}
+        for root in self.roots:
+            for path in scan_media(root, MEDIA_EXTENSIONS):
+                try:
+                    st = os.stat(path)
+                except OSError:
+                    continue
+                retval[path] = (st.st_size, st.st_mtime_ns)
+        return retval
+
+    def poll(self, timeout: float) -> List[str]:
+        """Wait up to `timeout` seconds, return the paths changed"""
+        time.sleep(timeout)
+        if time.monotonic() < self._next:
+            return []
+        self._next = time.monotonic() + self.interval
+        current = self._snapshot()
+        changed = [path for path, stat in current.items()
+                   if self._known.get(path) != stat]
+        self._known = current
+        return changed
+
+    def close(self) -> None:
+        pass
+
+
+class InotifySource:
+    """
+    Linux inotify watches on every folder under the roots, through ctypes.
+    New folders are watched as they appear, and their media files reported.
+    """
+    IN_CLOSE_WRITE = 0x00000008
+    IN_MOVED_TO = 0x00000080
+    IN_CREATE = 0x00000100
+    IN_Q_OVERFLOW = 0x00004000
+    IN_IGNORED = 0x00008000
+    IN_ISDIR = 0x40000000
+    IN_NONBLOCK = 0o4000
+    IN_CLOEXEC = 0o2000000
+    MASK = IN_CLOSE_WRITE | IN_MOVED_TO | IN_CREATE
+    EVENT = struct.Struct('iIII')  # wd, mask, cookie, len, then the name
+    READ_SIZE = 64 * 1024
+
+    def __init__(self, roots: List[str]):
+        """Raise OSError if inotify is not available"""
+        if not sys.platform.startswith('linux'):
+            raise OSError("inotify is only available on Linux")
+        self.roots = roots
+        self._libc = ctypes.CDLL(ctypes.util.find_library('c'),
+                                 use_errno=True)
+        self._fd = self._libc.inotify_init1(self.IN_NONBLOCK |
+                                            self.IN_CLOEXEC)
+        if self._fd < 0:
+            errno = ctypes.get_errno()
+            raise OSError(errno, os.strerror(errno))
+        self._folders: Dict[int, str] = {}
+        try:
+            for root in roots:
+                self._watch_tree(root)
+        except OSError:
+            os.close(self._fd)
+            raise
+
+    def _watch(self, folder: str) -> None:
+        wd = self._libc.inotify_add_watch(self._fd, os.fsencode(folder),
+                                          self.MASK)
+        if wd < 0:  # ENOSPC: fs.inotify.max_user_watches reached
+            errno = ctypes.get_errno()
+            raise OSError(errno, f"{os.strerror(errno)}: {folder}")
+        self._folders[wd] = folder
+
+    def _watch_tree(self, root: str) -> None:
+        folders = [root]
+        while folders:
+            folder = folders.pop()
+            self._watch(folder)
+            try:
+                folders.extend(entry.path for entry in os.scandir(folder)
+                               if entry.is_dir(follow_symlinks=False))
+            except OSError as ex:
+                print(f"Unable to scan {folder}: {ex}")
+
+    def poll(self, timeout: float) -> List[str]:
+        """Wait up to `timeout` seconds, return the paths changed"""
+        readable, _, _ = select.select([self._fd], [], [], timeout)
+        if not readable:
+            return []
+        try:
+            data = os.read(self._fd, self.READ_SIZE)
+        except BlockingIOError:
+            return []
+        changed = []
+        offset = 0
+        while offset < len(data):
+            wd, mask, _, length = self.EVENT.unpack_from(data, offset)
+            offset += self.EVENT.size
+            name = os.fsdecode(data[offset:offset + length].rstrip(b'\0'))
+            offset += length
+            if mask & self.IN_Q_OVERFLOW:  # Events lost: look everywhere
+                changed.extend(path for root in self.roots
+                               for path in scan_media(root, MEDIA_EXTENSIONS))
+                continue
+            if mask & self.IN_IGNORED:  # The folder is gone
+                self._folders.pop(wd, None)
+                continue
+            folder = self._folders.get(wd)
+            if folder is None:
+                continue
+            path = os.path.join(folder, name)
+            if mask & self.IN_ISDIR:
+                # Moved in or created with files in it already
+                try:
+                    self._watch_tree(path)
+                except OSError as ex:
+                    print(f"Unable to watch {path}: {ex}")
+                changed.extend(scan_media(path, MEDIA_EXTENSIONS))
+            elif name.lower().endswith(MEDIA_EXTENSIONS):
+                changed.append(path)
+        return changed
+
+    def close(self) -> None:
+        os.close(self._fd)
+
+
+def open_source(roots: List[str], polling: bool = False,
+                interval: float = DEFAULT_POLL_INTERVAL):
+    """The inotify source if available and not `polling`, else polling"""
+    if not polling:
+        try:
+            return InotifySource(roots)
+        except (OSError, AttributeError) as ex:  # No inotify_init1 in libc
+            print(f"inotify unavailable ({ex}), polling every {interval}s")
+    return PollingSource(roots, interval)
+
+
+class Watcher:
+    """
+    Feeds the media files appearing under the roots to the queue and looks
+    up the complete ones in batches, one batch at a time with `workers`
+    files processed at once (see `process_media_files`). A batch starts when
+    `batch_size` files are ready or `batch_window` seconds after the first
+    of them is.
+    """
+
+    def __init__(self, roots: List[str], queue: WatchQueue, root_search: str,
+                 domain: str, workers: int = DEFAULT_WORKERS,
+                 batch_size: int = DEFAULT_BATCH_SIZE,
+                 batch_window: float = DEFAULT_BATCH_WINDOW,
+                 hash_cache: Optional[HashCache] = None,
+                 polling: bool = False,
+                 poll_interval: float = DEFAULT_POLL_INTERVAL):
+        self.roots = [os.path.abspath(root) for root in roots]
+        self.queue = queue
+        self.root_search = root_search
+        self.domain = domain
+        self.workers = workers
+        self.batch_size = batch_size
+        self.batch_window = batch_window
+        self.hash_cache = hash_cache
+        self.polling = polling
+        self.poll_interval = poll_interval
+        self._executor = ThreadPoolExecutor(max_workers=1,
+                                            thread_name_prefix='batch')
+        self._batch: Optional[Future] = None
+
+    def scan(self) -> int:
+        """Queue the media files already under the roots without subtitles"""
+        return sum(self.queue.seen(path) for root in self.roots
+                   for path in scan_media(root, MEDIA_EXTENSIONS))
+
+    def run(self, stop: threading.Event) -> None:
+        """Watch until `stop` is set, then wait for the running batch"""
+        source = open_source(self.roots, self.polling, self.poll_interval)
+        print(f"Watching {', '.join(self.roots)} "
+              f"({type(source).__name__}), queue: {self.queue.stats()}")
+        try:
+            while not stop.is_set():
+                for path in source.poll(TICK):
+                    if self.queue.seen(path):
+                        print(f"Queued {path}")
+                self._maybe_start_batch()
+        finally:
+            source.close()
+            self._executor.shutdown(wait=True)
+
+    def _maybe_start_batch(self) -> None:
+        if self._batch is not None and not self._batch.done():
+            return
+        ready, oldest = self.queue.settled()
+        if not ready or (len(ready) < self.batch_size and
+                         oldest + self.batch_window > time.time()):
+            return
+        paths = ready[:self.batch_size]
+        self.queue.claim(paths)
+        self._batch = self._executor.submit(self._run_batch, paths)
+
+    def _run_batch(self, paths: List[str]) -> None:
+        print(f"Looking up {len(paths)} media files")
+        # Media files of the same series next to each other
+        paths = sorted(paths)
+        for result in process_media_files(paths, self.root_search,
+                                          self.domain, self.workers,
+                                          self.hash_cache,
+                                          lookups=BatchLookups()):
+            self._finish(result)
+
+    def _finish(self, result: MediaResult) -> None:
+        if result.error:
+            print(f"FAILED {result.path}: {result.error}")
+        else:
+            print(f"OK ({result.matched_by}) {result.path}: "
+                  f"{result.srt_file.name}")
+        self.queue.finish(result.path, result.error)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Fetch the subtitles of the media files added to the "
+                    "media folders")
+    parser.add_argument('--config', default='config.ini',
+                        help="the GUI configuration file")
+    parser.add_argument('--root', action='append',
+                        help="media folder to watch, can be repeated, "
+                             "default is the 'roots' option of the "
+                             "'watcher' section or 'default_media_folder'")
+    parser.add_argument('--scan', action='store_true',
+                        help="queue the media files without subtitles "
+                             "already there")
+    parser.add_argument('--poll', action='store_true',
+                        help="list the folders periodically, no inotify")
+    args = parser.parse_args()
+    ini = load_config(args.config)
+    media_folder, _, root_search, domain = read_config(ini)
+    roots = args.root or [root.strip() for root in ini.get(
+        'watcher', 'roots', fallback=media_folder).split(',') if root.strip()]
+    queue = WatchQueue(
+        ini.get('watcher', 'queue', fallback='watcher.sqlite'),
+        settle=ini.getfloat('watcher', 'settle', fallback=DEFAULT_SETTLE),
+        max_attempts=ini.getint('watcher', 'max_attempts',
+                                fallback=DEFAULT_MAX_ATTEMPTS),
+        retry_delay=ini.getfloat('watcher', 'retry_delay',
+                                 fallback=DEFAULT_RETRY_DELAY))
+    hash_cache = HashCache(ini.get('watcher', 'hash_cache',
+                                   fallback='moviehashes.sqlite'))
+    watcher = Watcher(
+        roots, queue, root_search, domain,
+        workers=ini.getint('watcher', 'workers', fallback=DEFAULT_WORKERS),
+        batch_size=ini.getint('watcher', 'batch_size',
+                              fallback=DEFAULT_BATCH_SIZE),
+        batch_window=ini.getfloat('watcher', 'batch_window',
+                                  fallback=DEFAULT_BATCH_WINDOW),
+        hash_cache=hash_cache,
+        polling=args.poll or ini.getboolean('watcher', 'polling',
+                                            fallback=False),
+        poll_interval=ini.getfloat('watcher', 'poll_interval',
+                                   fallback=DEFAULT_POLL_INTERVAL))
+    if args.scan:
+        print(f"{watcher.scan()} media files queued")
+    stop = threading.Event()
+    for signum in (signal.SIGINT, signal.SIGTERM):
+        signal.signal(signum, lambda *_: stop.set())
+    watcher.run(stop)
+    print(f"Stopped, queue: {queue.stats()}")
+    queue.close()
+    hash_cache.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,212 @@
+# bench_backend.py
+
+"""
+Benchmarks of the backend parsers and of the end-to-end fetch against the
+local stand-in server.
+
+For every page type it reports the parse time, the peak memory allocated
+while parsing and the end-to-end latency of the public function. Results
+can be saved as JSON and compared with a previous run, e.g. the one of the
+parent commit:
+
+    python -m benchmarks.bench_backend --output before.json
+    (checkout another commit)
+    python -m benchmarks.bench_backend --compare before.json
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from typing import Callable, Dict, List
+
+import backend.cache as cache
+import backend.ostdownloader as ost
+import backend.transport as transport
+from backend.archive import extract_srt_members
+from benchmarks.standin_server import FIXTURES_FOLDER, start_server
+
+DEFAULT_RUNS = 20
+DEFAULT_THRESHOLD = 0.10
+# page type -> fixture, parse function, targets, path on the server
+PAGES = {
+    'search': ('search_results.html', ost._parse_search_page,
+               ost.SEARCH_PAGE_TARGETS,
+               '/en/search2/sublanguageid-eng/moviename-show'),
+    'movie': ('movie.html', ost._parse_show_page, ost.SHOW_PAGE_TARGETS,
+              '/en/search/sublanguageid-eng/idmovie-1'),
+    'episode': ('episode.html', ost._parse_show_page,
+                ost.SHOW_PAGE_TARGETS,
+                '/en/search/sublanguageid-eng/idmovie-2'),
+    'tvseries': ('tvseries.html', ost._parse_show_page,
+                 ost.SHOW_PAGE_TARGETS,
+                 '/en/search/sublanguageid-eng/idmovie-3'),
+}
+# Lower is better for every metric
+METRICS = ('parse_ms', 'peak_kib', 'e2e_ms')
+
+
+def _timeit(func: Callable[[], object], runs: int) -> List[float]:
+    """Milliseconds taken by each of `runs` calls of `func`"""
+    timings = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        func()
+        timings.append((time.perf_counter() - start) * 1000)
+    return timings
+
+
+def _peak_kib(func: Callable[[], object]) -> float:
+    """Peak memory allocated by a call of `func`, in KiB"""
+    tracemalloc.start()
+    try:
+        func()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return peak / 1024
+
+
+def _git_commit() -> str:
+    try:
+        return subprocess.check_output(
+            ['git', 'rev-parse', '--short', 'HEAD'],
+            stderr=subprocess.DEVNULL, text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return ""
+
+
+def bench_parsers(runs: int) -> Dict[str, dict]:
+    results = {}
+    for page_type, (fixture, parse, targets, _) in PAGES.items():
+        with open(os.path.join(FIXTURES_FOLDER, fixture),
+                  encoding='utf-8') as fh:
+            html = fh.read()
+
+        def _parse():
+            return ost._parse_text(html, parse, targets)
+
+        items = _parse()
+        timings = _timeit(_parse, runs)
+        results[page_type] = {
+            'items': len(items),
+            'parser': ost.HTML_PARSER,
+            'parse_ms': statistics.median(timings),
+            'parse_ms_min': min(timings),
+            'peak_kib': _peak_kib(_parse),
+        }
+    return results
+
+
+def bench_end_to_end(results: Dict[str, dict], base_url: str,
+                     runs: int) -> None:
+    for page_type, (_, _, _, path) in PAGES.items():
+        if page_type == 'search':
+            root_search, terms = (base_url + path).rsplit('-', 1)
+            call = lambda: ost.search_show(terms, root_search + '-')
+        else:
+            call = lambda: ost.get_subtitles_for_show(base_url + path)
+        timings = _timeit(call, runs)
+        results[page_type]['e2e_ms'] = statistics.median(timings)
+
+    def _download():
+        buffer = ost.download_srt_archive(base_url + '/download/sub/1')
+        extract_srt_members(buffer, download_folder)
+
+    with tempfile.TemporaryDirectory() as download_folder:
+        timings = _timeit(_download, runs)
+        results['download'] = {'e2e_ms': statistics.median(timings),
+                               'peak_kib': _peak_kib(_download)}
+
+
+def run(runs: int, latency: float, srt_kb: int) -> dict:
+    # Measure the code, not the cache or the rate limiter
+    cache.configure_cache(None)
+    transport.configure_transport(rate=1000, burst=1000)
+    server, base_url = start_server(latency=latency, srt_kb=srt_kb)
+    try:
+        results = bench_parsers(runs)
+        with contextlib.redirect_stdout(io.StringIO()):
+            bench_end_to_end(results, base_url, runs)
+    finally:
+        server.shutdown()
+    return {
+        'commit': _git_commit(),
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'python': platform.python_version(),
+        'runs': runs,
+        'latency': latency,
+        'srt_kb': srt_kb,
+        'results': results,
+    }
+
+
+def print_report(report: dict, baseline: dict = None,
+                 threshold: float = DEFAULT_THRESHOLD) -> bool:
+    """Print the results, compared with `baseline` if given"""
+    title = f"commit {report['commit'] or '?'}"
+    if baseline:
+        title += f" vs {baseline['commit'] or '?'}"
+    print(title)
+    print(f"{'page':<10}{'metric':<10}{'value':>12}{'baseline':>12}"
+          f"{'delta':>9}")
+    regressed = False
+    for page_type, values in report['results'].items():
+        for metric in METRICS:
+            if metric not in values:
+                continue
+            value = values[metric]
+            line = f"{page_type:<10}{metric:<10}{value:>12.2f}"
+            base = (baseline or {}).get('results', {}) \
+                .get(page_type, {}).get(metric)
+            if base:
+                delta = (value - base) / base
+                flag = ''
+                if delta > threshold:
+                    flag = ' REGRESSION'
+                    regressed = True
+                line += f"{base:>12.2f}{delta:>+9.1%}{flag}"
+            print(line)
+    return not regressed
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Benchmark the backend parsers and fetch path")
+    parser.add_argument('--runs', type=int, default=DEFAULT_RUNS)
+    parser.add_argument('--latency', type=float, default=0.0,
+                        help="seconds the stand-in server waits before "
+                             "every response")
+    parser.add_argument('--srt-kb', type=int, default=60,
+                        help="size of the .srt file in the zip payload")
+    parser.add_argument('--parser', help="BeautifulSoup tree builder, "
+                                         "default is the fastest available")
+    parser.add_argument('--output', help="save the results as JSON")
+    parser.add_argument('--compare', help="JSON results of a previous run")
+    parser.add_argument('--threshold', type=float, default=DEFAULT_THRESHOLD,
+                        help="relative slowdown reported as a regression")
+    args = parser.parse_args()
+    if args.parser:
+        ost.set_html_parser(args.parser)
+    report = run(args.runs, args.latency, args.srt_kb)
+    baseline = None
+    if args.compare:
+        with open(args.compare) as fh:
+            baseline = json.load(fh)
+    ok = print_report(report, baseline, args.threshold)
+    if args.output:
+        with open(args.output, 'w') as fh:
+            json.dump(report, fh, indent=2)
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == '__main__':
+    main()
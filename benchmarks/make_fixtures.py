@@ -0,0 +1,117 @@
+# make_fixtures.py
+
+"""
+Rebuild the HTML fixtures used by the benchmarks.
+
+The pages reproduce the markup of opensubtitles.org that the parsers rely
+on (search results table, schema.org Movie block, single episode table and
+complete TV series table), wrapped in the usual site navigation so that
+the whole-page parsing cost is realistic.
+"""
+
+import os
+
+FIXTURES_FOLDER = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                               'fixtures')
+NAV_LINKS = 400  # links in the page chrome around the content
+
+
+def _page(title: str, content: str) -> str:
+    nav = '\n'.join(
+        f'<li class="menu-item"><a href="/en/browse/{i}" title="Browse {i}">'
+        f'Category {i}</a> <span class="count">({i * 7})</span></li>'
+        for i in range(NAV_LINKS))
+    scripts = '\n'.join(
+        f'<script type="text/javascript">var slot{i} = {{"id": {i}, '
+        f'"sizes": [[300, 250], [728, 90]]}};</script>' for i in range(40))
+    return f"""<!DOCTYPE html>
+<html lang="en"><head><meta charset="utf-8"><title>{title}</title>
+{scripts}
+</head><body>
+<div id="header"><ul class="menu">{nav}</ul></div>
+<div class="content">
+{content}
+</div>
+<div id="footer"><ul class="menu">{nav}</ul></div>
+</body></html>
+"""
+
+
+def search_results(rows: int = 40) -> str:
+    items = []
+    for i in range(rows):
+        movie_id = 100000 + i
+        episode = f'[S{i % 9 + 1:02d}E{i % 20 + 1:02d}]' if i % 2 else ''
+        items.append(f"""<tr onclick="servOC({movie_id},'/en/search/sublanguageid-eng/idmovie-{movie_id}', '#DCF2B8')" id="name{movie_id}" class="change {'odd' if i % 2 else 'even'} expandable">
+<td id="main{movie_id}"><strong><a class="bnone" title="subtitles - Show {i}" href="/en/search/sublanguageid-eng/idmovie-{movie_id}">Show number {i}
+({1990 + i % 30})</a></strong>{episode}<br/>
+<a href="/en/search/sublanguageid-eng/idmovie-{movie_id}/hd-on">Watch online</a></td>
+<td><a href="/en/search/sublanguageid-eng/idmovie-{movie_id}">{i * 3}</a></td>
+<td>{i % 10}.{i % 7}</td>
+<td><a href="/en/search/imdbid-{movie_id}">IMDb</a></td>
+</tr>""")
+    return _page("Search results", '<table id="search_results">\n'
+                 '<thead><tr><th>Movie name</th><th>Subtitles</th>'
+                 '<th>Rating</th><th>IMDb</th></tr></thead>\n'
+                 + '\n'.join(items) + '\n</table>')
+
+
+def movie() -> str:
+    return _page("Movie", """<div itemscope itemtype="http://schema.org/Movie">
+<h1 itemprop="name">A movie (2010)</h1>
+<div class="msg"><a itemprop="url" title="Download"
+href="https://dl.opensubtitles.org/en/download/sub/5000001">A.Movie.2010.1080p.BluRay.x264-GROUP
+</a></div>
+<span itemprop="dateCreated">2010-01-01</span>
+</div>""")
+
+
+def episode(rows: int = 25) -> str:
+    items = []
+    for i in range(rows):
+        sub_id = 6000000 + i
+        items.append(f"""<tr onclick="servOC({sub_id},'/en/subtitles/{sub_id}', '#DCF2B8')" id="name{sub_id}" class="change {'odd' if i % 2 else 'even'} expandable">
+<td id="main{sub_id}"><strong><a class="bnone" href="/en/subtitles/{sub_id}">A Show - S02E05 - Episode title</a></strong><br/>Show.S02E05.720p.HDTV.x264-GRP{i} Watch online Download Subtitles Searcher</td>
+<td align="center"><a href="/en/search/sublanguageid-eng">English</a></td>
+<td align="center">1CD</td>
+<td>2015-03-0{i % 9 + 1}</td>
+<td><a href="/en/subtitleserve/sub/{sub_id}">{i * 11}x</a></td>
+<td>srt</td>
+</tr>""")
+    return _page("Episode", '<table id="search_results">\n'
+                 + '\n'.join(items) + '\n</table>')
+
+
+def tvseries(seasons: int = 10, episodes: int = 24) -> str:
+    items = []
+    for season in range(1, seasons + 1):
+        items.append(f"""<tr><td colspan="5"><span id="season-{season}"><b>Season {season}</b></span>
+<a itemprop="season" href="/en/ssearch/sublanguageid-eng/idmovie-7000/season-{season}"><meta itemprop="numberOfEpisodes" content="{episodes}"/></a>
+<a href="/download/s/sublanguageid-eng/pimdbid-7000/season-{season}">Download</a></td></tr>""")
+        for ep in range(1, episodes + 1):
+            items.append(f"""<tr itemprop="episode" itemscope itemtype="http://schema.org/TVEpisode">
+<td><span itemprop="episodeNumber">{ep}</span>. <a itemprop="url" href="/en/search/sublanguageid-eng/imdbid-{season * 100 + ep}">Episode {ep} of season {season}</a></td>
+<td>{ep * 3}</td>
+<td><a href="/download/s/sublanguageid-eng/pimdbid-7000/season-{season}/episode-{ep}">Download</a></td>
+<td>2010-0{season % 9 + 1}-{ep:02d}</td>
+<td>{ep % 5}</td>
+</tr>""")
+    return _page("TV series", '<table id="search_results" itemprop="season">\n'
+                 + '\n'.join(items) + '\n</table>')
+
+
+FIXTURES = {
+    'search_results.html': search_results,
+    'movie.html': movie,
+    'episode.html': episode,
+    'tvseries.html': tvseries,
+}
+
+
+if __name__ == '__main__':
+    os.makedirs(FIXTURES_FOLDER, exist_ok=True)
+    for filename, build in FIXTURES.items():
+        path = os.path.join(FIXTURES_FOLDER, filename)
+        with open(path, 'w') as fh:
+            fh.write(build())
+        print(f"{path}: {os.path.getsize(path)} bytes")
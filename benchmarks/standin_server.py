@@ -0,0 +1,130 @@
+# standin_server.py
+
+"""
+Local stand-in for opensubtitles.org serving the HTML fixtures and zip
+payloads, with a configurable latency, so the backend can be exercised and
+measured offline.
+
+Routes, by path:
+- .../moviename-<terms>[/offset-N]: search results page
+- .../idmovie-1: movie page
+- .../idmovie-2: single episode page
+- .../idmovie-3: complete TV series page
+- /download/...: a zip archive with one .srt file
+"""
+
+import argparse
+import io
+import os
+import threading
+import time
+import zipfile
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, Tuple
+
+FIXTURES_FOLDER = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                               'fixtures')
+ROUTES = (
+    ('moviename-', 'search_results.html'),
+    ('idmovie-1', 'movie.html'),
+    ('idmovie-2', 'episode.html'),
+    ('idmovie-3', 'tvseries.html'),
+)
+SRT_BLOCK = "{n}\n00:00:{s:02d},000 --> 00:00:{s:02d},900\n" \
+            "Subtitle line number {n}\n\n"
+
+
+def build_zip_payload(srt_kb: int) -> bytes:
+    """A zip archive holding one .srt file of about `srt_kb` KiB"""
+    lines = []
+    size = 0
+    n = 0
+    while size < srt_kb * 1024:
+        n += 1
+        line = SRT_BLOCK.format(n=n, s=n % 60)
+        lines.append(line)
+        size += len(line)
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, 'w', zipfile.ZIP_DEFLATED) as zfh:
+        zfh.writestr('Subtitle.srt', ''.join(lines))
+        zfh.writestr('Subtitle.nfo', 'Downloaded from the stand-in server')
+    return buffer.getvalue()
+
+
+def load_fixtures() -> Dict[str, bytes]:
+    pages = {}
+    for _, filename in ROUTES:
+        with open(os.path.join(FIXTURES_FOLDER, filename), 'rb') as fh:
+            pages[filename] = fh.read()
+    return pages
+
+
+class StandInHandler(BaseHTTPRequestHandler):
+    """Serves the fixtures, see the module docstring for the routes"""
+    latency = 0.0
+    pages: Dict[str, bytes] = {}
+    zip_payload = b''
+
+    def do_GET(self):
+        if self.latency:
+            time.sleep(self.latency)
+        if self.path.startswith('/download/'):
+            return self._send(self.zip_payload, 'application/zip')
+        for marker, filename in ROUTES:
+            if marker in self.path:
+                return self._send(self.pages[filename],
+                                  'text/html; charset=utf-8')
+        self.send_error(404)
+
+    def _send(self, body: bytes, content_type: str):
+        self.send_response(200)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_server(latency: float = 0.0, srt_kb: int = 60,
+                 port: int = 0) -> Tuple[ThreadingHTTPServer, str]:
+    """
+    Start the stand-in server in a background thread
+    :param latency: seconds waited before every response
+    :param srt_kb: size of the .srt file in the zip payload
+    :param port: 0 picks a free port
+    :return: the server (call `shutdown()` to stop it) and its base url
+    """
+    handler = type('Handler', (StandInHandler,), {
+        'latency': latency,
+        'pages': load_fixtures(),
+        'zip_payload': build_zip_payload(srt_kb),
+    })
+    server = ThreadingHTTPServer(('127.0.0.1', port), handler)
+    server.daemon_threads = True
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().split('\n')[0])
+    parser.add_argument('--port', type=int, default=8000)
+    parser.add_argument('--latency', type=float, default=0.0,
+                        help="seconds waited before every response")
+    parser.add_argument('--srt-kb', type=int, default=60,
+                        help="size of the .srt file in the zip payload")
+    args = parser.parse_args()
+    server, url = start_server(args.latency, args.srt_kb, args.port)
+    print(f"Serving on {url}, search url: "
+          f"{url}/en/search2/sublanguageid-{{}}/moviename-")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
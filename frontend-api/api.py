@@ -0,0 +1,220 @@
+# api.py
+
+"""
+Headless subtitle service: the search, show listing and download of
+subtitles over HTTP, for many clients sharing one response cache and one
+rate limited connection pool.
+
+Endpoints:
+- GET  /search?q=<terms>[&lang=eng,ita][&pages=N]: shows found
+- GET  /show?href=<show href>: subtitle files of a show
+- POST /downloads {"href": <srt href>, "extract": true}: queue a download,
+  202 with the job
+- GET  /downloads/<job_id>: status of a download job
+- GET  /downloads/<job_id>/files/<name>: a file of a completed job
+- GET  /stats: job and backend statistics (JSON)
+- GET  /metrics: backend metrics, Prometheus text format
+"""
+
+import argparse
+import logging
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor, \
+    TimeoutError as FutureTimeoutError
+from configparser import ConfigParser
+from itertools import islice
+from urllib.parse import urlsplit
+
+from flask import Flask, Response, abort, g, jsonify, request, \
+    send_from_directory
+from flask_cors import CORS
+
+# The backend lives in the parent folder
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import backend.config as backend_config
+from backend.jobs import DownloadJobs, DEFAULT_JOB_TTL, DEFAULT_JOB_WORKERS
+from backend.metrics import get_metrics
+from backend.ostdownloader import SubtitleException, get_subtitles_for_show, \
+    iter_search_pages
+
+DEFAULT_PORT = 5000
+DEFAULT_WORKERS = 8
+DEFAULT_MAX_PAGES = 1
+REQUEST_TIMEOUT = 120  # seconds a search or show listing may take
+
+
+def create_app(ini: ConfigParser) -> Flask:
+    """Build the service from the GUI config file and its `service` section"""
+    backend_config.configure_network(ini)
+    backend_config.configure_cache(ini)
+    backend_config.configure_store(ini)
+    domain = ini.get('parser', 'OST_DOMAIN')
+    search_url = ini.get('parser', 'OST_SEARCH_URL')
+    default_languages = ini.get('gui', 'selected_languages', fallback='eng')
+    # Bounds the searches and listings run at once, whatever the clients
+    pool = ThreadPoolExecutor(
+        max_workers=ini.getint('service', 'workers',
+                               fallback=DEFAULT_WORKERS),
+        thread_name_prefix='backend')
+    jobs = DownloadJobs(
+        os.path.abspath(ini.get('service', 'download_folder',
+                                fallback='downloads')),
+        workers=ini.getint('service', 'download_workers',
+                           fallback=DEFAULT_JOB_WORKERS),
+        ttl=ini.getint('service', 'job_ttl', fallback=DEFAULT_JOB_TTL))
+    started = time.time()
+    metrics = get_metrics()
+
+    app = Flask(__name__)
+    CORS(app)
+
+    # The site and its subdomains (dl.opensubtitles.org serves the files)
+    site = urlsplit(domain).hostname or ''
+    site = site[4:] if site.startswith('www.') else site
+
+    def _absolute(href: str) -> str:
+        """
+        Url of a show or subtitle file `href`: relative to the site, or an
+        url of the site. Anything else is a 400, the service doesn't fetch
+        arbitrary urls for its clients.
+        """
+        parts = urlsplit(href)
+        if not parts.scheme and not parts.netloc:
+            if not href.startswith('/'):
+                abort(400, description=f"Invalid href '{href}'")
+            return domain + href
+        host = parts.hostname or ''
+        if parts.scheme not in ('http', 'https') or \
+                not (host == site or host.endswith('.' + site)):
+            abort(400, description=f"Not a {site} url: '{href}'")
+        return href
+
+    def _run(func, *args):
+        """
+        Run `func` on the backend pool, a backend failure is a 502, a call
+        taking more than `REQUEST_TIMEOUT` a 504
+        """
+        try:
+            return pool.submit(func, *args).result(timeout=REQUEST_TIMEOUT)
+        except SubtitleException as ex:
+            abort(502, description=str(ex))
+        except FutureTimeoutError:
+            abort(504, description=f"No answer in {REQUEST_TIMEOUT}s")
+
+    @app.before_request
+    def _start_timer():
+        g.start = time.perf_counter()
+
+    @app.after_request
+    def _record(response):
+        if 'start' in g:
+            metrics.observe('request_seconds',
+                            time.perf_counter() - g.start,
+                            endpoint=request.endpoint or 'unknown')
+        metrics.inc('requests_served', status=response.status_code)
+        return response
+
+    @app.errorhandler(400)
+    @app.errorhandler(404)
+    @app.errorhandler(502)
+    @app.errorhandler(504)
+    def _error(ex):
+        return jsonify({"error": ex.description}), ex.code
+
+    @app.route('/search')
+    def search():
+        terms = request.args.get('q', '').strip()
+        if not terms:
+            abort(400, description="Missing search terms 'q'")
+        languages = request.args.get('lang', default_languages)
+        pages = request.args.get('pages', DEFAULT_MAX_PAGES, type=int)
+        root_search = search_url.format(languages)
+
+        def _search():
+            found = []
+            for shows in islice(iter_search_pages(terms, root_search),
+                                max(1, pages)):
+                found.extend(shows)
+            return found
+
+        try:
+            shows = _run(_search)
+        except ValueError as ex:  # Not a search results page
+            abort(502, description=str(ex))
+        return jsonify({"shows": [show.to_json() for show in shows]})
+
+    @app.route('/show')
+    def show():
+        href = request.args.get('href', '')
+        if not href:
+            abort(400, description="Missing show 'href'")
+        srt_files = _run(get_subtitles_for_show, _absolute(href))
+        return jsonify({"srt_files": [srt.to_json() for srt in srt_files]})
+
+    @app.route('/downloads', methods=['POST'])
+    def new_download():
+        data = request.get_json(silent=True) or {}
+        href = data.get('href')
+        if not href:
+            abort(400, description="Missing subtitle file 'href'")
+        job = jobs.submit(_absolute(href), extract=bool(data.get('extract',
+                                                                 True)))
+        response = jsonify(job.to_json())
+        response.status_code = 202
+        response.headers['Location'] = f"/downloads/{job.job_id}"
+        return response
+
+    @app.route('/downloads/<job_id>')
+    def download_status(job_id: str):
+        job = jobs.get(job_id)
+        if not job:
+            abort(404, description=f"Unknown job {job_id}")
+        return jsonify(job.to_json())
+
+    @app.route('/downloads/<job_id>/files/<name>')
+    def download_file(job_id: str, name: str):
+        job = jobs.get(job_id)
+        if not job or name not in job.files:
+            abort(404, description=f"No file {name} for job {job_id}")
+        return send_from_directory(job.folder, name, as_attachment=True)
+
+    @app.route('/stats')
+    def stats():
+        return jsonify({"uptime": round(time.time() - started, 1),
+                        "jobs": jobs.stats(),
+                        "metrics": metrics.to_json()})
+
+    @app.route('/metrics')
+    def prometheus():
+        return Response(metrics.to_prometheus(),
+                        mimetype='text/plain; version=0.0.4')
+
+    return app
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description=__doc__.strip().split('\n')[0])
+    parser.add_argument('--config', default='config.ini',
+                        help="the GUI configuration file")
+    parser.add_argument('--host', help="default is the 'host' option of the "
+                                       "'service' section, or 127.0.0.1")
+    parser.add_argument('--port', type=int)
+    args = parser.parse_args()
+    ini = ConfigParser()
+    if not ini.read(args.config):
+        raise EnvironmentError(f"Config file '{args.config}' is missing")
+    logging.basicConfig(level=logging.INFO)
+    app = create_app(ini)
+    app.run(host=args.host or ini.get('service', 'host',
+                                      fallback='127.0.0.1'),
+            port=args.port or ini.getint('service', 'port',
+                                         fallback=DEFAULT_PORT),
+            threaded=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,23 +1,34 @@
 # gui.py
 
+from __future__ import annotations
+
+import time
+
+STARTUP = time.perf_counter()
+
+import argparse
 import json
 import logging
 import os
+from functools import lru_cache
 from pathlib import Path
 import subprocess
 import sys
+import threading
 from configparser import ConfigParser
-from typing import Union, Tuple, Literal, Any, List
+from typing import TYPE_CHECKING, Union, Tuple, Literal, Any, List
 
 import PySimpleGUI as sg
 
-from logging_conf import configure_logging
+from logging_conf import EVENTS_LOGGER, configure_logging
 import gui_settings as guiconf
 import gui_utils as gutils
-from localfilemanagement import extract_srt
+from workers import TaskRunner, TaskContext, TaskResult, TaskProgress, \
+    TASK_DONE_EVENT, TASK_PROGRESS_EVENT
 
 logger = logging.getLogger(__name__)
-configure_logging()
+# Rate limited, see the `logging` section of config.ini
+event_logger = logging.getLogger(EVENTS_LOGGER)
 
 # Add parent folder as source root to python path
 # careful, not exensively tested
@@ -28,7 +39,13 @@ if len(script_folder.parts) == 1:
 else:
     sys.path.append(os.path.join(*script_folder.parts[0:-1]))
 
-import backend.ostdownloader as ost
+if TYPE_CHECKING:
+    import backend.archive as archive
+    import backend.library as library
+    import backend.matching as matching
+    import backend.metrics as metrics
+    import backend.ostdownloader as ost
+    import backend.season as season
 
 # Get configuration, MUST be present
 CONFIG_FILENAME = 'config.ini'
@@ -46,6 +63,8 @@ LANGCONF_BTN_FILENAME = os.path.abspath(
 APPLOGO_FILENAME = os.path.abspath(os.path.join(RES_FOLDER, 'applogo.png'))
 LANGUAGES_FILE = os.path.join(RES_FOLDER, 'languages.json')
 INFO_TIMEOUT = 10  # seconds before autoclosing the search tips window
+BACKGROUND_TASKS = ('prefetch',)  # Not shown, not reported to the user
+DEFAULT_PREFETCH_SHOWS = 3
 ITEMS_BY_ROW = 4
 APP_NAME = 'Subtitles downloader'
 VERSION = "v1.1"
@@ -84,7 +103,9 @@ def _get_ini_option_with_type(section: str, key: str,
         return ini.getint(section, key, fallback=None)
 
 
+@lru_cache(maxsize=None)
 def _get_languages(languages_file: str = LANGUAGES_FILE) -> dict:
+    """The languages available, loaded when first needed"""
     retval = None
     with open(languages_file) as fh:
         retval = json.load(fh)
@@ -99,8 +120,40 @@ def _get_sel_languages(ini: ConfigParser = ini) -> str:
     return ','.join(sel_lngs)
 
 
-LANGUAGES = _get_languages()
-sg.ChangeLookAndFeel(ini.get('gui', 'LOOKNFEEL'))
+_backend_lock = threading.Lock()
+_backend_ready = False
+
+
+def _setup_backend() -> None:
+    """Configure the network stack, the cache and the store, once"""
+    global _backend_ready
+    with _backend_lock:
+        if _backend_ready:
+            return
+        import backend.config as backend_config
+        backend_config.configure_network(ini)
+        backend_config.configure_cache(ini)
+        backend_config.configure_store(ini)
+        _backend_ready = True
+
+
+# The backend pulls in requests and bs4: it's imported after the window is
+# shown, by `_preload_backend` or by the first operation needing it
+if not TYPE_CHECKING:
+    archive = gutils.LazyModule('backend.archive', _setup_backend)
+    library = gutils.LazyModule('backend.library', _setup_backend)
+    matching = gutils.LazyModule('backend.matching', _setup_backend)
+    metrics = gutils.LazyModule('backend.metrics')
+    ost = gutils.LazyModule('backend.ostdownloader', _setup_backend)
+    season = gutils.LazyModule('backend.season', _setup_backend)
+
+
+def _preload_backend() -> None:
+    """Import the backend, meant to run in background once the window shows"""
+    start = time.perf_counter()
+    for module in (ost, archive, season, library, matching):
+        module.load()
+    logger.debug(f"Backend loaded in {time.perf_counter() - start:.3f}s")
 
 
 def _save_config(ini: ConfigParser, inifile: str):
@@ -148,140 +201,155 @@ def _get_def_folder():
     return os.path.abspath(ini.get('paths', 'OST_DL_FOLDER'))
 
 
-layout = [
-    # row 1 - search
-    [
-        sg.Text("Enter show to search", size=(20, 1)),
-        sg.InputText(key="-SEARCHTERMS-", size=(49, 1)),
-        # Placeholder for the -MEDIAFILE- FileBrowser widget in order to
-        # manipulate the text inserting in -SEARCHTERMS- the filename only
-        # and the folder path in -DLFOLDER-
-        sg.InputText(key="-SELMEDIAFILE-", enable_events=True, visible=False),
-        sg.FileBrowse(
-            button_text="From File",
-            target="-SELMEDIAFILE-",
-            file_types=MEDIA_EXTENSIONS,
-            initial_folder=MEDIA_DEFAULT_FOLDER,
-            tooltip="Paste filename of media to target, the download folder "
-                    "will be changed accordingly",
-            key='-MEDIAFILE-',
-            enable_events=True
-        ),
-        sg.Button(
-
-            tooltip='Click for tips about searching',
-            image_data=gutils.convert_to_base64(INFO_BTN_FILENAME),
-            button_color=(sg.theme_background_color(),
-                          sg.theme_background_color()),
-            border_width=0, key='-SRCTERMSINFO-'
-        ),
-        # sg.Button.bind(bind_string="Search", key_modifier="<Alt_L>s")
-
-    ],
-    # row 2 - download folder
-    [
-        sg.Text(
-            "Download folder",
-            size=(20, 1)
-        ),
-        sg.Input(
-            key="-DLFOLDER-",
-            default_text=_get_def_folder(),
-            readonly=True, size=(49, 1)
-        ),
-        sg.FolderBrowse(button_text="Browse", size=(8, 1),
-                        tooltip='Folder to save downloaded srt files')
-    ],
-    # row 3 - output
-    [
-        [sg.HSeparator()],  # row 3
+def build_layout() -> list:
+    """Widget disposition of the main window, the theme must be set first"""
+    return [
+        # row 1 - search
         [
-            sg.Table(
-                values=[['']],
-                headings=['TITLE'],
-                auto_size_columns=True,
-                justification="left",
-                key='-RESULTSTABLE-',
-                row_height=35,
-                num_rows=10,
-                expand_x=True,
-                expand_y=True,
-                enable_click_events=True,
-                vertical_scroll_only=False,
-                alternating_row_color='lightyellow',
-            )
-        ],
-        [sg.Text("Enter text to search, then click the 'SEARCH' button",
-                 size=(80, 1), key='-LISTTITLE-'),
-         ],
-        [sg.Text("Additional content", key="-MEDIAFILENAME-", visible=True,
-                 size=(80, 1), )],
-        [sg.HSeparator()],
-    ],
-    # row 5 - Options
-    [
-        [sg.Checkbox(
-            "Extract srl file after download",
-            default=_get_ini_option_with_type('gui', 'extract_srt', 'b'),
-            tooltip="When selected extract the subtitles file(s) directly "
-                    "in the Download folder",
-            enable_events=True,
-            key='-CHKEXTRACTSRT-'
-        ),
-            sg.Text('Languages: '),
-            sg.InputText(
-                default_text=_get_sel_languages(), readonly=True,
-                tooltip='Subtitles languages to search for',
-                size=(40, 1),
-                key='-LANGSELECTED-'
+            sg.Text("Enter show to search", size=(20, 1)),
+            sg.InputText(key="-SEARCHTERMS-", size=(49, 1)),
+            # Placeholder for the -MEDIAFILE- FileBrowser widget in order to
+            # manipulate the text inserting in -SEARCHTERMS- the filename only
+            # and the folder path in -DLFOLDER-
+            sg.InputText(key="-SELMEDIAFILE-", enable_events=True, visible=False),
+            sg.FileBrowse(
+                button_text="From File",
+                target="-SELMEDIAFILE-",
+                file_types=MEDIA_EXTENSIONS,
+                initial_folder=MEDIA_DEFAULT_FOLDER,
+                tooltip="Paste filename of media to target, the download folder "
+                        "will be changed accordingly",
+                key='-MEDIAFILE-',
+                enable_events=True
             ),
             sg.Button(
-                '',
-                tooltip='Add/Remove subtitle languages to search for',
-                image_data=gutils.convert_to_base64(LANGCONF_BTN_FILENAME),
+
+                tooltip='Click for tips about searching',
+                image_data=gutils.convert_to_base64(INFO_BTN_FILENAME),
                 button_color=(sg.theme_background_color(),
                               sg.theme_background_color()),
-                border_width=0, key='-LANGCONF-'
+                border_width=0, key='-SRCTERMSINFO-'
+            ),
+            # sg.Button.bind(bind_string="Search", key_modifier="<Alt_L>s")
+
+        ],
+        # row 2 - download folder
+        [
+            sg.Text(
+                "Download folder",
+                size=(20, 1)
+            ),
+            sg.Input(
+                key="-DLFOLDER-",
+                default_text=_get_def_folder(),
+                readonly=True, size=(49, 1)
+            ),
+            sg.FolderBrowse(button_text="Browse", size=(8, 1),
+                            tooltip='Folder to save downloaded srt files')
+        ],
+        # row 3 - output
+        [
+            [sg.HSeparator()],  # row 3
+            [
+                sg.Table(
+                    values=[['', '']],
+                    headings=['TITLE', 'LANGUAGE'],
+                    auto_size_columns=True,
+                    justification="left",
+                    key='-RESULTSTABLE-',
+                    row_height=35,
+                    num_rows=10,
+                    expand_x=True,
+                    expand_y=True,
+                    enable_click_events=True,
+                    select_mode=sg.TABLE_SELECT_MODE_EXTENDED,
+                    vertical_scroll_only=False,
+                    alternating_row_color='lightyellow',
+                )
+            ],
+            [sg.Text("Enter text to search, then click the 'SEARCH' button",
+                     size=(80, 1), key='-LISTTITLE-'),
+             ],
+            [sg.Text("Additional content", key="-MEDIAFILENAME-", visible=True,
+                     size=(80, 1), )],
+            [sg.HSeparator()],
+        ],
+        # row 5 - Options
+        [
+            [sg.Checkbox(
+                "Extract srl file after download",
+                default=_get_ini_option_with_type('gui', 'extract_srt', 'b'),
+                tooltip="When selected extract the subtitles file(s) directly "
+                        "in the Download folder",
+                enable_events=True,
+                key='-CHKEXTRACTSRT-'
+            ),
+                sg.Text('Languages: '),
+                sg.InputText(
+                    default_text=_get_sel_languages(), readonly=True,
+                    tooltip='Subtitles languages to search for',
+                    size=(40, 1),
+                    key='-LANGSELECTED-'
+                ),
+                sg.Button(
+                    '',
+                    tooltip='Add/Remove subtitle languages to search for',
+                    image_data=gutils.convert_to_base64(LANGCONF_BTN_FILENAME),
+                    button_color=(sg.theme_background_color(),
+                                  sg.theme_background_color()),
+                    border_width=0, key='-LANGCONF-'
+                )],
+            sg.HorizontalSeparator(),
+            [sg.Checkbox(
+                "Delete zip file after extraction",
+                default=_get_ini_option_with_type('gui', 'delete_zip', 'b'),
+                tooltip="Delete the subtitles compressed file"
+                        "if 'Extract srl file after download' option is selected",
+                key='-CHKDELETEZIP-'
             )],
-        sg.HorizontalSeparator(),
-        [sg.Checkbox(
-            "Delete zip file after extraction",
-            default=_get_ini_option_with_type('gui', 'delete_zip', 'b'),
-            tooltip="Delete the subtitles compressed file"
-                    "if 'Extract srl file after download' option is selected",
-            key='-CHKDELETEZIP-'
-        )],
-        [sg.Checkbox(
-            "Subtitles filename equals to referring media file",
-            default=_get_ini_option_with_type(
-                'gui', 'ost_filename_as_referring_media', 'b'),
-            tooltip="",
-            key='-CHKOSTASMEDIA-'
-        )],
-        [sg.Checkbox(
-            "Show prompt for opening subtitle file folder after download",
-            default=_get_ini_option_with_type(
-                'gui', 'open_ost_folder_after_download', 'b'),
-            tooltip="If checked open the subtitle file folder after download",
-            key='-CHKOPENOSTFOLDER-'
-        )]
-
-    ],
-    # row 5 - Commands
-    [
-        sg.OK("Search", key="-SEARCH-",
-              tooltip='Search for show (Alt-S)', ),
-        sg.Button("Get Show", key="-SELSHOW-",
-                  tooltip='Select Show (Alt-G)', disabled=True),
-        sg.Button("Get Subtitles", key="-GETSUBT-",
-                  tooltip='Download subtitles (Alt-D)', disabled=True),
-        sg.Button("Configure", key="-CONFIG-"),
-        sg.Cancel("Quit", key="-CANCEL-")
-    ]  # last row
-]
-
-
-def mainloop(layout: list) -> None:
+            [sg.Checkbox(
+                "Subtitles filename equals to referring media file",
+                default=_get_ini_option_with_type(
+                    'gui', 'ost_filename_as_referring_media', 'b'),
+                tooltip="",
+                key='-CHKOSTASMEDIA-'
+            )],
+            [sg.Checkbox(
+                "Show prompt for opening subtitle file folder after download",
+                default=_get_ini_option_with_type(
+                    'gui', 'open_ost_folder_after_download', 'b'),
+                tooltip="If checked open the subtitle file folder after download",
+                key='-CHKOPENOSTFOLDER-'
+            )]
+
+        ],
+        # row 5 - Background task progress
+        [
+            sg.ProgressBar(100, orientation='h', size=(30, 15),
+                           key='-PROGRESS-'),
+            sg.Text("", size=(40, 1), key='-STATUS-'),
+            sg.Button("Cancel", key="-TASKCANCEL-", disabled=True,
+                      tooltip='Cancel the running operation'),
+        ],
+        # row 6 - Commands
+        [
+            sg.OK("Search", key="-SEARCH-",
+                  tooltip='Search for show (Alt-S)', ),
+            sg.Button("Get Show", key="-SELSHOW-",
+                      tooltip='Select Show (Alt-G)', disabled=True),
+            sg.Button("Get Subtitles", key="-GETSUBT-",
+                      tooltip='Download subtitles of the selected rows (Alt-D)',
+                      disabled=True),
+            sg.Button("Get All", key="-GETALL-",
+                      tooltip='Download subtitles of every episode listed',
+                      disabled=True),
+            sg.Button("Configure", key="-CONFIG-"),
+            sg.Cancel("Quit", key="-CANCEL-")
+        ]  # last row
+    ]
+
+
+def mainloop(layout: list, startup_time: bool = False) -> None:
     """
     Main event loop, tipically:
 
@@ -296,6 +364,8 @@ def mainloop(layout: list) -> None:
        specified in the textbox -OUTFOLDER-, prompting the user.
 
         :param layout: widget disposition
+        :param startup_time: print the startup timings and quit as soon as
+                             the backend is loaded
     :return:
     """
     shows = []
@@ -306,6 +376,17 @@ def mainloop(layout: list) -> None:
         finalize=True,
         icon=gutils.convert_to_base64(APPLOGO_FILENAME)
     )
+    window.read(timeout=0)  # Draw the first frame
+    shown = time.perf_counter() - STARTUP
+    preload = threading.Thread(target=_preload_backend, daemon=True)
+    preload.start()
+    if startup_time:
+        preload.join()
+        print(f"window shown: {shown * 1000:.0f} ms, backend ready: "
+              f"{(time.perf_counter() - STARTUP) * 1000:.0f} ms")
+        window.close()
+        return
+    runner = TaskRunner(window)
 
     # Buttons keybindings
     window.bind('<Alt-s>', '-MEDIAFILESH-')
@@ -316,8 +397,8 @@ def mainloop(layout: list) -> None:
 
     while True:
         event, values = window.read()
-        logger.debug(event)
-        logger.debug(values)
+        # Not the values: they are the whole form, at every event
+        event_logger.debug("Event %s", event)
         if event in (sg.WIN_CLOSED, '-CANCEL-'):
             break
         # key binding event managers
@@ -331,7 +412,7 @@ def mainloop(layout: list) -> None:
             window['-GETSUBT-'].click()
         # Search opensubtitles.org by the user provided string
         elif event in ['-SEARCH-', '_srcenter']:
-            shows = on_btn_search(window, event, values)
+            on_btn_search(window, event, values, runner)
         # Get search string from media file selected by user
         elif event in ['-SELMEDIAFILE-']:
             on_btn_string_src_from_media_file(window, event, values)
@@ -340,17 +421,64 @@ def mainloop(layout: list) -> None:
             on_btn_search_tips(INFO_TIMEOUT)
         # Retrieve subtitles files for the selected show
         elif event in ['-SELSHOW-']:
-            selected_show = on_btn_select_show(window, event, values, shows)
+            on_btn_select_show(window, event, values, shows, runner)
         # Download the subtitle file (compressed) chosen by the user
         elif event in ['-GETSUBT-']:
-            on_btn_get_subtitles(window, event, values, selected_show)
+            on_btn_get_subtitles(window, event, values, selected_show, runner)
+        # Download the subtitles of every episode of a TV series
+        elif event in ['-GETALL-']:
+            on_btn_get_all_subtitles(window, event, values, selected_show,
+                                     runner)
+        # Cancel the running background operation
+        elif event in ['-TASKCANCEL-']:
+            runner.cancel()
+            _set_task_status(window, runner, "Cancelled")
+        # A background operation reports its progress
+        elif event == TASK_PROGRESS_EVENT:
+            progress: TaskProgress = values[event]
+            if not runner.is_current(progress):
+                continue
+            if progress.kind == 'search' and progress.value is not None:
+                shows = on_search_page(window, progress.done,
+                                       shows, progress.value)
+            on_task_progress(window, progress)
+        # A background operation completed
+        elif event == TASK_DONE_EVENT:
+            result: TaskResult = values[event]
+            current = runner.is_current(result)
+            runner.finished(result)
+            if result.kind in BACKGROUND_TASKS:
+                logger.debug(f"{result.kind} done: {result.value} "
+                             f"{result.error or ''}")
+                _set_task_status(window, runner)
+                continue
+            if not current:  # Cancelled or superseded by a newer request
+                logger.debug(f"Dropped stale {result.kind} result")
+                _set_task_status(window, runner)
+                continue
+            _set_task_status(window, runner, "")
+            if result.error:
+                prompt = f"An error occurred:{result.error} "
+                sg.popup_error(prompt, title="")
+            elif result.kind == 'search':
+                shows = on_search_done(window, result.value)
+                start_prefetch(runner, shows)
+                auto_select_show(window, values, shows, runner)
+            elif result.kind == 'show':
+                selected_show = on_show_done(window, result.value)
+                auto_select_srt_file(window, values, selected_show)
+            elif result.kind == 'download':
+                on_download_done(window, values, result.value)
+            elif result.kind == 'episodes':
+                on_episodes_done(window, values, result.value)
         # GUI for configuration
         elif event in ['-CONFIG-']:
             config_settings_loop()
         # GUI for subtitle languages selection
         elif event in ['-LANGCONF-']:
             sel_lang = values['-LANGSELECTED-'].split(',')
-            config_languages_settings_loop(LANGUAGES, sel_lang, ITEMS_BY_ROW)
+            config_languages_settings_loop(_get_languages(), sel_lang,
+                                           ITEMS_BY_ROW)
             window['-LANGSELECTED-'].update(_get_sel_languages())
         # Syncronize the 'extract srt file' and 'delete zip file' options
         elif event in ['-CHKEXTRACTSRT-']:
@@ -368,9 +496,37 @@ def mainloop(layout: list) -> None:
             t = window['-RESULTSTABLE-'].get()[row_col[0]][row_col[1]]
             print("Selected " + t)
             window['-MEDIAFILENAME-'].update(value=t)
+    runner.shutdown()
     window.close()
 
 
+def _start_task(window, runner: TaskRunner, kind: str, status: str,
+                func, *args) -> None:
+    """Run `func` in background, showing `status` until it completes"""
+    window['-PROGRESS-'].update_bar(0, 100)
+    runner.submit(kind, func, *args)
+    _set_task_status(window, runner, status)
+
+
+def _set_task_status(window, runner: TaskRunner,
+                     status: Union[str, None] = None) -> None:
+    """Update status text and cancel button according to the running tasks"""
+    if status is not None:
+        window['-STATUS-'].update(status)
+    busy = runner.is_busy(ignore=BACKGROUND_TASKS)
+    window['-TASKCANCEL-'].update(disabled=not busy)
+    if not busy:
+        window['-PROGRESS-'].update_bar(0, 100)
+
+
+def on_task_progress(window, progress: TaskProgress) -> None:
+    """A background task reported how far it got"""
+    if progress.total:
+        window['-PROGRESS-'].update_bar(progress.done, progress.total)
+    if progress.message:
+        window['-STATUS-'].update(progress.message)
+
+
 def _enumerate_items(items: list) -> List[list]:
     """
     :param items: collection to parse **must be a one level list**
@@ -382,30 +538,139 @@ def _enumerate_items(items: list) -> List[list]:
     return items_numbered
 
 
-def on_btn_search(window, event, values) -> list:
+def on_btn_search(window, event, values, runner: TaskRunner) -> None:
     """User press 'Search' button"""
-    try:
-        window['-GETSUBT-'].update(disabled=True)
-        window['-SELSHOW-'].update(disabled=True)
-        lng = values['-LANGSELECTED-']
-        qs = ini.get('parser', 'OST_SEARCH_URL').format(lng)
-        shows = ost.search_show(values['-SEARCHTERMS-'], qs)
-        window['-LISTTITLE-'].update('Shows matching the query string, please '
-                                     'select one in order to download the '
-                                     'subtitle file')
-        numbered_shows = _enumerate_items([str(show) for show in shows])
-        window['-RESULTSTABLE-'].update(values=numbered_shows)
-        # window['-OUTLIST-'].update(values=numbered_shows)
+    window['-GETSUBT-'].update(disabled=True)
+    window['-GETALL-'].update(disabled=True)
+    window['-SELSHOW-'].update(disabled=True)
+    # A new search makes any pending show listing stale. Downloads the user
+    # asked for ('download', 'episodes') go on and are reported when done
+    runner.cancel('show')
+    runner.cancel('prefetch')
+    languages = [lng for lng in values['-LANGSELECTED-'].split(',') if lng]
+    search_url = ini.get('parser', 'OST_SEARCH_URL')
+    if len(languages) > 1 and \
+            _get_ini_option_with_type('gui', 'search_each_language', 'b'):
+        _start_task(window, runner, 'search', "Searching...",
+                    _task_search_languages, values['-SEARCHTERMS-'],
+                    search_url, languages)
+        return
+    qs = search_url.format(','.join(languages))
+    _start_task(window, runner, 'search', "Searching...",
+                _task_search, values['-SEARCHTERMS-'], qs)
+
+
+def _task_search(task: TaskContext, search_terms: str,
+                 root_search: str) -> List[ost.SubtitledShow]:
+    """Follow the result pages, each one is posted as soon as it is parsed"""
+    shows = []
+    for page, page_shows in enumerate(
+            ost.iter_search_pages(search_terms, root_search), start=1):
+        shows.extend(page_shows)
+        # Raises TaskCancelled, which stops the search, if cancelled
+        task.progress(page, message=f"Searching... {len(shows)} shows found",
+                      value=page_shows)
+    return shows
+
+
+def _task_search_languages(task: TaskContext, search_terms: str,
+                           search_url: str,
+                           languages: List[str]) -> List[ost.SubtitledShow]:
+    """
+    Search each language at once, every page is posted as soon as it is
+    parsed, whatever its language
+    """
+    shows = []
+    for page, (language, page_shows) in enumerate(
+            ost.iter_search_languages(search_terms, search_url, languages),
+            start=1):
+        shows = ost.merge_shows(shows, page_shows)
+        task.progress(page, value=page_shows,
+                      message=f"Searching... {len(shows)} shows found "
+                              f"({language})")
+    return shows
+
+
+def _show_rows(shows: List[ost.SubtitledShow]) -> List[list]:
+    """Table rows of `shows`: name and episode, languages found for"""
+    return [[str(show), ','.join(show.languages)] for show in shows]
+
+
+def on_search_page(window, page: int, shows: List[ost.SubtitledShow],
+                   page_shows: List[ost.SubtitledShow]) -> list:
+    """A page of search results arrived, append its shows to the table"""
+    if page == 1:
+        shows = []
+        window['-LISTTITLE-'].update('Shows matching the query string, '
+                                     'please select one in order to download '
+                                     'the subtitle file')
         window['-SELSHOW-'].update(disabled=False)
-        return shows
-    except Exception as ex:
-        prompt = f"An error occurred:{ex} "
-        sg.popup_error(prompt, title="")
+    # Shows found again for another language replace the listed ones
+    shows = ost.merge_shows(shows, page_shows)
+    window['-RESULTSTABLE-'].update(values=_show_rows(shows))
+    return shows
+
+
+def on_search_done(window, shows: List[ost.SubtitledShow]) -> list:
+    """The search completed, list the shows found"""
+    window['-LISTTITLE-'].update(f'{len(shows)} shows matching the query '
+                                 'string, please select one in order to '
+                                 'download the subtitle file')
+    window['-RESULTSTABLE-'].update(values=_show_rows(shows))
+    window['-SELSHOW-'].update(disabled=False)
+    return shows
+
+
+def _media_to_match(values) -> Union[matching.MediaInfo, None]:
+    """What the media file chosen with 'From File' tells, if auto matching"""
+    media_file = values['-SELMEDIAFILE-']
+    if not media_file or \
+            not _get_ini_option_with_type('gui', 'auto_match', 'b'):
+        return None
+    return matching.parse_media_filename(media_file)
+
+
+def auto_select_show(window, values, shows: List[ost.SubtitledShow],
+                     runner: TaskRunner) -> None:
+    """
+    Go on with the show matching best the media file, if the match is
+    confident enough, as if the user selected it
+    """
+    media = _media_to_match(values)
+    if not media or not shows:
+        return
+    match = matching.best_match(matching.rank_shows(media, shows))
+    if not match:
+        return
+    idx = shows.index(match.item)
+    window['-RESULTSTABLE-'].update(select_rows=[idx])
+    logger.info(f"Auto selected show {match.item} ({match.score:.2f})")
+    on_btn_select_show(window, '-SELSHOW-',
+                       {**values, '-RESULTSTABLE-': [idx]}, shows, runner)
+
+
+def auto_select_srt_file(window, values,
+                         selected_show: ost.SubtitledShow) -> None:
+    """Select the subtitle file matching best the media file, if confident"""
+    media = _media_to_match(values)
+    if not media or not selected_show.srt_files:
+        return
+    match = matching.best_match(
+        matching.rank_srt_files(media, selected_show.srt_files))
+    if not match:
+        return
+    idx = selected_show.srt_files.index(match.item)
+    window['-RESULTSTABLE-'].update(select_rows=[idx])
+    window['-STATUS-'].update(f"Best match: {match.item.name} "
+                              f"({match.score:.0%}), click 'Get Subtitles'")
 
 
 def on_btn_string_src_from_media_file(window, event, values) -> None:
     folderpath, filename = os.path.split(values['-SELMEDIAFILE-'])
     name, _ = os.path.splitext(filename)  # Paste file name without extensions
+    media = _media_to_match(values)
+    if media and media.search_terms:  # Only title and SxxExx
+        name = media.search_terms
     window['-MEDIAFILENAME-'].update(value=f'Media file to match: {filename}')
     window['-SEARCHTERMS-'].update(value=name, select=True)
     window['-DLFOLDER-'].update(value=folderpath)
@@ -420,7 +685,8 @@ def _get_idx_from_selected(item,
     return int(idx_str) - ndx_shift
 
 
-def on_btn_select_show(window, event, values, shows) -> ost.SubtitledShow:
+def on_btn_select_show(window, event, values, shows,
+                       runner: TaskRunner) -> None:
     """
     For the selected show will be retrieved info about the subtitle files
     associated with
@@ -429,30 +695,63 @@ def on_btn_select_show(window, event, values, shows) -> ost.SubtitledShow:
         # if not values['-OUTLIST-']:
         if not values['-RESULTSTABLE-']:
             sg.popup('Please select a show in order to download the subtitles')
-        else:
-            # Parse the index of the selected show related to the list "shows"
-            # idx = _get_idx_from_selected(values['-OUTLIST-'][0])
-            idx = values['-RESULTSTABLE-'][0]
-            selected_show = shows[idx]
-            # For the selected show retrieve the subtitle files
-            show_url = selected_show.get_url(ini.get('parser', 'OST_DOMAIN'))
-            srtfiles = ost.get_subtitles_for_show(show_url)
-            # Pass sutitles files to the selected show object
-            selected_show.srt_files = srtfiles
-            srtfiles_rows = [[srt.name] for srt in srtfiles]
-            window['-LISTTITLE-'].update(
-                f'{len(srtfiles_rows)} subtitles files found for the show, '
-                'pick one to download')
-            window['-RESULTSTABLE-'].update(values=srtfiles_rows)
-            window['-GETSUBT-'].update(disabled=False)
-            # Return the selected show, we need this for the subsequential
-            # retrieving of the subtitles file
-            return selected_show
+            return
+        # Parse the index of the selected show related to the list "shows"
+        # idx = _get_idx_from_selected(values['-OUTLIST-'][0])
+        idx = values['-RESULTSTABLE-'][0]
+        selected_show = shows[idx]
+        # Stop fetching more search results, the table is about to be reused
+        runner.cancel('search')
+        # For the selected show retrieve the subtitle files
+        show_url = selected_show.get_url(ini.get('parser', 'OST_DOMAIN'))
+        _start_task(window, runner, 'show', "Retrieving subtitles files...",
+                    _task_select_show, selected_show, show_url)
     except Exception as ex:
         prompt = f"An error occurred:{ex} "
         sg.popup_error(prompt, title="")
 
 
+def start_prefetch(runner: TaskRunner,
+                   shows: List[ost.SubtitledShow]) -> None:
+    """List in background the subtitle files of the top search results"""
+    count = ini.getint('network', 'prefetch_shows',
+                       fallback=DEFAULT_PREFETCH_SHOWS)
+    if count > 0 and shows:
+        runner.submit('prefetch', _task_prefetch, shows[:count])
+
+
+def _task_prefetch(task: TaskContext,
+                   shows: List[ost.SubtitledShow]) -> int:
+    return ost.prefetch_show_listings(shows, ini.get('parser', 'OST_DOMAIN'),
+                                      cancelled=task.cancel_event)
+
+
+def _task_select_show(task: TaskContext, selected_show: ost.SubtitledShow,
+                      show_url: str) -> ost.SubtitledShow:
+    if selected_show.srt_files:  # Already listed by the prefetch
+        return selected_show
+    srtfiles = ost.get_subtitles_for_show(show_url)
+    task.check()
+    # Pass sutitles files to the selected show object
+    selected_show.srt_files = srtfiles
+    return selected_show
+
+
+def on_show_done(window, selected_show: ost.SubtitledShow) -> ost.SubtitledShow:
+    """The subtitle files of the selected show have been retrieved"""
+    srtfiles_rows = [[srt.name] for srt in selected_show.srt_files]
+    window['-LISTTITLE-'].update(
+        f'{len(srtfiles_rows)} subtitles files found for the show, '
+        'pick one to download')
+    window['-RESULTSTABLE-'].update(values=srtfiles_rows)
+    window['-GETSUBT-'].update(disabled=False)
+    window['-GETALL-'].update(disabled=not any(
+        srt.episode for srt in selected_show.srt_files))
+    # Return the selected show, we need this for the subsequential
+    # retrieving of the subtitles file
+    return selected_show
+
+
 def _get_remote_and_local_subtitles_filenames(
         local_folder: str, selected_show: ost.SubtitledShow,
         srtfile_idx) -> Tuple[str, str]:
@@ -468,45 +767,132 @@ def _get_remote_and_local_subtitles_filenames(
 
 
 def on_btn_get_subtitles(window, event, values,
-                         selected_show: ost.SubtitledShow) -> None:
+                         selected_show: ost.SubtitledShow,
+                         runner: TaskRunner) -> None:
     """Download the subtitle file chosen"""
     try:
         window['-SELSHOW-'].update(disabled=True)
         # print(selected_show)
         if not values['-RESULTSTABLE-']:
             sg.popup('Please select a subtitles file to download')
-        else:
-            idx = values['-RESULTSTABLE-'][0]
-            srturl, filename = _get_remote_and_local_subtitles_filenames(
-                values['-DLFOLDER-'], selected_show, idx)
-            logger.debug(f"Downloading {srturl}")
-            filesize = ost.download_srt_files(url=srturl,
-                                              local_filename=filename)
-            logger.debug(f"File {filename} ({filesize} bytes) created")
-            if filesize < 0:
-                sg.popup_error("Srt file download",
-                               "Un error has occurred, unable to download the "
-                               "selected file")
-            else:
-                if values['-CHKEXTRACTSRT-']:
-                    rename_as = ""
-                    if values['-CHKOSTASMEDIA-']:
-                        rename_as = values['-SELMEDIAFILE-']
-                    filesize = extract_srt(
-                        filename, values['-DLFOLDER-'], rename_as=rename_as)
-                    if filesize:
-                        os.remove(filename)
-                        filename = rename_as
-                # prompt the user about opening the folder in whiche the
-                # subtitle file has been downloaded
-                if values['-CHKOPENOSTFOLDER-']:
-                    _open_folder_upon_choice(filename, filesize,
-                                             values['-DLFOLDER-'])
+            return
+        if len(values['-RESULTSTABLE-']) > 1:
+            _start_episodes_download(
+                window, values, runner, selected_show,
+                [selected_show.srt_files[i] for i in values['-RESULTSTABLE-']])
+            return
+        idx = values['-RESULTSTABLE-'][0]
+        srturl, filename = _get_remote_and_local_subtitles_filenames(
+            values['-DLFOLDER-'], selected_show, idx)
+        rename_as = ""
+        if values['-CHKOSTASMEDIA-']:
+            rename_as = values['-SELMEDIAFILE-']
+        _start_task(window, runner, 'download', "Downloading...",
+                    _task_get_subtitles, srturl, filename,
+                    values['-DLFOLDER-'], values['-CHKEXTRACTSRT-'],
+                    values['-CHKDELETEZIP-'], rename_as)
+    except Exception as ex:
+        prompt = f"An error occurred:{ex} "
+        sg.popup_error(prompt, title="")
+
+
+def _task_get_subtitles(task: TaskContext, srturl: str, filename: str,
+                        folder: str, extract: bool, delete_zip: bool,
+                        rename_as: str) -> Tuple[str, int]:
+    """Download (and extract) the subtitle file, return filename and size"""
+    logger.debug(f"Downloading {srturl}")
+    if extract:
+        # Download in memory and extract straight to the final name,
+        # the zip file reaches the disk only if the user keeps it
+        keep_zip_as = None if delete_zip else filename
+        extracted = archive.fetch_and_extract(
+            srturl, folder, rename_as=rename_as, keep_zip_as=keep_zip_as,
+            progress=task.progress)
+        filesize = sum(srt.size for srt in extracted)
+        if extracted:
+            filename = extracted[0].path
+        logger.debug(f"{len(extracted)} subtitles files "
+                     f"({filesize} bytes) extracted")
+    else:
+        filename, filesize = archive.fetch_archive_as(
+            srturl, filename, progress=task.progress)
+        logger.debug(f"File {filename} ({filesize} bytes) created")
+    return filename, filesize
+
+
+def on_download_done(window, values, downloaded: Tuple[str, int]) -> None:
+    """The subtitle file has been downloaded"""
+    filename, filesize = downloaded
+    window['-SELSHOW-'].update(disabled=False)
+    # prompt the user about opening the folder in whiche the
+    # subtitle file has been downloaded
+    if values['-CHKOPENOSTFOLDER-']:
+        _open_folder_upon_choice(filename, filesize, values['-DLFOLDER-'])
+
+
+def on_btn_get_all_subtitles(window, event, values,
+                             selected_show: ost.SubtitledShow,
+                             runner: TaskRunner) -> None:
+    """Download the subtitles of every episode of the TV series listed"""
+    try:
+        _start_episodes_download(window, values, runner, selected_show,
+                                 selected_show.srt_files)
     except Exception as ex:
         prompt = f"An error occurred:{ex} "
         sg.popup_error(prompt, title="")
 
 
+def _start_episodes_download(window, values, runner: TaskRunner,
+                             selected_show: ost.SubtitledShow,
+                             srt_files: List[ost.SubtitleSrtFile]) -> None:
+    """Download many episodes in parallel, matching the local media files"""
+    episodes = [srt for srt in srt_files if srt.episode and srt.href]
+    if not episodes:
+        sg.popup('Please select one or more episodes to download')
+        return
+    window['-SELSHOW-'].update(disabled=True)
+    _start_task(window, runner, 'episodes',
+                f"Downloading {len(episodes)} episodes...",
+                _task_get_episodes, episodes, values['-DLFOLDER-'],
+                values['-CHKEXTRACTSRT-'],
+                selected_show.build_local_srt_zip_filename('') + ' ')
+
+
+def _task_get_episodes(task: TaskContext,
+                       episodes: List[ost.SubtitleSrtFile], folder: str,
+                       extract: bool, zip_prefix: str
+                       ) -> List[season.EpisodeDownload]:
+    """Download the episodes subtitles, the srt is named as the media file"""
+    def _progress(done: int, total: int, _):
+        task.progress(done, total, f"{done}/{total} episodes downloaded")
+
+    return season.download_episodes(
+        episodes, ini.get('parser', 'OST_DOMAIN'), folder,
+        media_by_episode=season.index_episode_media(
+            folder, library.MEDIA_EXTENSIONS),
+        extract=extract, zip_prefix=zip_prefix,
+        workers=_get_ini_option_with_type('network', 'parallel_downloads',
+                                          'i')
+        or season.DEFAULT_PARALLEL_DOWNLOADS,
+        progress=_progress, cancelled=task.cancel_event)
+
+
+def on_episodes_done(window, values,
+                     downloads: List[season.EpisodeDownload]) -> None:
+    """The episodes subtitles have been downloaded"""
+    window['-SELSHOW-'].update(disabled=False)
+    failed = [dl for dl in downloads if dl.error]
+    matched = [dl for dl in downloads if dl.media and not dl.error]
+    prompt = f"{len(downloads) - len(failed)} episodes downloaded, " \
+             f"{len(matched)} matched to a media file"
+    if failed:
+        prompt += "\n\nFailed:\n" + '\n'.join(
+            f"{dl.srt_file.name}: {dl.error}" for dl in failed)
+    sg.popup(prompt, title="")
+    if values['-CHKOPENOSTFOLDER-']:
+        _open_folder_upon_choice("", 0, values['-DLFOLDER-'])
+
+
 def _open_folder_upon_choice(filename: str, filesize: int, folder: str) -> None:
     prompt = f"The subtitles file has been downloaded\n" \
              f" do you want to open the containing folder?"
@@ -558,8 +944,9 @@ def on_btn_search_tips(timeout):
         'If you are looking for a specific tv series episode ',
         'add season and episode number in the format SXXEXX\n\n'
         'ex. Grey\'s Anatomy S01E03\n',
-        'The returned results are limited to 40, if you don\'t find '
-        'what you are looking for you may need to refine \nyour search\n\n',
+        'The results are listed as they arrive, page by page, you can\n'
+        'pick a show before the search completes. If you don\'t find '
+        'what\nyou are looking for you may need to refine your search\n\n',
         'Sometimes the title exists but the subtitles in the\n'
         'selected language(s) are not available\n\n'
         f'This window will close in {timeout} seconds'
@@ -567,5 +954,37 @@ def on_btn_search_tips(timeout):
     sg.popup_quick_message('\n'.join(prompt), auto_close_duration=10)
 
 
+def run_session(startup_time: bool = False) -> None:
+    """
+    Run the GUI; the optional `metrics` section enables the export of the
+    backend metrics and the profiling of the session when the window closes
+    """
+    configure_logging(ini)
+    sg.ChangeLookAndFeel(ini.get('gui', 'LOOKNFEEL'))
+    layout = build_layout()
+    if startup_time:
+        mainloop(layout, startup_time=True)
+        return
+    metrics_file = _get_ini_option_with_type('metrics', 'export')
+    profile_folder = _get_ini_option_with_type('metrics', 'profile_folder')
+    profile = metrics.ProfileSession(profile_folder) if profile_folder \
+        else None
+    if profile:
+        profile.start()
+    try:
+        mainloop(layout=layout)
+    finally:
+        if profile:
+            profile.stop()
+            logger.info(f"Profiling reports written to {profile_folder}")
+        if metrics_file:
+            metrics.get_metrics().export(metrics_file)
+            logger.info(f"Metrics written to {metrics_file}")
+
+
 if __name__ == '__main__':
-    mainloop(layout=layout)
+    parser = argparse.ArgumentParser(description=APP_NAME)
+    parser.add_argument('--startup-time', action='store_true',
+                        help="print the time taken to show the window and "
+                             "to load the backend, then quit")
+    run_session(parser.parse_args().startup_time)
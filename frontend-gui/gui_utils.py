@@ -1,12 +1,17 @@
 # gui_utils
 
 import base64
-from typing import Union
+import importlib
+import threading
+from functools import lru_cache
+from types import ModuleType
+from typing import Callable, Optional, Union
 import PySimpleGUI as sg
 
 
+@lru_cache(maxsize=None)
 def convert_to_base64(filename: str) -> Union[bytes, None]:
-    """Return a base64 encoded string of `filename`"""
+    """Return a base64 encoded string of `filename`, encoded once"""
     enc = None
     try:
         with open(filename, 'rb') as fh:
@@ -15,3 +20,30 @@ def convert_to_base64(filename: str) -> Union[bytes, None]:
         pass
     finally:
         return enc
+
+
+class LazyModule:
+    """
+    Stand-in for a module imported on first attribute access, so that heavy
+    imports (requests, bs4...) don't slow down the startup.
+    `setup`, if given, is called once before the first import.
+    """
+
+    def __init__(self, name: str, setup: Optional[Callable[[], None]] = None):
+        self._name = name
+        self._setup = setup
+        self._module: Optional[ModuleType] = None
+        self._lock = threading.Lock()
+
+    def load(self) -> ModuleType:
+        """Import the module if not done yet, thread safe"""
+        if self._module is None:
+            with self._lock:
+                if self._module is None:
+                    if self._setup:
+                        self._setup()
+                    self._module = importlib.import_module(self._name)
+        return self._module
+
+    def __getattr__(self, attr: str):
+        return getattr(self.load(), attr)
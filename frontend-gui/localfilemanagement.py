@@ -2,8 +2,10 @@
 
 import logging
 import os
-from typing import Union
-import zipfile
+from typing import List, Optional, Union
+
+from backend.archive import extract_srt_members
+from backend.transcode import ArchiveReport, extract_archives
 
 logger = logging.getLogger(__name__)
 
@@ -16,47 +18,47 @@ def extract_srt(zipfilename: str, outfolder: Union[str, None] = None,
     :param outfolder: Where to copy the .srt files, if None the folder of
                       the compressed file will be used
     :param ext: The extension of the file to extract (case-insensitive)
-    :param rename_as: If not empty will be the name of the extracted .srt file
-                      if such name exists will be manteined the original
-                      filename. Useful to load automatically the .srt file in
-                      smplayer.
+    :param rename_as: If not empty the fullpath of the referring media file,
+                      the .srt file is written next to it with the same name.
+                      Useful to load automatically the .srt file in smplayer.
     :return: Bytes extracted
     """
     outfolder = outfolder or os.path.abspath(os.path.dirname(zipfilename))
 
-    filesizes = 0
     try:
-        with zipfile.ZipFile(zipfilename) as zfh:
-            for info in zfh.infolist():
-                if not info.filename.lower().endswith(ext):
-                    continue
-                logger.debug(f"Extracting {info.filename} to {outfolder}")
-                zfh.extract(info.filename, outfolder)
-                filesizes += info.file_size
-                if rename_as:
-                    _rename_srt_file(
-                        os.path.join(outfolder, info.filename), rename_as)
-        return filesizes
+        extracted = extract_srt_members(zipfilename, outfolder, ext,
+                                        rename_as=rename_as)
+        for srt in extracted:
+            logger.debug(f"Extracted {srt.member} to {srt.path}")
+        return sum(srt.size for srt in extracted)
     except Exception as exc:
         print(exc)
         return -1
 
 
-def _rename_srt_file(oldname_path: str, media_name: str) -> None:
+def extract_srt_bulk(zipfilenames: List[str],
+                     outfolder: Union[str, None] = None,
+                     ext: str = '.srt', newline: Optional[str] = '\n',
+                     strip_bom: bool = True,
+                     workers: Optional[int] = None) -> List[ArchiveReport]:
     """
-    Renames a subtitle file to match the name of the corresponding media file.
-
-    Args:
-        oldname_path (str): Path to the subtitle file that needs to be renamed.
-        media_name (str): The fullpath name of the media file.
-
+    Extract every .srt file of many compressed files at once, on a process
+    pool, converting them to UTF-8
+    :param zipfilenames:
+    :param outfolder: Where to copy the .srt files, if None the folder of
+                      each compressed file will be used
+    :param ext: The extension of the file to extract (case-insensitive)
+    :param newline: The line ending of the .srt files, None to keep theirs
+    :param strip_bom: Remove the byte order mark, some players show it
+    :param workers: Number of processes, default one per CPU
+    :return: A report per compressed file: bytes, timings and encodings
     """
-    if not os.path.exists(oldname_path):
-        return
-    media_folder, media_filename = os.path.split(media_name)
-    media_filename_wo_ext, _ = os.path.splitext(media_filename)
-    new_srt_filename = os.path.join(
-        media_folder, media_filename_wo_ext + '.srt'
-    )
-    logging.debug(f"Renaming {oldname_path} to {new_srt_filename}")
-    os.rename(oldname_path, os.path.join(media_folder, new_srt_filename))
+    reports = list(extract_archives(zipfilenames, outfolder, ext, newline,
+                                    strip_bom, workers))
+    for report in reports:
+        if not report.ok:
+            logger.warning(f"{report.archive}: {report.error}")
+        for srt in report.files:
+            logger.debug(f"Extracted {srt.member} ({srt.encoding}) "
+                         f"to {srt.path}")
+    return reports
@@ -1,39 +1,218 @@
+import atexit
+import copy
+import json
 import logging.config
 import logging.handlers
+import queue
+import threading
+import time
+from configparser import ConfigParser
+from typing import Dict, Optional, Tuple
 
+DEFAULT_LEVEL = 'INFO'
+DEFAULT_LOG_FILE = 'app.log'
+DEFAULT_MAX_MB = 5
+DEFAULT_BACKUP_COUNT = 3
+DEFAULT_EVENT_RATE = 5.0  # GUI event records per second
+DEFAULT_EVENT_BURST = 20
+EVENTS_LOGGER = 'gui.events'
+TEXT_FORMAT = '%(asctime)s - %(levelname)s - %(name)s - %(message)s'
+DATE_FORMAT = '%Y-%m-%d %H:%M:%S'
+# Attributes of every LogRecord, the others are `extra` fields
+_RECORD_ATTRS = frozenset(logging.makeLogRecord({}).__dict__) | {'message'}
 
-def configure_logging():
+_listener: Optional[logging.handlers.QueueListener] = None
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per record, with the `extra` fields"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        retval = {"time": self.formatTime(record, DATE_FORMAT),
+                  "level": record.levelname,
+                  "logger": record.name,
+                  "thread": record.threadName,
+                  "message": record.getMessage()}
+        for key, value in record.__dict__.items():
+            if key not in _RECORD_ATTRS:
+                retval[key] = value
+        if record.exc_info:
+            retval['exception'] = self.formatException(record.exc_info)
+        elif record.exc_text:  # Formatted by `TracebackQueueHandler`
+            retval['exception'] = record.exc_text
+        if record.stack_info:
+            retval['stack'] = record.stack_info
+        return json.dumps(retval, default=str)
+
+
+class TextFormatter(logging.Formatter):
+    """
+    `TEXT_FORMAT` records, but JSON ones for the loggers of `json_loggers`
+    and their children
+    """
+
+    def __init__(self, json_loggers: Tuple[str, ...] = ()):
+        super().__init__(TEXT_FORMAT, DATE_FORMAT)
+        self.json_loggers = tuple(json_loggers)
+        self._json = JsonFormatter()
+
+    def format(self, record: logging.LogRecord) -> str:
+        if any(record.name == name or record.name.startswith(name + '.')
+               for name in self.json_loggers):
+            return self._json.format(record)
+        return super().format(record)
+
+
+class TracebackQueueHandler(logging.handlers.QueueHandler):
+    """
+    `QueueHandler` keeping the exception of the records: the base class
+    merges the traceback into the message, so the formatters of the
+    listener can't tell them apart. The traceback is formatted here, as
+    `exc_text`, while the frames still exist.
+    """
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        record = copy.copy(record)
+        record.message = record.getMessage()
+        record.msg, record.args = record.message, None
+        if record.exc_info and not record.exc_text:
+            record.exc_text = logging.Formatter().formatException(
+                record.exc_info)
+        record.exc_info = None
+        return record
+
+
+class RateLimitFilter(logging.Filter):
+    """
+    Sampling and rate limiting of high-frequency records: one record out of
+    `sample` is kept, then at most `rate` per second (bursts of `burst`)
+    for each message template. The next record let through tells how many
+    were dropped.
+    """
+
+    def __init__(self, rate: float = DEFAULT_EVENT_RATE,
+                 burst: int = DEFAULT_EVENT_BURST, sample: int = 1):
+        super().__init__()
+        self.rate = rate
+        self.burst = burst
+        self.sample = max(1, sample)
+        self._lock = threading.Lock()
+        # template -> tokens, last update, records seen, records dropped
+        self._state: Dict[Tuple[str, str], list] = {}
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        key = (record.name, str(record.msg))
+        now = time.monotonic()
+        with self._lock:
+            state = self._state.setdefault(key, [self.burst, now, 0, 0])
+            state[2] += 1
+            state[0] = min(self.burst, state[0] + (now - state[1]) * self.rate)
+            state[1] = now
+            if (state[2] - 1) % self.sample or state[0] < 1:
+                state[3] += 1
+                return False
+            state[0] -= 1
+            suppressed, state[3] = state[3], 0
+        if suppressed:
+            record.msg = f"{record.msg} ({suppressed} similar suppressed)"
+        return True
+
+
+def _parse_levels(value: str) -> Dict[str, dict]:
+    """Logger levels from 'backend=INFO, gui.events=WARNING'"""
+    loggers = {}
+    for item in filter(None, (part.strip() for part in value.split(','))):
+        name, _, level = item.partition('=')
+        loggers[name.strip()] = {'level': level.strip().upper()}
+    return loggers
+
+
+def configure_logging(ini: Optional[ConfigParser] = None
+                      ) -> logging.handlers.QueueListener:
+    """
+    Configure logging from the optional `logging` section of `ini`.
+
+    The loggers only put the records in a queue, the console and the file
+    are written by a `QueueListener` thread, so logging never waits for
+    I/O. The listener is stopped, and the queue flushed, at exit.
+    :return: the listener
+    """
+    global _listener
+    ini = ini or ConfigParser()
+
+    def _get(option, fallback):
+        return ini.get('logging', option, fallback=fallback)
+
+    def _format(option):
+        return 'json' if _get(option, 'text').lower() == 'json' else 'text'
+
+    json_loggers = tuple(filter(None, (name.strip() for name in
+                                       _get('json_loggers', '').split(','))))
+
+    handlers = {}
+    filename = _get('file', DEFAULT_LOG_FILE).strip()
+    if filename:  # An empty `file` disables the log file
+        handlers['file'] = {
+            'class': 'logging.handlers.RotatingFileHandler',
+            'formatter': _format('file_format'),
+            'filename': filename,
+            'maxBytes': ini.getint('logging', 'max_mb',
+                                   fallback=DEFAULT_MAX_MB) * 1024 * 1024,
+            'backupCount': ini.getint('logging', 'backup_count',
+                                      fallback=DEFAULT_BACKUP_COUNT),
+            'encoding': 'utf-8',
+            'delay': True,
+        }
+    if ini.getboolean('logging', 'console', fallback=True):
+        handlers['console'] = {
+            'class': 'logging.StreamHandler',
+            'formatter': _format('console_format'),
+        }
     logging_config = {
         'version': 1,
         'disable_existing_loggers': False,
-        'handlers': {
-            'console': {
-                'class': 'logging.StreamHandler',
-                'level': 'DEBUG',
-                'formatter': 'console',
-            },
-            'file': {
-                'class': 'logging.handlers.RotatingFileHandler',
-                'level': 'DEBUG',
-                'formatter': 'file',
-                'filename': 'app.log',
-                'maxBytes': 1024,
-                'backupCount': 5,
-            },
-        },
+        'handlers': handlers,
         'formatters': {
-            'console': {
-                'format': '%(asctime)s - %(levelname)s - %(message)s',
-                'datefmt': '%Y-%m-%d %H:%M:%S',
-            },
-            'file': {
-                'format': '%(asctime)s - %(levelname)s - %(message)s',
-                'datefmt': '%Y-%m-%d %H:%M:%S',
-            },
+            'text': {'()': TextFormatter, 'json_loggers': json_loggers},
+            'json': {'()': JsonFormatter},
         },
+        'loggers': _parse_levels(_get('levels', '')),
         'root': {
-            'level': 'DEBUG',
-            'handlers': ['console', 'file'],
+            'level': _get('level', DEFAULT_LEVEL).upper(),
+            'handlers': list(handlers),
         },
     }
+    if _listener is None:
+        atexit.register(stop_logging)
+    else:
+        _listener.stop()
     logging.config.dictConfig(logging_config)
+    # Move the configured handlers behind the queue
+    root = logging.getLogger()
+    targets = root.handlers[:]
+    records: queue.SimpleQueue = queue.SimpleQueue()
+    for handler in targets:
+        root.removeHandler(handler)
+    root.addHandler(TracebackQueueHandler(records))
+    _listener = logging.handlers.QueueListener(records, *targets,
+                                               respect_handler_level=True)
+    _listener.start()
+
+    events = logging.getLogger(EVENTS_LOGGER)
+    for old in [f for f in events.filters if isinstance(f, RateLimitFilter)]:
+        events.removeFilter(old)
+    events.addFilter(RateLimitFilter(
+        rate=ini.getfloat('logging', 'event_rate',
+                          fallback=DEFAULT_EVENT_RATE),
+        burst=ini.getint('logging', 'event_burst',
+                         fallback=DEFAULT_EVENT_BURST),
+        sample=ini.getint('logging', 'event_sample', fallback=1)))
+    return _listener
+
+
+def stop_logging() -> None:
+    """Write the records still queued and stop the listener thread"""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
@@ -0,0 +1,166 @@
+# workers.py
+
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, Iterable, Optional, Union
+
+import PySimpleGUI as sg
+
+logger = logging.getLogger(__name__)
+
+TASK_DONE_EVENT = '-TASKDONE-'
+TASK_PROGRESS_EVENT = '-TASKPROGRESS-'
+DEFAULT_MAX_WORKERS = 4
+
+
+class TaskCancelled(Exception):
+    """Raised inside a task when the user cancelled it"""
+    pass
+
+
+@dataclass
+class TaskResult:
+    """Posted back to the window when a task completes"""
+    task_id: int
+    kind: str
+    value: Any = None
+    error: Optional[Exception] = None
+    cancelled: bool = False
+
+
+@dataclass
+class TaskProgress:
+    """Posted back to the window when a task reports its progress"""
+    task_id: int
+    kind: str
+    done: int
+    total: Optional[int] = None
+    message: str = ""
+    value: Any = None  # partial results, e.g. a page of search results
+
+
+class TaskContext:
+    """Handed to every task, to report progress and check cancellation"""
+
+    def __init__(self, runner: "TaskRunner", task_id: int, kind: str):
+        self._runner = runner
+        self.task_id = task_id
+        self.kind = kind
+        self._cancelled = threading.Event()
+
+    @property
+    def cancelled(self) -> bool:
+        return self._cancelled.is_set()
+
+    @property
+    def cancel_event(self) -> threading.Event:
+        """Set when the task is cancelled, for code waiting on events"""
+        return self._cancelled
+
+    def cancel(self) -> None:
+        self._cancelled.set()
+
+    def check(self) -> None:
+        """Raise `TaskCancelled` if the task has been cancelled"""
+        if self.cancelled:
+            raise TaskCancelled()
+
+    def progress(self, done: int, total: Optional[int] = None,
+                 message: str = "", value: Any = None) -> None:
+        """Report the progress, also a cancellation point"""
+        self.check()
+        self._runner.post(TASK_PROGRESS_EVENT, TaskProgress(
+            task_id=self.task_id, kind=self.kind, done=done, total=total,
+            message=message, value=value))
+
+
+class TaskRunner:
+    """
+    Runs the blocking operations (network, extraction) on a pool of worker
+    threads so the event loop never freezes. Completion and progress are
+    posted back to the window as `TASK_DONE_EVENT`/`TASK_PROGRESS_EVENT`
+    events.
+
+    Only the latest task of each kind is current: submitting a new one, or
+    cancelling, makes the previous results stale and they must be ignored
+    (see `is_current`).
+    """
+
+    def __init__(self, window: sg.Window,
+                 max_workers: int = DEFAULT_MAX_WORKERS):
+        self.window = window
+        self._executor = ThreadPoolExecutor(max_workers=max_workers)
+        self._lock = threading.Lock()
+        self._last_id = 0
+        self._current: Dict[str, TaskContext] = {}
+
+    def submit(self, kind: str, func: Callable[..., Any],
+               *args, **kwargs) -> int:
+        """
+        Run `func(context, *args, **kwargs)` in a worker thread, cancelling
+        the running task of the same `kind` if any
+        :return: the task id
+        """
+        with self._lock:
+            self._last_id += 1
+            context = TaskContext(self, self._last_id, kind)
+            previous = self._current.get(kind)
+            self._current[kind] = context
+        if previous:
+            previous.cancel()
+        self._executor.submit(self._run, context, func, args, kwargs)
+        return context.task_id
+
+    def _run(self, context: TaskContext, func: Callable[..., Any],
+             args: tuple, kwargs: dict) -> None:
+        result = TaskResult(task_id=context.task_id, kind=context.kind)
+        try:
+            result.value = func(context, *args, **kwargs)
+            result.cancelled = context.cancelled
+        except TaskCancelled:
+            result.cancelled = True
+        except Exception as ex:
+            logger.exception(f"Task {context.kind} failed")
+            result.error = ex
+        self.post(TASK_DONE_EVENT, result)
+
+    def post(self, event: str, value: Any) -> None:
+        """Send an event to the window, thread safe"""
+        try:
+            self.window.write_event_value(event, value)
+        except Exception:  # The window has been closed meanwhile
+            pass
+
+    def is_current(self, result: Union[TaskResult, TaskProgress]) -> bool:
+        """False if `result` belongs to a task cancelled or superseded"""
+        with self._lock:
+            context = self._current.get(result.kind)
+        return bool(context) and context.task_id == result.task_id \
+            and not context.cancelled
+
+    def is_busy(self, ignore: Iterable[str] = ()) -> bool:
+        """True if a task is running, except the tasks of `ignore` kinds"""
+        with self._lock:
+            return any(not ctx.cancelled for kind, ctx in self._current.items()
+                       if kind not in ignore)
+
+    def finished(self, result: TaskResult) -> None:
+        """Forget the task of `result` once its outcome has been handled"""
+        with self._lock:
+            context = self._current.get(result.kind)
+            if context and context.task_id == result.task_id:
+                del self._current[result.kind]
+
+    def cancel(self, kind: Optional[str] = None) -> None:
+        """Cancel the current task of `kind`, or every task if None"""
+        with self._lock:
+            contexts = [ctx for k, ctx in self._current.items()
+                        if kind is None or k == kind]
+        for context in contexts:
+            context.cancel()
+
+    def shutdown(self) -> None:
+        self.cancel()
+        self._executor.shutdown(wait=False)
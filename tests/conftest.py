@@ -0,0 +1,122 @@
+# conftest.py
+
+import os
+import re
+import sys
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Optional, Tuple
+
+import pytest
+
+# The backend is imported as the `backend` package of the project root
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+FIXTURES_FOLDER = os.path.join(ROOT, 'benchmarks', 'fixtures')
+
+
+def read_fixture(name: str) -> bytes:
+    with open(os.path.join(FIXTURES_FOLDER, name), 'rb') as fh:
+        return fh.read()
+
+
+class Site:
+    """
+    A local web site: `pages` maps a path, or a path prefix ending with
+    '*', to its body and ETag, a request with a matching If-None-Match gets
+    a 304. Range requests are honored, unless If-Range doesn't match the
+    ETag. `errors` maps a path to the statuses and headers answered before
+    its page, one per request, status 0 drops the connection. Requests, and
+    the client address of each one, are recorded. Connections are kept
+    alive (HTTP/1.1).
+    """
+
+    def __init__(self):
+        self.pages: Dict[str, Tuple[bytes, Optional[str]]] = {}
+        self.requests: List[Tuple[str, Dict[str, str]]] = []
+        self.errors: Dict[str, List[Tuple[int, Dict[str, str]]]] = {}
+        self.clients: List[Tuple[str, int]] = []
+        site = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def do_GET(self):
+                site.requests.append((self.path, dict(self.headers)))
+                site.clients.append(self.client_address)
+                if site.errors.get(self.path):
+                    status, headers = site.errors[self.path].pop(0)
+                    if not status:
+                        self.close_connection = True
+                        return
+                    self.send_response(status)
+                    for name, value in headers.items():
+                        self.send_header(name, value)
+                    self.send_header('Content-Length', '0')
+                    self.end_headers()
+                    return
+                page = site.page(self.path)
+                if page is None:
+                    return self.send_error(404)
+                body, etag = page
+                if etag and self.headers.get('If-None-Match') == etag:
+                    self.send_response(304)
+                    self.end_headers()
+                    return
+                status, start = 200, 0
+                ranged = re.fullmatch(r'bytes=(\d+)-',
+                                      self.headers.get('Range', ''))
+                if ranged and self.headers.get('If-Range', etag) == etag:
+                    start = int(ranged.group(1))
+                    if start >= len(body):
+                        return self.send_error(416)
+                    status = 206
+                self.send_response(status)
+                self.send_header('Content-Type', 'text/html; charset=utf-8')
+                self.send_header('Content-Length', str(len(body) - start))
+                if status == 206:
+                    self.send_header('Content-Range', f"bytes {start}-"
+                                     f"{len(body) - 1}/{len(body)}")
+                if etag:
+                    self.send_header('ETag', etag)
+                self.end_headers()
+                self.wfile.write(body[start:])
+
+            def log_message(self, format, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.server.daemon_threads = True
+        self.url = f"http://127.0.0.1:{self.server.server_address[1]}"
+        threading.Thread(target=self.server.serve_forever,
+                         daemon=True).start()
+
+    def page(self, path: str) -> Optional[Tuple[bytes, Optional[str]]]:
+        if path in self.pages:
+            return self.pages[path]
+        for key, page in self.pages.items():
+            if key.endswith('*') and path.startswith(key[:-1]):
+                return page
+        return None
+
+    def paths(self) -> List[str]:
+        return [path for path, _ in self.requests]
+
+
+@pytest.fixture
+def site():
+    from backend.transport import configure_transport
+    configure_transport(rate=1000, burst=1000, retries=0)
+    site = Site()
+    yield site
+    site.server.shutdown()
+    site.server.server_close()
+
+
+@pytest.fixture
+def response_cache(tmp_path):
+    from backend.cache import configure_cache
+    cache = configure_cache(str(tmp_path / 'cache.sqlite'))
+    yield cache
+    configure_cache(None)
@@ -0,0 +1,102 @@
+# test_api.py
+
+import importlib.util
+import os
+import time
+from configparser import ConfigParser
+
+import pytest
+
+pytest.importorskip('flask')
+pytest.importorskip('flask_cors')
+
+API_PATH = os.path.join(os.path.dirname(os.path.dirname(
+    os.path.abspath(__file__))), 'frontend-api', 'api.py')
+DOMAIN = 'https://www.opensubtitles.org'
+
+
+@pytest.fixture
+def api():
+    spec = importlib.util.spec_from_file_location('api', API_PATH)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+@pytest.fixture
+def client(api, tmp_path, monkeypatch):
+    requested = []
+
+    def fake_listing(url):
+        requested.append(url)
+        return []
+
+    monkeypatch.setattr(api, 'get_subtitles_for_show', fake_listing)
+    ini = ConfigParser()
+    ini.read_dict({
+        'parser': {'OST_DOMAIN': DOMAIN,
+                   'OST_SEARCH_URL': DOMAIN + '/en/search2/'
+                                              'sublanguageid-{}/moviename-'},
+        'service': {'download_folder': str(tmp_path)},
+    })
+    app = api.create_app(ini)
+    client = app.test_client()
+    client.requested = requested
+    return client
+
+
+@pytest.mark.parametrize('href', [
+    '/en/search/sublanguageid-eng/idmovie-1',
+    DOMAIN + '/en/search/sublanguageid-eng/idmovie-1',
+    'https://dl.opensubtitles.org/en/download/sub/1',
+])
+def test_show_accepts_site_hrefs(client, href):
+    response = client.get('/show', query_string={'href': href})
+    assert response.status_code == 200
+    assert client.requested[0].startswith(('https://www.opensubtitles.org',
+                                           'https://dl.opensubtitles.org'))
+
+
+@pytest.mark.parametrize('href', [
+    'http://127.0.0.1:1/secret',
+    'https://opensubtitles.org.evil.com/x',
+    '//127.0.0.1/x',
+    'file:///etc/passwd',
+    'en/search',
+])
+def test_show_rejects_other_urls(client, href):
+    response = client.get('/show', query_string={'href': href})
+    assert response.status_code == 400
+    assert client.requested == []
+
+
+def test_download_rejects_other_urls(client):
+    response = client.post('/downloads',
+                           json={'href': 'http://169.254.169.254/latest'})
+    assert response.status_code == 400
+
+
+def test_backend_timeout_is_504(api, client, monkeypatch):
+    monkeypatch.setattr(api, 'REQUEST_TIMEOUT', 0.05)
+    monkeypatch.setattr(api, 'get_subtitles_for_show',
+                        lambda url: time.sleep(0.5))
+    response = client.get('/show', query_string={'href': '/en/x'})
+    assert response.status_code == 504
+    assert 'error' in response.get_json()
+
+
+def test_unexpected_show_page_is_a_502(api, site, tmp_path):
+    site.pages['/en/search/idmovie-1'] = (b'<html><body>Maintenance'
+                                          b'</body></html>', None)
+    ini = ConfigParser()
+    ini.read_dict({
+        'parser': {'OST_DOMAIN': site.url,
+                   'OST_SEARCH_URL': site.url + '/en/search2/'
+                                                'sublanguageid-{}/moviename-'},
+        'service': {'download_folder': str(tmp_path)},
+    })
+    client = api.create_app(ini).test_client()
+    response = client.get('/show', query_string={
+        'href': '/en/search/idmovie-1'})
+    assert response.status_code == 502
+    assert 'Unexpected page' in response.get_json()['error']
@@ -0,0 +1,86 @@
+# test_batch.py
+
+import asyncio
+import threading
+import time
+
+import requests
+
+import backend.batch as batch
+from backend.batch import search_many, run_many
+
+
+def _collect(results) -> list:
+    async def _run():
+        return [result async for result in results]
+    return asyncio.run(_run())
+
+
+def test_search_many_yields_in_completion_order(monkeypatch):
+    delays = {'slow': 0.3, 'medium': 0.15, 'fast': 0}
+
+    def _search(query, root_search):
+        time.sleep(delays[query])
+        return [query + root_search]
+
+    monkeypatch.setattr(batch, 'search_show', _search)
+    results = _collect(search_many(['slow', 'medium', 'fast'], '/root'))
+    assert [result.item for result in results] == ['fast', 'medium', 'slow']
+    assert [result.value for result in results] == \
+        [['fast/root'], ['medium/root'], ['slow/root']]
+    assert results[2].elapsed >= 0.25
+
+
+def test_timed_out_query_does_not_stop_the_others(monkeypatch):
+    def _search(query, root_search):
+        if query == 'late':
+            raise requests.ReadTimeout("read timed out")
+        return [query]
+
+    monkeypatch.setattr(batch, 'search_show', _search)
+    results = _collect(search_many(['a', 'late', 'b'], '/root'))
+    by_item = {result.item: result for result in results}
+    assert len(results) == 3
+    assert not by_item['late'].ok
+    assert isinstance(by_item['late'].error, requests.Timeout)
+    assert by_item['late'].to_json()['error'] == "read timed out"
+    assert by_item['a'].ok and by_item['b'].value == ['b']
+
+
+def test_concurrency_is_bounded():
+    lock = threading.Lock()
+    running, peak = [0], [0]
+
+    def _work(item):
+        with lock:
+            running[0] += 1
+            peak[0] = max(peak[0], running[0])
+        time.sleep(0.05)
+        with lock:
+            running[0] -= 1
+        return item
+
+    results = _collect(run_many([str(n) for n in range(12)], _work,
+                                concurrency=3))
+    assert sorted(int(result.item) for result in results) == list(range(12))
+    assert peak[0] == 3
+
+
+def test_closing_early_stops_reading_the_items():
+    read = []
+
+    def _items():
+        for n in range(1000):
+            read.append(n)
+            yield str(n)
+
+    async def _first():
+        results = run_many(_items(), lambda item: item, concurrency=2)
+        try:
+            return await results.__anext__()
+        finally:
+            await results.aclose()
+
+    assert asyncio.run(_first()).ok
+    time.sleep(0.2)
+    assert len(read) < 10
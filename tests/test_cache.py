@@ -0,0 +1,81 @@
+# test_cache.py
+
+import time
+
+import pytest
+
+from backend.cache import PAGE_SEARCH, PAGE_SHOW, ResponseCache
+from backend.ostdownloader import _get_text, search_show
+from conftest import read_fixture
+
+SEARCH = '/en/search2/sublanguageid-eng/moviename-'
+
+
+def test_fresh_and_stale_entries(tmp_path):
+    cache = ResponseCache(str(tmp_path / 'c.sqlite'),
+                          ttls={PAGE_SEARCH: 0, PAGE_SHOW: 60})
+    cache.store('http://x/a', PAGE_SHOW, 'body', etag='"1"')
+    cache.store('http://x/b', PAGE_SEARCH, 'body')
+    assert cache.is_fresh(cache.get('http://x/a'))
+    assert not cache.is_fresh(cache.get('http://x/b'))
+    assert cache.get('http://x/missing') is None
+
+
+def test_store_drops_the_parsed_result(tmp_path):
+    cache = ResponseCache(str(tmp_path / 'c.sqlite'))
+    cache.store('http://x/a', PAGE_SHOW, 'body')
+    cache.store_parsed('http://x/a', [{"name": "n", "href": "h"}])
+    assert cache.get('http://x/a').parsed == [{"name": "n", "href": "h"}]
+    cache.store('http://x/a', PAGE_SHOW, 'new body')
+    assert cache.get('http://x/a').parsed is None
+
+
+def test_least_recently_used_are_evicted(tmp_path):
+    cache = ResponseCache(str(tmp_path / 'c.sqlite'), max_bytes=250)
+    cache.store('http://x/a', PAGE_SHOW, 'a' * 100)
+    time.sleep(0.01)
+    cache.store('http://x/b', PAGE_SHOW, 'b' * 100)
+    time.sleep(0.01)
+    cache.get('http://x/a')  # Now b is the least recently used
+    cache.store('http://x/c', PAGE_SHOW, 'c' * 100)
+    assert cache.get('http://x/b') is None
+    assert cache.get('http://x/a') and cache.get('http://x/c')
+    assert cache.total_size() <= 250
+
+
+def test_fresh_entry_served_without_request(site, response_cache):
+    site.pages['/page'] = (b'<html>one</html>', '"v1"')
+    url = site.url + '/page'
+    assert _get_text(url, PAGE_SHOW) == ('<html>one</html>', None)
+    text, entry = _get_text(url, PAGE_SHOW)
+    assert text == '<html>one</html>' and entry is not None
+    assert site.paths() == ['/page']
+
+
+def test_stale_entry_is_revalidated(site, response_cache):
+    response_cache.ttls[PAGE_SHOW] = 0
+    site.pages['/page'] = (b'<html>one</html>', '"v1"')
+    url = site.url + '/page'
+    _get_text(url, PAGE_SHOW)
+    fetched_at = response_cache.get(url).fetched_at
+    # Unchanged: 304, the cached body is used and its age reset
+    text, entry = _get_text(url, PAGE_SHOW)
+    assert text == '<html>one</html>' and entry is not None
+    assert site.requests[1][1].get('If-None-Match') == '"v1"'
+    assert response_cache.get(url).fetched_at > fetched_at
+    # Changed: the new body replaces the entry
+    site.pages['/page'] = (b'<html>two</html>', '"v2"')
+    assert _get_text(url, PAGE_SHOW) == ('<html>two</html>', None)
+    assert response_cache.get(url).etag == '"v2"'
+
+
+def test_unparsable_page_is_not_cached(site, response_cache):
+    path = SEARCH + 'captcha'
+    site.pages[path] = (b'<html><body>Are you a robot?</body></html>', None)
+    with pytest.raises(ValueError):
+        search_show('captcha', site.url + SEARCH)
+    assert response_cache.get(site.url + path) is None
+    # Once the site answers again the page is fetched, not the captcha
+    site.pages[path] = (read_fixture('search_results.html'), None)
+    assert search_show('captcha', site.url + SEARCH)
+    assert site.paths() == [path, path]
@@ -0,0 +1,81 @@
+# test_cli.py
+
+import io
+import json
+import os
+import subprocess
+import sys
+
+import pytest
+
+from backend.cli import main
+from conftest import ROOT, read_fixture
+
+SEARCH = '/en/search2/sublanguageid-eng/moviename-'
+
+
+@pytest.fixture
+def config(site, tmp_path):
+    site.pages[SEARCH + 'the+expanse'] = (read_fixture('search_results.html'),
+                                          None)
+    path = tmp_path / 'config.ini'
+    path.write_text(f"""
+[parser]
+ost_domain = {site.url}
+ost_search_url = {site.url}/en/search2/sublanguageid-{{}}/moviename-
+[network]
+rate_limit = 1000
+rate_burst = 1000
+retries = 0
+""")
+    return str(path)
+
+
+def _lines(text):
+    return [json.loads(line) for line in text.splitlines()]
+
+
+def test_search_writes_a_line_per_show(config, capsys):
+    assert main(['--config', config, 'search', 'the', 'expanse']) == 0
+    out, err = capsys.readouterr()
+    shows = _lines(out)
+    assert shows and all({'name', 'href'} <= set(show) for show in shows)
+    assert 'Searching' in err
+
+
+def test_missing_config_fails(tmp_path, capsys):
+    assert main(['--config', str(tmp_path / 'none.ini'), 'search', 'x']) == 1
+    out, err = capsys.readouterr()
+    assert out == "" and 'is missing' in err
+
+
+def test_batch_results_and_exit_code(config, capsys, monkeypatch):
+    monkeypatch.setattr(sys, 'stdin',
+                        io.StringIO("the expanse\n\nnot found\n"))
+    assert main(['--config', config, 'batch', '--workers', '2']) == 1
+    out, _ = capsys.readouterr()
+    by_item = {line['item']: line for line in _lines(out)}
+    assert set(by_item) == {'the expanse', 'not found'}
+    assert by_item['the expanse']['results']
+    assert 'error' in by_item['not found']
+
+
+def test_batch_stops_when_the_output_is_closed(site, config, tmp_path):
+    site.pages[SEARCH + '*'] = (read_fixture('search_results.html'), None)
+    with open(tmp_path / 'stderr', 'w+') as stderr:
+        proc = subprocess.Popen(
+            [sys.executable, '-m', 'backend.cli', '--config', config,
+             'batch'],
+            stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=stderr,
+            cwd=ROOT, env={**os.environ, 'PYTHONPATH': ROOT})
+        proc.stdin.write(''.join(f"title {n}\n"
+                                 for n in range(3000)).encode())
+        proc.stdin.close()
+        json.loads(proc.stdout.readline())
+        proc.stdout.close()
+        assert proc.wait(timeout=60) == 1
+        stderr.seek(0)
+        err = stderr.read()
+    assert "Output closed, stopped" in err
+    assert 'Traceback' not in err
+    assert len(site.requests) < 3000
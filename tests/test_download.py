@@ -0,0 +1,69 @@
+# test_download.py
+
+import os
+
+import pytest
+
+from backend.ostdownloader import download_srt_files
+
+BODY = bytes(range(256)) * 64
+
+
+class Abort(Exception):
+    pass
+
+
+def _abort_after(limit):
+    def _progress(done, total):
+        if done >= limit:
+            raise Abort()
+    return _progress
+
+
+def _interrupted(site, path, target):
+    """Download `path` until 4 KiB, the partial file is left"""
+    with pytest.raises(Abort):
+        download_srt_files(site.url + path, target, chunk_size=1024,
+                           progress=_abort_after(4096))
+    assert os.path.getsize(target + '.part') == 4096
+
+
+def test_download_resumes_the_partial_file(site, tmp_path):
+    site.pages['/download/1'] = (BODY, '"v1"')
+    target = str(tmp_path / 'show.zip')
+    _interrupted(site, '/download/1', target)
+    stats = download_srt_files(site.url + '/download/1', target)
+    assert stats.resumed_from == 4096
+    assert stats.bytes_written == len(BODY) - 4096
+    assert site.requests[-1][1]['Range'] == 'bytes=4096-'
+    assert site.requests[-1][1]['If-Range'] == '"v1"'
+    with open(target, 'rb') as fh:
+        assert fh.read() == BODY
+    assert os.listdir(tmp_path) == ['show.zip']
+
+
+def test_partial_of_another_url_is_not_resumed(site, tmp_path):
+    # The GUI names the archives by show: another subtitle of the same
+    # show goes to the same file
+    other = bytes(reversed(BODY))
+    site.pages['/download/1'] = (BODY, '"v1"')
+    site.pages['/download/2'] = (other, '"v1"')
+    target = str(tmp_path / 'show.zip')
+    _interrupted(site, '/download/1', target)
+    stats = download_srt_files(site.url + '/download/2', target)
+    assert stats.resumed_from == 0
+    assert 'Range' not in site.requests[-1][1]
+    with open(target, 'rb') as fh:
+        assert fh.read() == other
+
+
+def test_changed_remote_file_is_downloaded_again(site, tmp_path):
+    site.pages['/download/1'] = (BODY, '"v1"')
+    target = str(tmp_path / 'show.zip')
+    _interrupted(site, '/download/1', target)
+    changed = BODY[::-1]
+    site.pages['/download/1'] = (changed, '"v2"')
+    stats = download_srt_files(site.url + '/download/1', target)
+    assert stats.resumed_from == 0
+    with open(target, 'rb') as fh:
+        assert fh.read() == changed
@@ -0,0 +1,84 @@
+# test_libindex.py
+
+import os
+
+from backend.libindex import LibraryIndex, STATUS_FAILED, \
+    STATUS_NO_RESULT, is_srt_of
+
+EXTENSIONS = ('.mkv',)
+
+
+def _index(tmp_path):
+    return LibraryIndex(str(tmp_path / 'index.sqlite'))
+
+
+def _media(folder, name, data=b'video'):
+    path = folder / name
+    path.write_bytes(data)
+    return str(path)
+
+
+def test_srt_of_the_media_only():
+    assert is_srt_of('Movie.srt', '/m/Movie.mkv')
+    assert is_srt_of('movie.en.srt', '/m/Movie.mkv')
+    assert is_srt_of('Movie.pt-br.srt', '/m/Movie.mkv')
+    assert not is_srt_of('Movie.2.srt', '/m/Movie.mkv')
+    assert not is_srt_of('Movie 2.srt', '/m/Movie.mkv')
+    assert not is_srt_of('Movie.2.en.srt', '/m/Movie.mkv')
+
+
+def test_sequel_subtitles_dont_count(tmp_path):
+    library = tmp_path / 'library'
+    library.mkdir()
+    movie = _media(library, 'Movie.mkv')
+    _media(library, 'Movie.2.mkv')
+    (library / 'Movie.2.srt').write_text('subtitles')
+    index = _index(tmp_path)
+    index.scan(str(library), EXTENSIONS)
+    assert index.pending(['eng']) == [movie]
+    (library / 'Movie.en.srt').write_text('subtitles')
+    index.scan(str(library), EXTENSIONS)
+    assert index.pending(['eng']) == []
+
+
+def test_failed_lookups_are_retried_later(tmp_path):
+    library = tmp_path / 'library'
+    library.mkdir()
+    failed = _media(library, 'a.mkv')
+    no_result = _media(library, 'b.mkv')
+    index = _index(tmp_path)
+    index.scan(str(library), EXTENSIONS)
+    index.record_failure(failed, STATUS_FAILED, now=1000)
+    index.record_failure(no_result, STATUS_NO_RESULT, now=1000)
+    assert index.pending(['eng'], retry_interval=60, now=1030) == []
+    assert index.pending(['eng'], retry_interval=60, now=1061) == \
+        [failed, no_result]
+
+
+def test_changed_media_is_retried_at_once(tmp_path):
+    library = tmp_path / 'library'
+    library.mkdir()
+    path = _media(library, 'a.mkv')
+    index = _index(tmp_path)
+    index.scan(str(library), EXTENSIONS)
+    index.record_failure(path, STATUS_NO_RESULT, now=1000)
+    assert index.pending(['eng'], now=1001) == []
+    _media(library, 'a.mkv', b'another video')
+    os.utime(path, ns=(0, 10 ** 9))
+    index.scan(str(library), EXTENSIONS, full=True)
+    assert index.pending(['eng'], now=1001) == [path]
+
+
+def test_fetch_clears_the_failure(tmp_path):
+    library = tmp_path / 'library'
+    library.mkdir()
+    path = _media(library, 'a.mkv')
+    index = _index(tmp_path)
+    index.scan(str(library), EXTENSIONS)
+    index.record_failure(path, STATUS_FAILED)
+    index.record_fetch(path, 'abc', ['eng'], [str(library / 'a.srt')])
+    # The subtitle file is gone, another language is still wanted
+    index.scan(str(library), EXTENSIONS, full=True)
+    assert index.pending(['eng']) == []
+    assert index.pending(['ita']) == [path]
+
@@ -0,0 +1,66 @@
+# test_library.py
+
+import os
+import struct
+
+import pytest
+
+from backend.library import Lookups, compute_movie_hash, process_media_file
+
+SEARCH = '/en/search2/sublanguageid-eng/moviename-'
+
+
+def _reference_hash(path):
+    """The hash as computed by the OpenSubtitles sample code"""
+    size = os.path.getsize(path)
+    value = size
+    with open(path, 'rb') as fh:
+        for offset in (0, size - 65536):
+            fh.seek(offset)
+            for _ in range(65536 // 8):
+                value += struct.unpack('<Q', fh.read(8))[0]
+                value &= 0xFFFFFFFFFFFFFFFF
+    return f"{value:016x}"
+
+
+def test_movie_hash(tmp_path):
+    path = tmp_path / 'movie.mkv'
+    path.write_bytes(os.urandom(200 * 1024 + 3))
+    assert compute_movie_hash(str(path)) == \
+        (_reference_hash(str(path)), 200 * 1024 + 3)
+
+
+def test_movie_hash_of_a_small_file(tmp_path):
+    path = tmp_path / 'movie.mkv'
+    path.write_bytes(struct.pack('<2Q', 1, 2))
+    # Both blocks are the whole file
+    assert compute_movie_hash(str(path)) == (f"{16 + 2 * 3:016x}", 16)
+
+
+def test_movie_hash_of_an_empty_file(tmp_path):
+    path = tmp_path / 'movie.mkv'
+    path.write_bytes(b'')
+    with pytest.raises(ValueError):
+        compute_movie_hash(str(path))
+
+
+class NoShows(Lookups):
+    def __init__(self):
+        self.searched = []
+
+    def search_show(self, search_terms, root_search):
+        self.searched.append(search_terms)
+        return []
+
+
+def test_failed_hash_search_falls_back_to_the_name(site, tmp_path):
+    # The stand-in site has no hash search page: 404
+    path = tmp_path / 'The.Expanse.S01E02.mkv'
+    path.write_bytes(os.urandom(1024))
+    lookups = NoShows()
+    result = process_media_file(str(path), site.url + SEARCH, site.url,
+                                download=False, lookups=lookups)
+    assert 'moviehash-' in site.paths()[0]
+    assert lookups.searched == ['the expanse S01E02']
+    assert result.matched_by == 'name'
+    assert result.not_found and result.error == "No show found"
@@ -0,0 +1,82 @@
+# test_logging_conf.py
+
+import json
+import logging
+import os
+import sys
+from configparser import ConfigParser
+
+import pytest
+
+from conftest import ROOT
+
+sys.path.insert(0, os.path.join(ROOT, 'frontend-gui'))
+import logging_conf  # noqa: E402
+from logging_conf import configure_logging, stop_logging  # noqa: E402
+
+
+@pytest.fixture
+def log_to(tmp_path):
+    root = logging.getLogger()
+    level, handlers = root.level, root.handlers[:]
+
+    def _configure(**options):
+        ini = ConfigParser()
+        ini['logging'] = {'console': 'false', 'level': 'DEBUG',
+                          'file': str(tmp_path / 'app.log'), **options}
+        configure_logging(ini)
+        return tmp_path / 'app.log'
+
+    yield _configure
+    stop_logging()
+    for handler in root.handlers[:]:
+        root.removeHandler(handler)
+        handler.close()
+    for handler in handlers:
+        root.addHandler(handler)
+    root.setLevel(level)
+
+
+def _log_exception(logger):
+    try:
+        1 / 0
+    except ZeroDivisionError:
+        logging.getLogger(logger).exception("Failed %s", 'here')
+
+
+def test_json_records_keep_the_exception(log_to):
+    path = log_to(file_format='json')
+    _log_exception('backend.test')
+    stop_logging()
+    record = json.loads(path.read_text())
+    assert record['message'] == "Failed here"
+    assert record['logger'] == 'backend.test'
+    assert 'ZeroDivisionError' in record['exception']
+
+
+def test_text_records_keep_the_exception(log_to):
+    path = log_to()
+    _log_exception('backend.test')
+    stop_logging()
+    text = path.read_text()
+    assert ' - ERROR - backend.test - Failed here\nTraceback' in text
+    assert text.rstrip().endswith('ZeroDivisionError: division by zero')
+
+
+def test_json_only_for_some_loggers(log_to):
+    path = log_to(json_loggers='backend')
+    logging.getLogger('backend.cache').info("json %d", 1)
+    logging.getLogger('backendish').info("text")
+    logging.getLogger('gui').info("text")
+    stop_logging()
+    lines = path.read_text().splitlines()
+    assert json.loads(lines[0])['message'] == "json 1"
+    assert lines[1].endswith(' - INFO - backendish - text')
+    assert lines[2].endswith(' - INFO - gui - text')
+
+
+def test_empty_file_means_no_log_file(log_to):
+    log_to(file='', console='true')
+    listener = logging_conf._listener
+    assert [type(handler) for handler in listener.handlers] == \
+        [logging.StreamHandler]
@@ -0,0 +1,90 @@
+# test_matching.py
+
+import pytest
+
+from backend.library import search_terms_from_filename
+from backend.matching import AUTO_SELECT_THRESHOLD, TokenIndex, \
+    parse_media_filename, rank_shows, show_info
+from backend.ostdownloader import SubtitledShow
+from backend.season import parse_episode_code
+
+
+@pytest.mark.parametrize('filename, code', [
+    ('Show.S01E02.720p.mkv', (1, 2)),
+    ('show_s1e3.mkv', (1, 3)),
+    ('Show.s01.e05.mkv', (1, 5)),
+    ('Dark.S01-E04.mkv', (1, 4)),
+    ('Show 1x02.avi', (1, 2)),
+    ('/series/S01/Show.mkv', None),
+    ('Movie.1920x1080.mkv', None),
+    ('Sequels2.mkv', None),
+])
+def test_episode_code_of_media_files(filename, code):
+    assert parse_episode_code(filename) == code
+
+
+def test_same_episode_codes_for_media_and_shows():
+    media = parse_media_filename('The.Expanse.S02E05.1080p.WEB.mkv')
+    assert (media.title, media.season, media.episode) == \
+        ('the expanse', 2, 5)
+    show = show_info(SubtitledShow(name='"The Expanse" Home', href='',
+                                   episode='[S02E05]'))
+    assert (show.title, show.season, show.episode) == ('the expanse', 2, 5)
+    assert show_info(SubtitledShow(name='The Expanse 2x05', href='')
+                     ).episode == 5
+
+
+@pytest.mark.parametrize('filename, title, code, group', [
+    ('Show.s01.e05.mkv', 'show', 'S01E05', ''),
+    ('Dark.S01-E04.mkv', 'dark', 'S01E04', ''),
+    ('Dark S01 E04.mkv', 'dark', 'S01E04', ''),
+    ('Dark_S01_E04.mkv', 'dark', 'S01E04', ''),
+    ('Show.Name.S01E03.720p.HDTV.x264-GROUP.mkv', 'show name', 'S01E03',
+     'group'),
+    ('The.Expanse.S02E05-GRP.mkv', 'the expanse', 'S02E05', 'grp'),
+    ('Movie.2010.1080p.BluRay.x264-SPARKS [rarbg].mkv', 'movie', '',
+     'sparks'),
+    ('Spider-Man.mkv', 'spider man', '', ''),
+    ('X-Men.avi', 'x men', '', ''),
+    ('Spider-Man.2002.1080p.x264-EVO.mkv', 'spider man', '', 'evo'),
+])
+def test_media_filename(filename, title, code, group):
+    media = parse_media_filename(filename)
+    assert (media.title, media.episode_code, media.group) == \
+        (title, code, group)
+
+
+def test_hyphenated_title_ranks_its_show_first():
+    shows = [SubtitledShow(name='X (2022)', href='/idmovie-1'),
+             SubtitledShow(name='X-Men (2000)', href='/idmovie-2')]
+    ranked = rank_shows(parse_media_filename('X-Men.mkv'), shows)
+    assert ranked[0].item is shows[1]
+    assert ranked[1].score < AUTO_SELECT_THRESHOLD
+
+
+def test_search_terms_of_separated_episode_codes():
+    assert search_terms_from_filename('/tv/Show.s01.e05.mkv') == \
+        'show S01E05'
+
+
+def test_index_built_once_per_result_list(monkeypatch):
+    import backend.matching as matching
+    built = []
+    monkeypatch.setattr(matching, 'TokenIndex',
+                        lambda items, info: built.append(items) or
+                        TokenIndex(items, info))
+
+    def _shows():
+        return [SubtitledShow(name='The Expanse (2015)', href='/idmovie-1'),
+                SubtitledShow(name='Expanse', href='/idmovie-2')]
+
+    shows = _shows()
+    for episode in range(1, 4):
+        media = parse_media_filename(f'The.Expanse.S01E0{episode}.mkv')
+        assert rank_shows(media, shows)[0].item is shows[0]
+    # Equal results of another search: the index is shared, the items are
+    # the ones of the caller
+    again = _shows()
+    assert rank_shows(parse_media_filename('Expanse.mkv'),
+                      again)[0].item is again[1]
+    assert len(built) == 1
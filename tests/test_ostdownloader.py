@@ -0,0 +1,176 @@
+# test_ostdownloader.py
+
+import threading
+
+import pytest
+
+import backend.ostdownloader as ost
+from backend.ostdownloader import SEARCH_PAGE_SIZE, SubtitledShow, \
+    iter_search_languages, iter_search_pages, merge_shows
+
+HREFS = {
+    'eng': ['/en/search/sublanguageid-eng/idmovie-1',
+            '/en/search/sublanguageid-eng/idmovie-2'],
+    'ita': ['/en/search/sublanguageid-ita/idmovie-2',
+            '/en/search/sublanguageid-ita/idmovie-3'],
+}
+
+
+def _pages(search_terms, root_search, max_pages):
+    language = root_search.rsplit('-', 1)[1]
+    yield [SubtitledShow(name=href, href=href) for href in HREFS[language]]
+
+
+def test_search_languages_never_modifies_a_yielded_show(monkeypatch):
+    monkeypatch.setattr(ost, 'iter_search_pages', _pages)
+    yielded = []
+    shows = []
+    for language, page_shows in iter_search_languages(
+            'terms', '/en/search2/sublanguageid-{}', ['eng', 'ita']):
+        yielded.extend((show, show.to_json()) for show in page_shows)
+        shows = merge_shows(shows, page_shows)
+    for show, snapshot in yielded:
+        assert show.to_json() == snapshot
+    by_movie = {show.href.rsplit('/', 1)[1]: show for show in shows}
+    assert len(shows) == 3
+    assert by_movie['idmovie-1'].languages == ['eng']
+    assert by_movie['idmovie-3'].languages == ['ita']
+    both = by_movie['idmovie-2']
+    assert sorted(both.languages) == ['eng', 'ita']
+    assert both.href == '/en/search/sublanguageid-' + \
+        ','.join(both.languages) + '/idmovie-2'
+
+
+def test_merge_shows_replaces_in_place():
+    first = [SubtitledShow(name='a', href='/sublanguageid-eng/idmovie-1'),
+             SubtitledShow(name='b', href='/sublanguageid-eng/idmovie-2')]
+    update = SubtitledShow(name='a', href='/sublanguageid-eng,ita/idmovie-1',
+                           languages=['eng', 'ita'])
+    new = SubtitledShow(name='c', href='/sublanguageid-ita/idmovie-3')
+    merged = merge_shows(first, [update, new])
+    assert merged == [update, first[1], new]
+    assert len(first) == 2
+
+
+def _fake_pages(monkeypatch, pages):
+    """
+    Serve `pages`, a list of show numbers or an exception for each offset,
+    to `iter_search_pages`; the offsets requested are returned
+    """
+    requested = []
+
+    def _get_parsed(url, *args):
+        page = int(url.rsplit('offset-', 1)[1]) // SEARCH_PAGE_SIZE \
+            if 'offset-' in url else 0
+        requested.append(page)
+        if isinstance(pages[page], Exception):
+            raise pages[page]
+        return [SubtitledShow(name=str(n), href=f"/idmovie-{n}")
+                for n in pages[page]]
+
+    monkeypatch.setattr(ost, '_get_parsed', _get_parsed)
+    return requested
+
+
+def _full(page):
+    return range(page * SEARCH_PAGE_SIZE, (page + 1) * SEARCH_PAGE_SIZE)
+
+
+def _search(max_pages=ost.MAX_SEARCH_PAGES):
+    return [len(shows) for shows in
+            iter_search_pages('terms', '/search/moviename-', max_pages)]
+
+
+def test_search_pages_stop_at_a_short_page(monkeypatch):
+    requested = _fake_pages(monkeypatch, [_full(0), _full(1), range(80, 85),
+                                          _full(3)])
+    assert _search() == [SEARCH_PAGE_SIZE, SEARCH_PAGE_SIZE, 5]
+    assert requested == [0, 1, 2]
+
+
+def test_search_pages_stop_when_the_offset_is_ignored(monkeypatch):
+    requested = _fake_pages(monkeypatch, [_full(0), _full(0), _full(1)])
+    assert _search() == [SEARCH_PAGE_SIZE]
+    assert requested == [0, 1]
+
+
+def test_search_pages_skip_shows_already_yielded(monkeypatch):
+    _fake_pages(monkeypatch, [_full(0), range(30, 50)])
+    assert _search() == [SEARCH_PAGE_SIZE, 10]
+
+
+def test_search_pages_stop_without_results_table(monkeypatch):
+    requested = _fake_pages(monkeypatch, [_full(0), ValueError(), _full(2)])
+    assert _search() == [SEARCH_PAGE_SIZE]
+    assert requested == [0, 1]
+
+
+def test_search_pages_raise_on_the_first_page(monkeypatch):
+    _fake_pages(monkeypatch, [ValueError("Unable to parse search results")])
+    with pytest.raises(ValueError):
+        _search()
+
+
+def test_search_pages_stop_after_max_pages(monkeypatch):
+    requested = _fake_pages(monkeypatch, [_full(n) for n in range(5)])
+    assert _search(max_pages=3) == [SEARCH_PAGE_SIZE] * 3
+    assert requested == [0, 1, 2]
+
+
+def test_search_pages_are_requested_lazily(monkeypatch):
+    requested = _fake_pages(monkeypatch, [_full(n) for n in range(5)])
+    pages = iter_search_pages('terms', '/search/moviename-')
+    next(pages)
+    assert requested == [0]
+    next(pages)
+    pages.close()
+    assert requested == [0, 1]
+
+
+def _shows(count):
+    return [SubtitledShow(name=str(n), href=f"/en/search/idmovie-{n}")
+            for n in range(count)]
+
+
+def _fake_listings(monkeypatch, fail=()):
+    requested = []
+
+    def _get_subtitles(url):
+        requested.append(url)
+        if url.endswith(tuple(fail)):
+            raise ost.SubtitleException("captcha")
+        return [ost.SubtitleSrtFile(name=url, href=url)]
+
+    monkeypatch.setattr(ost, 'get_subtitles_for_show', _get_subtitles)
+    return requested
+
+
+def test_prefetch_lists_only_the_shows_not_listed(site, monkeypatch):
+    requested = _fake_listings(monkeypatch, fail=['-2'])
+    shows = _shows(4)
+    shows[0].srt_files = [ost.SubtitleSrtFile(name='kept', href='/kept')]
+    assert ost.prefetch_show_listings(shows, 'http://ost') == 2
+    assert sorted(requested) == [f"http://ost/en/search/idmovie-{n}"
+                                 for n in (1, 2, 3)]
+    assert shows[0].srt_files[0].name == 'kept'
+    assert shows[1].srt_files[0].href.endswith('/idmovie-1')
+    assert not shows[2].srt_files
+
+
+def test_prefetch_stops_when_cancelled(site, monkeypatch):
+    requested = _fake_listings(monkeypatch)
+    cancelled = threading.Event()
+    cancelled.set()
+    assert ost.prefetch_show_listings(_shows(3), 'http://ost',
+                                      cancelled=cancelled) == 0
+    assert requested == []
+
+
+def test_prefetch_backs_off_while_throttled(site, monkeypatch):
+    requested = _fake_listings(monkeypatch)
+    limiter = ost.get_transport().limiter
+    limiter.throttled('ost', retry_after=0)
+    assert ost.prefetch_show_listings(_shows(3), 'http://ost') == 0
+    assert requested == []
+    # Another host is not slowed down
+    assert ost.prefetch_show_listings(_shows(3), 'http://other') == 3
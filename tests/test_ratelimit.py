@@ -0,0 +1,70 @@
+# test_ratelimit.py
+
+import time
+
+from backend.ratelimit import RateLimiter, SUCCESS_STREAK, parse_retry_after
+from backend.transport import HttpTransport
+
+
+def test_retry_after_is_capped():
+    limiter = RateLimiter(rate=10, max_retry_after=5)
+    assert limiter.throttled('host', retry_after=86400) == 5
+    assert limiter.throttled('other', retry_after=2) == 2
+
+
+def test_parse_retry_after():
+    assert parse_retry_after('7') == 7
+    assert parse_retry_after(None) is None
+    assert parse_retry_after('soon') is None
+    assert parse_retry_after('Wed, 21 Oct 2015 07:28:00 GMT') == 0
+
+
+def test_throttled_host_slows_down_and_recovers():
+    limiter = RateLimiter(rate=8, burst=100, min_rate=1)
+    limiter.throttled('host', retry_after=0)
+    limiter.throttled('host', retry_after=0)
+    assert limiter.current_rate('host') == 2
+    assert limiter.current_rate('other') == 8
+    for _ in range(SUCCESS_STREAK * 20):
+        limiter.succeeded('host')
+    assert limiter.current_rate('host') == 8
+
+
+def test_throttled_host_is_paused():
+    limiter = RateLimiter(rate=1000, burst=1000)
+    limiter.throttled('host', retry_after=0.3)
+    assert limiter.acquire('other') == 0
+    start = time.monotonic()
+    limiter.acquire('host')
+    assert time.monotonic() - start >= 0.25
+
+
+def test_429_and_503_are_retried_after_the_pause(site):
+    site.pages['/page'] = (b'ok', None)
+    site.errors['/page'] = [(429, {'Retry-After': '0'}),
+                            (503, {'Retry-After': '0'})]
+    transport = HttpTransport(rate=1000, burst=1000, retries=2)
+    resp = transport.get(site.url + '/page')
+    assert resp.status_code == 200
+    assert resp.content == b'ok'
+    assert site.paths() == ['/page'] * 3
+    # Halved twice by the throttled answers
+    assert transport.limiter.current_rate(site.url[7:]) == 250
+
+
+def test_long_retry_after_does_not_hang(site):
+    site.pages['/page'] = (b'ok', None)
+    site.errors['/page'] = [(429, {'Retry-After': '3600'})]
+    transport = HttpTransport(rate=1000, burst=1000, retries=1,
+                              max_retry_after=0.2)
+    start = time.monotonic()
+    assert transport.get(site.url + '/page').status_code == 200
+    assert time.monotonic() - start < 5
+
+
+def test_last_throttled_answer_is_returned(site):
+    site.pages['/page'] = (b'ok', None)
+    site.errors['/page'] = [(503, {'Retry-After': '0'})] * 2
+    transport = HttpTransport(rate=1000, burst=1000, retries=1)
+    assert transport.get(site.url + '/page').status_code == 503
+    assert len(site.requests) == 2
@@ -0,0 +1,97 @@
+# test_singleflight.py
+
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from backend.singleflight import SingleFlight, private
+
+
+class Cancelled(Exception):
+    pass
+
+
+def _run_together(flight, funcs, release):
+    """
+    Call `flight.do` with each of `funcs`, the first one leading until
+    `release` is set once the others wait
+    """
+    with ThreadPoolExecutor(max_workers=len(funcs)) as executor:
+        futures = [executor.submit(flight.do, 'key', funcs[0])]
+        time.sleep(0.05)
+        futures += [executor.submit(flight.do, 'key', func)
+                    for func in funcs[1:]]
+        time.sleep(0.1)
+        release.set()
+    return futures
+
+
+def test_concurrent_calls_share_one_run():
+    flight = SingleFlight('test')
+    release = threading.Event()
+    calls = []
+
+    def _func():
+        calls.append(1)
+        release.wait(5)
+        return 'value'
+
+    futures = _run_together(flight, [_func] * 4, release)
+    results = [future.result() for future in futures]
+    assert calls == [1]
+    assert results[0] == ('value', False)
+    assert results[1:] == [('value', True)] * 3
+    assert flight.in_flight() == 0
+
+
+def test_errors_are_shared():
+    flight = SingleFlight('test')
+    release = threading.Event()
+    calls = []
+
+    def _func():
+        calls.append(1)
+        release.wait(5)
+        raise ValueError("site down")
+
+    futures = _run_together(flight, [_func] * 3, release)
+    for future in futures:
+        with pytest.raises(ValueError):
+            future.result()
+    assert calls == [1]
+
+
+def test_leader_cancel_does_not_fail_the_others():
+    flight = SingleFlight('test')
+    release = threading.Event()
+    calls = []
+
+    def _cancelled_progress():
+        raise Cancelled()
+
+    def _leader():
+        calls.append('leader')
+        release.wait(5)
+        private(_cancelled_progress)()
+
+    def _follower():
+        calls.append('follower')
+        time.sleep(0.2)  # Long enough for the other one to wait again
+        return 'value'
+
+    futures = _run_together(flight, [_leader, _follower, _follower],
+                            release)
+    with pytest.raises(Cancelled):
+        futures[0].result()
+    values = sorted(future.result() for future in futures[1:])
+    # One of the followers ran the function again, the other one shared it
+    assert values == [('value', False), ('value', True)]
+    assert calls == ['leader', 'follower']
+
+
+def test_calls_after_the_end_run_again():
+    flight = SingleFlight('test')
+    assert flight.do('key', lambda: 1) == (1, False)
+    assert flight.do('key', lambda: 2) == (2, False)
@@ -0,0 +1,139 @@
+# test_store.py
+
+import io
+import os
+import stat
+import time
+import zipfile
+
+import pytest
+
+from backend.ostdownloader import SubtitleSrtFile
+from backend.season import download_episodes
+from backend.store import KIND_ARCHIVE, KIND_SRT, SubtitleStore, \
+    configure_store
+
+
+def _zip(members):
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, 'w') as zfh:
+        for name, data in members.items():
+            zfh.writestr(name, data)
+    return buffer.getvalue()
+
+
+@pytest.fixture
+def store(tmp_path):
+    return SubtitleStore(str(tmp_path / 'store'))
+
+
+def test_put_stores_each_content_once(store):
+    digest = store.put(b'subtitles', KIND_SRT)
+    assert store.put(b'subtitles', KIND_SRT) == digest
+    path = store.object_path(digest)
+    with open(path, 'rb') as fh:
+        assert fh.read() == b'subtitles'
+    assert not os.stat(path).st_mode & stat.S_IWUSR
+    assert store.total_size() == len(b'subtitles')
+    assert [name for name in os.listdir(os.path.dirname(path))
+            if name.endswith('.part')] == []
+
+
+def test_place_links_or_copies(store, tmp_path):
+    digest = store.put(b'subtitles', KIND_SRT)
+    target = tmp_path / 'Movie.srt'
+    target.write_bytes(b'old')
+    method = store.place(digest, str(target))
+    assert method in ('reflink', 'hardlink', 'copy')
+    assert target.read_bytes() == b'subtitles'
+    assert not os.path.exists(str(target) + '.part')
+
+
+def test_gc_evicts_least_recently_used(tmp_path):
+    store = SubtitleStore(str(tmp_path / 'store'), max_bytes=250)
+    old = store.put(b'a' * 100, KIND_SRT)
+    time.sleep(0.01)
+    recent = store.put(b'b' * 100, KIND_SRT)
+    time.sleep(0.01)
+    new = store.put(b'c' * 100, KIND_SRT)
+    assert store.gc() == 100
+    assert not os.path.exists(store.object_path(old))
+    assert os.path.exists(store.object_path(recent))
+    assert os.path.exists(store.object_path(new))
+
+
+def test_gc_never_evicts_the_objects_kept(tmp_path):
+    store = SubtitleStore(str(tmp_path / 'store'), max_bytes=50)
+    kept = store.put(b'a' * 100, KIND_ARCHIVE)
+    other = store.put(b'b' * 10, KIND_SRT)
+    store.gc(keep=[kept])
+    assert os.path.exists(store.object_path(kept))
+    assert not os.path.exists(store.object_path(other))
+
+
+def test_fetch_archive_once_and_members(site, store):
+    site.pages['/download/1'] = (_zip({'a.srt': b'one', 'a.nfo': b'x'}),
+                                 None)
+    url = site.url + '/download/1'
+    archive = store.fetch_archive(url)
+    assert store.fetch_archive(url) == archive
+    assert site.paths() == ['/download/1']
+    members = store.members(archive)
+    assert [(item.member, item.size) for item in members] == [('a.srt', 3)]
+    # Evicting a member drops the member list: extracted again
+    os.chmod(store.object_path(members[0].digest), stat.S_IWUSR)
+    store.max_bytes = 0
+    store.gc(keep=[archive])
+    store.max_bytes = 10 ** 6
+    assert [item.member for item in store.members(archive)] == ['a.srt']
+
+
+def test_season_archives_come_from_the_store(site, tmp_path):
+    configure_store(str(tmp_path / 'store'))
+    try:
+        site.pages['/download/1'] = (_zip({'e1.srt': b'one'}), None)
+        srt = SubtitleSrtFile(name='e1', href='/download/1', season=1,
+                              episode=1)
+        for folder in ('first', 'second'):
+            os.makedirs(tmp_path / folder)
+            results = download_episodes([srt], site.url,
+                                        str(tmp_path / folder),
+                                        extract=False, zip_prefix='Show ')
+            assert [result.error for result in results] == [""]
+            assert results[0].files == [
+                str(tmp_path / folder / 'Show S01E01.zip')]
+            assert results[0].size == len(site.pages['/download/1'][0])
+        assert site.paths() == ['/download/1']
+    finally:
+        configure_store(None)
+
+
+def test_writable_placement_never_hardlinks(store, tmp_path):
+    digest = store.put(b'subtitles', KIND_SRT)
+    target = tmp_path / 'Movie.srt'
+    assert store.place(digest, str(target), writable=True) != 'hardlink'
+    assert os.stat(target).st_mode & stat.S_IWUSR
+    target.write_bytes(b'edited')
+    with open(store.object_path(digest), 'rb') as fh:
+        assert fh.read() == b'subtitles'
+
+
+def test_placing_again_leaves_no_temporary_file(store, tmp_path):
+    digest = store.put(b'subtitles', KIND_SRT)
+    target = str(tmp_path / 'Movie.srt')
+    for _ in range(2):
+        store.place(digest, target)
+    assert sorted(os.listdir(tmp_path)) == ['Movie.srt', 'store']
+
+
+def test_concurrent_placements_on_the_same_target(store, tmp_path):
+    from concurrent.futures import ThreadPoolExecutor
+    digests = [store.put(bytes([n]) * 1000, KIND_SRT) for n in range(8)]
+    target = str(tmp_path / 'Movie.srt')
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        list(executor.map(lambda digest: store.place(digest, target),
+                          digests * 10))
+    with open(target, 'rb') as fh:
+        data = fh.read()
+    assert len(data) == 1000 and len(set(data)) == 1
+    assert sorted(os.listdir(tmp_path)) == ['Movie.srt', 'store']
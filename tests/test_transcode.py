@@ -0,0 +1,72 @@
+# test_transcode.py
+
+import codecs
+import os
+import zipfile
+
+from backend.transcode import extract_archive, extract_archives
+
+TEXT = "1\r\n00:00:01,000 --> 00:00:02,000\r\nPerché è così\r\n"
+
+
+def _archive(path, members):
+    with zipfile.ZipFile(path, 'w') as zfh:
+        for name, data in members.items():
+            zfh.writestr(name, data)
+    return str(path)
+
+
+def _read(path):
+    with open(path, 'rb') as fh:
+        return fh.read()
+
+
+def test_missing_outfolder_is_created(tmp_path):
+    archive = _archive(tmp_path / 'a.zip', {'sub.srt': TEXT.encode()})
+    outfolder = tmp_path / 'new' / 'folder'
+    report = extract_archive(archive, str(outfolder))
+    assert report.ok, report.error
+    assert os.path.isfile(outfolder / 'sub.srt')
+
+
+def test_missing_outfolder_with_the_process_pool(tmp_path):
+    archives = [_archive(tmp_path / f'{n}.zip', {f'{n}.srt': TEXT.encode()})
+                for n in range(3)]
+    outfolder = tmp_path / 'out'
+    reports = list(extract_archives(archives, str(outfolder), workers=2))
+    assert [report.archive for report in reports] == archives
+    assert all(report.ok for report in reports)
+    assert sorted(os.listdir(outfolder)) == ['0.srt', '1.srt', '2.srt']
+
+
+def test_members_transcoded_to_utf8(tmp_path):
+    archive = _archive(tmp_path / 'a.zip', {
+        'dir/cp1252.srt': TEXT.encode('cp1252'),
+        'bom.srt': codecs.BOM_UTF8 + TEXT.encode(),
+        'readme.nfo': b'not extracted'})
+    report = extract_archive(archive, str(tmp_path / 'out'))
+    assert report.ok, report.error
+    by_member = {item.member: item for item in report.files}
+    assert set(by_member) == {'dir/cp1252.srt', 'bom.srt'}
+    assert by_member['dir/cp1252.srt'].encoding == 'cp1252'
+    assert by_member['bom.srt'].had_bom
+    expected = TEXT.replace('\r\n', '\n').encode()
+    assert _read(tmp_path / 'out' / 'cp1252.srt') == expected
+    assert _read(tmp_path / 'out' / 'bom.srt') == expected
+    assert not os.path.exists(tmp_path / 'out' / 'readme.nfo')
+
+
+def test_line_endings_and_bom_kept_on_request(tmp_path):
+    archive = _archive(tmp_path / 'a.zip',
+                       {'bom.srt': codecs.BOM_UTF8 + TEXT.encode()})
+    report = extract_archive(archive, str(tmp_path), newline=None,
+                             strip_bom=False)
+    assert report.ok, report.error
+    assert _read(tmp_path / 'bom.srt') == codecs.BOM_UTF8 + TEXT.encode()
+
+
+def test_bad_archive_reported(tmp_path):
+    path = tmp_path / 'bad.zip'
+    path.write_bytes(b'not a zip')
+    report = extract_archive(str(path))
+    assert not report.ok and report.files == []
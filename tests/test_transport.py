@@ -0,0 +1,79 @@
+# test_transport.py
+
+import threading
+
+import pytest
+import requests
+
+from backend.transport import HttpTransport, configure_transport, \
+    get_transport
+
+
+def _transport(**kwargs) -> HttpTransport:
+    return HttpTransport(rate=1000, burst=1000, **kwargs)
+
+
+def test_connection_is_kept_alive(site):
+    site.pages['/page'] = (b'ok', None)
+    transport = _transport()
+    for _ in range(5):
+        assert transport.get(site.url + '/page').content == b'ok'
+    assert len(site.clients) == 5
+    assert len(set(site.clients)) == 1
+
+
+def test_pool_reuses_connections_between_threads(site):
+    site.pages['/page'] = (b'ok', None)
+    transport = _transport(pool_size=2)
+    barrier = threading.Barrier(2)
+
+    def _get():
+        for _ in range(5):
+            barrier.wait()
+            transport.get(site.url + '/page').content
+
+    threads = [threading.Thread(target=_get) for _ in range(2)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len(site.clients) == 10
+    assert len(set(site.clients)) <= 2
+
+
+def test_dropped_connection_is_retried(site):
+    site.pages['/page'] = (b'ok', None)
+    site.errors['/page'] = [(0, {})]
+    assert _transport(retries=1).get(site.url + '/page').content == b'ok'
+    assert site.paths() == ['/page'] * 2
+
+
+def test_dropped_connection_without_retries_raises(site):
+    site.pages['/page'] = (b'ok', None)
+    site.errors['/page'] = [(0, {})]
+    with pytest.raises(requests.ConnectionError):
+        _transport(retries=0).get(site.url + '/page')
+
+
+def test_failed_status_retried_up_to_retries(site):
+    site.pages['/page'] = (b'ok', None)
+    site.errors['/page'] = [(502, {'Retry-After': '0'})] * 4
+    resp = _transport(retries=2).get(site.url + '/page')
+    assert resp.status_code == 502
+    assert len(site.requests) == 3
+    assert len(site.errors['/page']) == 1
+
+
+def test_missing_page_is_not_retried(site):
+    assert _transport(retries=3).get(site.url + '/nope').status_code == 404
+    assert site.paths() == ['/nope']
+
+
+def test_configure_transport_replaces_the_shared_one():
+    first = configure_transport(pool_size=3)
+    assert get_transport() is first
+    second = configure_transport(pool_size=4, read_timeout=1)
+    assert get_transport() is second
+    assert second.pool_size == 4
+    assert second.timeout == (5.0, 1)
+    configure_transport()
@@ -0,0 +1,139 @@
+# test_watcher.py
+
+import os
+
+import pytest
+
+import backend.watcher as watcher
+from backend.watcher import WatchQueue, STATUS_DONE, STATUS_FAILED, \
+    STATUS_PENDING
+
+
+class Clock:
+    """`time` of the watcher module, moved forward by the tests"""
+
+    def __init__(self):
+        self.now = 1000.0
+
+    def time(self) -> float:
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(watcher, 'time', clock)
+    return clock
+
+
+@pytest.fixture
+def queue(tmp_path, clock):
+    queue = WatchQueue(str(tmp_path / 'queue.sqlite'), settle=10,
+                       max_attempts=2, retry_delay=100)
+    yield queue
+    queue.close()
+
+
+def _write(path, data: bytes, mtime: int) -> str:
+    with open(path, 'ab') as fh:
+        fh.write(data)
+    os.utime(path, ns=(mtime * 10 ** 9, mtime * 10 ** 9))
+    return str(path)
+
+
+def test_file_is_ready_once_settled(queue, clock, tmp_path):
+    path = _write(tmp_path / 'Movie.mkv', b'x', 1)
+    assert queue.seen(path)
+    assert not queue.seen(path)  # Unchanged: not queued again
+    clock.now += 9
+    assert queue.settled() == ([], 0.0)
+    clock.now += 1
+    assert queue.settled() == ([path], 1010.0)
+
+
+def test_file_still_written_is_not_ready(queue, clock, tmp_path):
+    path = _write(tmp_path / 'Movie.mkv', b'x', 1)
+    queue.seen(path)
+    for mtime in range(2, 5):
+        clock.now += 8
+        _write(path, b'x', mtime)
+        # Changed since the last check: the settle time starts again
+        assert queue.settled() == ([], 0.0)
+    clock.now += 9
+    assert queue.settled()[0] == []
+    clock.now += 1
+    assert queue.settled()[0] == [path]
+
+
+def test_empty_file_is_not_ready(queue, clock, tmp_path):
+    path = _write(tmp_path / 'Movie.mkv', b'', 1)
+    queue.seen(path)
+    clock.now += 60
+    assert queue.settled()[0] == []
+
+
+def test_file_with_subtitles_is_skipped(queue, clock, tmp_path):
+    path = _write(tmp_path / 'Movie.mkv', b'x', 1)
+    assert queue.seen(path)
+    _write(tmp_path / 'Movie.srt', b'1', 1)
+    clock.now += 60
+    assert queue.settled()[0] == []
+    assert queue.stats() == {STATUS_DONE: 1}
+    assert not queue.seen(path)
+
+
+def test_failed_lookup_is_retried_later(queue, clock, tmp_path):
+    path = _write(tmp_path / 'Movie.mkv', b'x', 1)
+    queue.seen(path)
+    clock.now += 10
+    for _ in range(2):
+        assert queue.settled()[0] == [path]
+        queue.claim([path])
+        assert queue.settled()[0] == []
+        queue.finish(path, "Not found")
+        clock.now += 99
+        assert queue.settled()[0] == []
+        clock.now += 1
+    # Out of attempts
+    assert queue.settled()[0] == []
+    assert queue.stats() == {STATUS_FAILED: 1}
+
+
+def test_interrupted_lookups_are_pending_after_restart(tmp_path, clock):
+    path = _write(tmp_path / 'Movie.mkv', b'x', 1)
+    db = str(tmp_path / 'queue.sqlite')
+    queue = WatchQueue(db, settle=10)
+    queue.seen(path)
+    queue.claim([path])
+    queue.close()
+    queue = WatchQueue(db, settle=10)
+    clock.now += 10
+    assert queue.stats() == {STATUS_PENDING: 1}
+    assert queue.settled()[0] == [path]
+    queue.close()
+
+
+def test_batch_waits_for_the_window_or_a_full_batch(queue, clock, tmp_path):
+    batches = []
+    watch = watcher.Watcher([str(tmp_path)], queue, '/search/', 'http://ost',
+                            batch_size=2, batch_window=30)
+    watch._run_batch = batches.append
+    first = _write(tmp_path / 'a.mkv', b'x', 1)
+    queue.seen(first)
+    clock.now += 10
+    watch._maybe_start_batch()
+    clock.now += 29
+    watch._maybe_start_batch()
+    assert batches == []
+    clock.now += 1
+    watch._maybe_start_batch()
+    watch._batch.result()
+    assert batches == [[first]]
+    paths = [_write(tmp_path / name, b'x', 1) for name in ('b.mkv', 'c.mkv')]
+    for path in paths:
+        queue.seen(path)
+    clock.now += 10
+    watch._maybe_start_batch()  # Full: no need to wait
+    watch._batch.result()
+    assert len(batches) == 2 and sorted(batches[1]) == paths
+    watch._executor.shutdown()